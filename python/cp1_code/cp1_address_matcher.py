@@ -0,0 +1,98 @@
+import logging
+from collections import OrderedDict
+from threading import Lock
+
+from cp1_helper import _PROTOCOL_VERSION, generate_address_hash, generate_version_hash
+from cp1_package import CP1Package
+from ntp_raw import NTPField
+
+
+class CP1AddressMatcher:
+    """
+    Matches received init packages against any number of registered CP1 addresses. The address and version hashes
+    only depend on the hash nonce (the seconds of the transmit timestamp), therefore they are computed once per
+    nonce for all addresses and every package is matched with a single dictionary lookup. Thread safe.
+    """
+
+    def __init__(self, addresses=(), version: str = _PROTOCOL_VERSION, cache_size: int = 4,
+                 log: logging.Logger = logging.getLogger('CP1AddressMatcher-logger')):
+        """
+        :param addresses: the CP1 addresses (in binary format) to match.
+        :param version: the expected protocol version.
+        :param cache_size: the number of nonces whose hash tables are kept. Packages of the last few seconds may
+        still be in flight, so a small number is enough.
+        :param log:
+        """
+        self.log = log
+        self.version = version
+        self.cache_size = cache_size
+        self._addresses = []
+        self._tables = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        for address in addresses:
+            self.add_address(address)
+
+    def add_address(self, address: str):
+        """
+        Registers an additional address. Adding an address twice has no effect.
+        :param address: the CP1 address in binary format.
+        """
+        with self._lock:
+            if address not in self._addresses:
+                self._addresses.append(address)
+                self._tables.clear()
+
+    def remove_address(self, address: str):
+        """
+        :param address: a registered CP1 address in binary format.
+        """
+        with self._lock:
+            self._addresses.remove(address)
+            self._tables.clear()
+
+    def addresses(self) -> list:
+        """
+        :return: a copy of all registered addresses.
+        """
+        return list(self._addresses)
+
+    def _table(self, nonce: int) -> dict:
+        """
+        :param nonce: the 32 bit hash nonce.
+        :return: a dict mapping the last 8 bit of the init field (address hash | version hash) to the tuple of all
+        addresses producing this value. Different addresses may share a value, since the address hash has 6 bit only.
+        """
+        with self._lock:
+            table = self._tables.get(nonce)
+            if table is not None:
+                self.hits += 1
+                self._tables.move_to_end(nonce)
+                return table
+
+            self.misses += 1
+            nonce_bits = format(nonce, '032b')
+            version_hash = generate_version_hash(nonce_bits, self.version)
+            table = {}
+            for address in self._addresses:
+                key = int(generate_address_hash(nonce_bits, address) + version_hash, 2)
+                table[key] = table.get(key, ()) + (address,)
+
+            self._tables[nonce] = table
+            if len(self._tables) > self.cache_size:
+                self._tables.popitem(last=False)
+            return table
+
+    def match(self, pck: CP1Package, field: NTPField = NTPField.TRANSMIT_TIMESTAMP) -> tuple:
+        """
+        :param pck: a received package.
+        :param field: the field holding the hashes in its last 8 bit (the init package field).
+        :return: all registered addresses the package is meant for, an empty tuple if there is none.
+        """
+        nonce = pck.get_field_int(NTPField.TRANSMIT_TIMESTAMP) >> 32
+        received = pck.get_field_int(field) & 0xFF
+        result = self._table(nonce).get(received, ())
+        if not result:
+            self.log.debug('The received address or version hash did not match: ' + format(received, '08b'))
+        return result
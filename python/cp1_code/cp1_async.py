@@ -0,0 +1,175 @@
+import asyncio
+import logging
+
+from cp1_client import CP1Client
+from cp1_function_code import CP1FunctionCode
+from cp1_package import CP1Package
+from cp1_server import CP1Server
+from ntp_fec import ReedSolomonCode
+from ntp_mode import NTPMode
+from ntp_packet_factory import NTPPacketFactory
+from ntp_udp_transport import NTP_PORT, NTPDatagramProtocol, create_ntp_endpoint, ntp_server_response
+
+
+class CP1AsyncServer:
+    """
+    Runs a CP1Server on an ordinary UDP socket in an asyncio event loop instead of sniffing with scapy. The sessions
+    of the peers are kept in the session table of the server, keyed by (ip, port) of each peer.
+    """
+
+    def __init__(self, server: CP1Server, local_addr=('0.0.0.0', NTP_PORT), respond: bool = True,
+                 packet_factory: NTPPacketFactory = None,
+                 log: logging.Logger = logging.getLogger('CP1AsyncServer-logger')):
+        """
+        :param server: handles the received packages.
+        :param local_addr: (ip, port) to listen on.
+        :param respond: whether every request is answered like by a regular NTP server.
+        :param packet_factory: creates the answers, the default factory if not set.
+        :param log:
+        """
+        self.log = log
+        self.server = server
+        self.local_addr = local_addr
+        self.respond = respond
+        self.packet_factory = packet_factory
+        self.protocol: NTPDatagramProtocol = None
+
+    async def start(self):
+        self.protocol = await create_ntp_endpoint(self._handle, local_addr=self.local_addr, log=self.log)
+        self.local_addr = self.protocol.transport.get_extra_info('sockname')
+        self.log.info('Listening for CP1 packages on ' + str(self.local_addr))
+
+    def _handle(self, data: bytes, peer) -> bytes:
+        ack = self.server.handle_incoming_ntp_pck(data, peer)
+        if ack is not None:
+            return ack.to_bytes()
+        return ntp_server_response(data, self.packet_factory) if self.respond else None
+
+    def close(self):
+        if self.protocol is not None:
+            self.protocol.close()
+            self.protocol = None
+
+
+class CP1AsyncClient:
+    """
+    Sends CP1 messages of a CP1Client over an ordinary UDP socket in an asyncio event loop. Answers of the server are
+    counted, but not evaluated.
+    """
+
+    def __init__(self, client: CP1Client, remote_addr,
+                 log: logging.Logger = logging.getLogger('CP1AsyncClient-logger')):
+        """
+        :param client: creates the packages.
+        :param remote_addr: (ip, port) of the CP1 server.
+        :param log:
+        """
+        self.log = log
+        self.client = client
+        self.remote_addr = remote_addr
+        self.answers_received = 0
+
+    def _handle_answer(self, data: bytes, peer):
+        self.answers_received += 1
+        return None
+
+    async def send_message(self, cp1_address: str, payload_bits: str, interval_sec: float = 0,
+                           ntp_mode: NTPMode = NTPMode.CLIENT):
+        """
+        Sends an init package and all payload packages of one message.
+        :param cp1_address: the cp1 address of the receiver.
+        :param payload_bits: the payload (see CP1Client.add_secret_payload).
+        :param interval_sec: the time to wait between two packages, other peers are served meanwhile.
+        :param ntp_mode: the mode of the payload packages.
+        """
+        protocol = await create_ntp_endpoint(self._handle_answer, remote_addr=self.remote_addr, log=self.log)
+        try:
+            protocol.send(bytes(self.client.create_init_pck(cp1_address)))
+            self.client.add_secret_payload(payload_bits, self.client.static_key)
+            while self.client.has_next_pck():
+                await asyncio.sleep(interval_sec)
+                protocol.send(self.client.create_next_pck(ntp_mode).to_bytes())
+            self.log.debug('Message completely sent to ' + str(self.remote_addr))
+        finally:
+            protocol.close()
+
+    async def send_message_fec(self, cp1_address: str, payload_bits: str, fec: ReedSolomonCode,
+                               interval_sec: float = 0, ntp_mode: NTPMode = NTPMode.CLIENT):
+        """
+        Sends an init package and all data and parity chunks of one message (see CP1Session.enable_fec). The
+        receiver restores the message from any fec.k chunks.
+        :param cp1_address: the cp1 address of the receiver.
+        :param payload_bits: the payload (see CP1Client.add_secret_payload).
+        :param fec: the erasure code, the same as used by the receiver.
+        :param interval_sec: the time to wait between two packages.
+        :param ntp_mode: the mode of the payload packages.
+        """
+        protocol = await create_ntp_endpoint(self._handle_answer, remote_addr=self.remote_addr, log=self.log)
+        try:
+            protocol.send(bytes(self.client.create_init_pck(cp1_address)))
+            session = self.client.send_session
+            self.client.add_secret_payload(payload_bits, self.client.static_key)
+            session.enable_fec(fec, self.client.payload_size)
+            chunk = session.next_chunk()
+            while chunk is not None:
+                await asyncio.sleep(interval_sec)
+                protocol.send(self.client.create_chunk_pck(chunk[0], chunk[1], ntp_mode).to_bytes())
+                chunk = session.next_chunk()
+        finally:
+            protocol.close()
+
+    async def send_message_acknowledged(self, cp1_address: str, payload_bits: str, window_size: int = 4,
+                                        timeout_sec: float = 0.2, max_retries: int = 10,
+                                        ntp_mode: NTPMode = NTPMode.CLIENT) -> bool:
+        """
+        Sends one message to a server with enabled acknowledgements: the init package is repeated until it is
+        acknowledged, afterwards the chunks are sent with a sliding window and only the missing chunks are
+        retransmitted.
+        :param cp1_address: the cp1 address of the receiver.
+        :param payload_bits: the payload (see CP1Client.add_secret_payload).
+        :param window_size: the maximum number of unacknowledged chunks in flight.
+        :param timeout_sec: the time to wait for an acknowledgement before retransmitting.
+        :param max_retries: the number of consecutive timeouts after which the transmission is aborted.
+        :param ntp_mode: the mode of the payload packages.
+        :return: True in case the receiver acknowledged the complete message, False otherwise.
+        """
+        acks = asyncio.Queue()
+        protocol = await create_ntp_endpoint(lambda data, peer: acks.put_nowait(data), remote_addr=self.remote_addr,
+                                             log=self.log)
+        try:
+            init_pck = bytes(self.client.create_init_pck(cp1_address))
+            session = self.client.send_session
+            self.client.add_secret_payload(payload_bits, self.client.static_key)
+            session.enable_acknowledgement(self.client.payload_size, window_size)
+            init_acknowledged = False
+            retries = 0
+            while not session.is_acknowledged():
+                if not init_acknowledged:
+                    protocol.send(init_pck)
+                else:
+                    chunk = session.next_chunk()
+                    while chunk is not None:
+                        protocol.send(self.client.create_chunk_pck(chunk[0], chunk[1], ntp_mode).to_bytes())
+                        chunk = session.next_chunk()
+                try:
+                    data = await asyncio.wait_for(acks.get(), timeout_sec)
+                except asyncio.TimeoutError:
+                    retries += 1
+                    if retries > max_retries:
+                        self.log.error('No acknowledgement from ' + str(self.remote_addr) + ', transmission aborted.')
+                        return False
+                    session.retransmit_unacknowledged()
+                    continue
+                self.answers_received += 1
+                try:
+                    function_code, bitmap = CP1Package(data).extract_ack()
+                except ValueError:
+                    continue
+                if function_code in (CP1FunctionCode.ACK, CP1FunctionCode.MSG_ACK):
+                    init_acknowledged = True
+                    retries = 0
+                    session.handle_ack(bitmap)
+            self.log.debug('Message completely acknowledged by ' + str(self.remote_addr))
+            return True
+        finally:
+            protocol.close()
@@ -2,13 +2,11 @@ import logging
 
 from scapy.layers.inet import IP, UDP
 from scapy.packet import Packet
-from scapy.sendrecv import send
 
 from cp1_client import CP1Client
 from cp1_package import CP1Package
 from cp1_session import CP1Session
 from ntp_mode import NTPMode
-from ntp_utils import init_ntp_client_pck
 
 
 class CP1BroadcastClient(CP1Client):
@@ -28,14 +26,14 @@ class CP1BroadcastClient(CP1Client):
         :param cp1_address:
         :return:
         """
-        self.send_session = CP1Session()
+        self.send_session = CP1Session(self.packet_factory)
         ntp_pck = self.send_session.generate_init_pck(cp1_address)
         ntp_pck.orig = None
         ntp_pck.recv = None
         ntp_pck.mode = 5
         # ntp_pck.show()
         pck_to_send = IP(dst=ip_address) / UDP() / ntp_pck
-        send(pck_to_send)
+        self._send(pck_to_send, ip_address)
         self.log.debug("Init package successfully send to " + str(ip_address))
         return pck_to_send
 
@@ -49,14 +47,15 @@ class CP1BroadcastClient(CP1Client):
         next_bits_to_send = self.send_session.secret_to_send.next_bits(self.payload_size)
         self.log.debug("Next payload bits to send: " + str(next_bits_to_send))
 
-        ntp_pck = CP1Package(ntp_pck=init_ntp_client_pck())
+        ntp_pck = CP1Package(ntp_pck=self.packet_factory.client_pck_bytes())
         ntp_pck.add_payload(next_bits_to_send)
+        self.send_session.disguise_payload_pck(ntp_pck)
         ntp_pck_ntp = ntp_pck.ntp()
         ntp_pck_ntp.orig = None
         ntp_pck_ntp.recv = None
         ntp_pck_ntp.mode = 5
         pck_to_send = IP(dst=ip_address) / UDP() / ntp_pck_ntp
-        send(pck_to_send)
+        self._send(pck_to_send, ip_address)
 
         self.log.debug("Payload package successfully send to " + str(ip_address))
 
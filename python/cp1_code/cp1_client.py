@@ -2,17 +2,19 @@ import logging
 from threading import Lock
 
 from scapy.layers.inet import IP, UDP
+from scapy.layers.ntp import NTP
 from scapy.packet import Packet
 from scapy.sendrecv import send
 
+from cp1_address_matcher import CP1AddressMatcher
 from cp1_function_code import CP1FunctionCode
-from cp1_helper import _PROTOCOL_VERSION, generate_address_hash, generate_version_hash
-from cp1_package import CP1Package
+from cp1_package import CP1CarrierLayout, CP1Package
 from cp1_payload import CP1Payload
 from cp1_session import CP1Session
 from ntp_mode import NTPMode
+from ntp_packet_factory import NTPPacketFactory, default_packet_factory
 from ntp_raw import NTPField
-from ntp_utils import init_ntp_client_pck
+from ntp_sender import NTPSender
 
 
 class CP1Client:
@@ -21,7 +23,16 @@ class CP1Client:
     """
 
     def __init__(self, address: str, static_key: str, sniff_interface: str = 'lo',
-                 log=logging.getLogger('CP1Client-Logger')):
+                 log=logging.getLogger('CP1Client-Logger'), packet_factory: NTPPacketFactory = None,
+                 sender: NTPSender = None):
+        """
+        :param packet_factory: creates the init and payload packages. Pass a factory with a started pool to keep
+        package construction off the send path.
+        :param sender: sends the packages over a kept socket. If not set, every package is sent with scapy send().
+        """
+        self.log = log
+        self.sender = sender
+        self.packet_factory = packet_factory if packet_factory is not None else default_packet_factory()
         self.address = address
         self.static_key = static_key
         self.init_pck_field = NTPField.TRANSMIT_TIMESTAMP
@@ -31,7 +42,19 @@ class CP1Client:
         self._release_listen = False
         self.send_session: CP1Session = None
         self.payload_size = 16  # The number of bits send per payload package (must be a divisor of 128).
-        self.log = log
+        # If set, payload packages carry layout.capacity bits spread over several timestamps instead of payload_size
+        # bits in the transmit timestamp. The receiver has to use the same layout.
+        self.carrier_layout: CP1CarrierLayout = None
+
+    @property
+    def address(self) -> str:
+        return self._address
+
+    @address.setter
+    def address(self, address: str):
+        # The matcher caches the hashes of the registered addresses per nonce.
+        self._address = address
+        self.address_matcher = CP1AddressMatcher([address], log=self.log)
 
     def address_and_version_check(self, pck: CP1Package) -> bool:
         """
@@ -39,24 +62,14 @@ class CP1Client:
         :param pck: The package to check
         :return: True in case it is meant for this client, False otherwise.
         """
-        init_field = pck.get_field(self.init_pck_field)
-        init_field = init_field[self.init_pck_field.length() - 8: self.init_pck_field.length()]
-        received_address_bits_hashed = init_field[0:6]
-        own_address_bits_hashed = generate_address_hash(pck.hash_nonce(), self.address)
+        return len(self.address_matcher.match(pck, self.init_pck_field)) > 0
 
-        if received_address_bits_hashed != own_address_bits_hashed:
-            self.log.debug('The received address hash did not match: ' + received_address_bits_hashed)
-            return False
-
-        received_version_bits_hashed = init_field[6:8]
-        own_version_bits_hashed = generate_version_hash(pck.hash_nonce(), _PROTOCOL_VERSION)
-
-        if received_version_bits_hashed != own_version_bits_hashed:
-            self.log.debug(
-                'The received version hash did not match the expected value: ' + str(received_version_bits_hashed))
-            return False
-
-        return True
+    def create_init_pck(self, cp1_address) -> NTP:
+        """
+        Starts a new sending session and creates its init package for the desired cp1-address.
+        """
+        self.send_session = CP1Session(self.packet_factory)
+        return self.send_session.generate_init_pck(cp1_address)
 
     def send_init_pck(self, ip_address, cp1_address):
         """
@@ -65,20 +78,34 @@ class CP1Client:
         :param cp1_address:
         :return:
         """
-        self.send_session = CP1Session()
-        ntp_pck = self.send_session.generate_init_pck(cp1_address)
+        ntp_pck = self.create_init_pck(cp1_address)
         # ntp_pck.show()
         pck_to_send = IP(dst=ip_address) / UDP() / ntp_pck
-        send(pck_to_send)
+        self._send(pck_to_send, ip_address)
         self.log.debug("Init package successfully send to " + str(ip_address))
         return pck_to_send
 
+    def _send(self, pck_to_send: Packet, ip_address):
+        if self.sender is None:
+            send(pck_to_send)
+        else:
+            self.sender.send(bytes(pck_to_send[NTP]), ip_address)
+
     def add_secret_payload(self, payload, static_key):
         assert self.send_session is not None
         payload_with_function_code = CP1Payload(CP1FunctionCode.MSG_ONE, payload)
         self.log.debug("Complete payload created: " + str(payload_with_function_code.complete_payload))
         self.send_session.add_secret_to_send(payload_with_function_code.complete_payload, static_key)
 
+    def add_secret_stream(self, message, static_key, length: int = None):
+        """
+        Adds a message of arbitrary length, which is encrypted block by block while it is sent (see
+        CP1Session.add_stream_to_send). The message is not prefixed with a function code and checksum.
+        The receiving server needs stream=True.
+        """
+        assert self.send_session is not None
+        self.send_session.add_stream_to_send(message, static_key, length)
+
     def has_next_pck(self):
         if self.send_session is None:
             return False
@@ -88,22 +115,62 @@ class CP1Client:
 
         return self.send_session.secret_to_send.has_next_bits()
 
-    def send_next_pck(self, ip_address, ntp_mode: NTPMode = NTPMode.CLIENT) -> Packet:
+    def create_next_pck(self, ntp_mode: NTPMode = NTPMode.CLIENT) -> CP1Package:
         """
-        Sends the next chunk of payload bits to the destination.
-        :param ip_address:
-        :param ntp_mode: the mode of the ntp package to send.
-        :return: the bits just send.
+        Creates the package carrying the next chunk of payload bits.
+        :param ntp_mode: the mode of the ntp package.
         """
+        if self.carrier_layout is not None:
+            return self._create_next_layout_pck(ntp_mode)
         next_bits_to_send = self.send_session.secret_to_send.next_bits(self.payload_size)
         self.log.debug("Next payload bits to send: " + str(next_bits_to_send))
 
-        ntp_pck = CP1Package(ntp_pck=init_ntp_client_pck())
+        ntp_pck = CP1Package(ntp_pck=self.packet_factory.client_pck_bytes())
         ntp_pck.add_payload(next_bits_to_send)
         ntp_pck.set_mode(NTPMode.to_bit_string(ntp_mode))
+        self.send_session.disguise_payload_pck(ntp_pck)
+        return ntp_pck
 
+    def _create_next_layout_pck(self, ntp_mode: NTPMode) -> CP1Package:
+        layout = self.carrier_layout
+        # The last package is padded, the receiver drops everything beyond the 128 payload bits.
+        next_bits_to_send = self.send_session.secret_to_send.next_bits(layout.capacity).ljust(layout.capacity, '0')
+        self.log.debug("Next payload bits to send: " + str(next_bits_to_send))
+
+        # All timestamps are stamped with the current time, the ones not used by the layout are cleared again.
+        ntp_pck = CP1Package(ntp_pck=self.packet_factory.init_pck_bytes())
+        for field in (NTPField.REFERENCE_TIMESTAMP, NTPField.ORIGIN_TIMESTAMP, NTPField.RECEIVE_TIMESTAMP):
+            if field not in layout.fields():
+                ntp_pck.set_field_int(0, field)
+        ntp_pck.add_payload(next_bits_to_send, layout=layout)
+        ntp_pck.set_mode(NTPMode.to_bit_string(ntp_mode))
+        self.send_session.disguise_payload_pck(ntp_pck)
+        return ntp_pck
+
+    def create_chunk_pck(self, index: int, bits: str, ntp_mode: NTPMode = NTPMode.CLIENT) -> CP1Package:
+        """
+        Creates the package carrying a chunk of an acknowledged session (see CP1Session.next_chunk).
+        :param index: the index of the chunk.
+        :param bits: the payload bits of the chunk.
+        :param ntp_mode: the mode of the ntp package.
+        """
+        ntp_pck = CP1Package(ntp_pck=self.packet_factory.client_pck_bytes())
+        ntp_pck.add_payload(bits)
+        ntp_pck.add_chunk_index(index)
+        ntp_pck.set_mode(NTPMode.to_bit_string(ntp_mode))
+        self.send_session.disguise_payload_pck(ntp_pck)
+        return ntp_pck
+
+    def send_next_pck(self, ip_address, ntp_mode: NTPMode = NTPMode.CLIENT) -> Packet:
+        """
+        Sends the next chunk of payload bits to the destination.
+        :param ip_address:
+        :param ntp_mode: the mode of the ntp package to send.
+        :return: the bits just send.
+        """
+        ntp_pck = self.create_next_pck(ntp_mode)
         pck_to_send = IP(dst=ip_address) / UDP() / ntp_pck.ntp()
-        send(pck_to_send)
+        self._send(pck_to_send, ip_address)
 
         self.log.debug("Payload package successfully send to " + str(ip_address))
 
@@ -111,3 +178,48 @@ class CP1Client:
             self.log.debug("Sending complete. Terminating sending session.")
 
         return pck_to_send
+
+    def prebuild_message(self, cp1_address, payload, ntp_mode: NTPMode = NTPMode.CLIENT) -> list:
+        """
+        Starts a new sending session and creates all of its packages up front, so they can be sent back to back.
+        The timestamps of every package are taken when it is built, so prebuilt packages are meant for bursts only:
+        sent with pacing, the n-th package would leave n intervals after its transmit timestamp. Use
+        message_builders for paced sending.
+        :param cp1_address: the cp1 address of the receiver.
+        :param payload: the payload (see add_secret_payload).
+        :param ntp_mode: the mode of the payload packages.
+        :return: the init package and all payload packages in their wire format.
+        """
+        return [build() for build in self.message_builders(cp1_address, payload, ntp_mode)]
+
+    def message_builders(self, cp1_address, payload, ntp_mode: NTPMode = NTPMode.CLIENT):
+        """
+        Like prebuild_message, but yields a callable for every package, which creates the package in its wire
+        format when it is called (see NTPSender.send_all). Each callable has to be called before the next one is
+        taken.
+        :return: a generator of the callables.
+        """
+        yield lambda: bytes(self.create_init_pck(cp1_address))
+        self.add_secret_payload(payload, self.static_key)
+        while self.has_next_pck():
+            yield lambda: self.create_next_pck(ntp_mode).to_bytes()
+
+    def send_message(self, ip_address, cp1_address, payload, interval_sec: float = 0,
+                     ntp_mode: NTPMode = NTPMode.CLIENT):
+        """
+        Sends a complete message with the sender of this client (an NTPSender over a plain UDP socket if not set).
+        :param ip_address: the destination.
+        :param cp1_address: the cp1 address of the receiver.
+        :param payload: the payload (see add_secret_payload).
+        :param interval_sec: the time between the start of two packages. With pacing, every package is created at
+        its send time, otherwise all packages are created up front.
+        :param ntp_mode: the mode of the payload packages.
+        """
+        if self.sender is None:
+            self.sender = NTPSender(log=self.log)
+        if interval_sec > 0:
+            packages = self.message_builders(cp1_address, payload, ntp_mode)
+        else:
+            packages = self.prebuild_message(cp1_address, payload, ntp_mode)
+        self.sender.send_all(packages, ip_address, interval_sec)
+        self.log.debug("Message successfully send to " + str(ip_address))
@@ -1,39 +1,130 @@
 import logging
 
-from cp1_package import CP1Package
-from ntp_crypto import NTPCrypto
+from bit_codec import bits_to_bytes, bytes_to_bits
+from cp1_function_code import CP1FunctionCode
+from cp1_package import CP1CarrierLayout, CP1Package
+from ntp_crypto import MAX_STREAM_LENGTH, NTPCrypto, NTPStreamReceiver
+from ntp_fec import ReedSolomonCode
+from ntp_mode import NTPMode
+from ntp_packet_factory import NTPPacketFactory, default_packet_factory
+from ntp_raw import NTPField
 
 
 class CP1ClientSession:
 
-    def __init__(self, static_key_bits, init_pck: CP1Package,
+    def __init__(self, static_key_bits, init_pck: CP1Package, fec: ReedSolomonCode = None, stream: bool = False,
+                 max_stream_length: int = MAX_STREAM_LENGTH, addresses: tuple = (),
                  log: logging.Logger = logging.getLogger('CP1ClientSession-logger')):
         """
         A data container which stores session data of one CP1 Session from client perspective.
         :param static_key_bits: The static key to decrypt a received message.
         :param init_pck: The first package send to the client which holds the nonce for the aes key.
+        :param fec: the erasure code of the indexed chunks, if the sender uses forward error correction.
+        :param stream: whether the sender sends a stream secret (see CP1Session.add_stream_to_send), which is
+        decrypted while it arrives until the length given by its header is reached, instead of 128 bits.
+        :param max_stream_length: streams announcing more bytes are rejected (see NTPStreamReceiver).
+        :param addresses: the addresses the init package was meant for.
         :param log:
         """
         self.log = log
+        self.fec = fec
+        self.stream = stream
+        self.addresses = tuple(addresses)
         self.crypto_tools = NTPCrypto()
         self._decryption_key_bytes = self.crypto_tools.generate_aes_key_bytes(static_key_bits,
                                                                               init_pck.aes_nonce_bits())
+        self.stream_nonce = init_pck.get_field_int(NTPField.TRANSMIT_TIMESTAMP).to_bytes(8, 'big')
         self.secret_received_in_bits = ''
+        self._stream_receiver = NTPStreamReceiver(self._decryption_key_bytes, self.stream_nonce, max_stream_length) \
+            if stream else None
+        self._init_transmit = init_pck.get_field_int(NTPField.TRANSMIT_TIMESTAMP)
+        self._chunks = {}
 
-    def add_next_pck(self, cp1_pck: CP1Package):
+    def add_next_pck(self, cp1_pck: CP1Package, layout: CP1CarrierLayout = None):
         """
         Handles the next NTP package, extracts the payload and adds it to the session storage.
         :param cp1_pck:
+        :param layout: the carrier layout of the sender, if it differs from the original 16 bit layout. The padding
+        of the last package is removed.
+        :raises ValueError: in case the header of a stream announces more than max_stream_length bytes.
         :return:
         """
-        self.secret_received_in_bits += cp1_pck.extract_payload()
+        if self.stream:  # The padding of the last package is beyond the length of the stream.
+            self._stream_receiver.feed(cp1_pck.extract_payload(layout=layout) if layout is not None
+                                       else cp1_pck.extract_payload())
+        elif layout is None:
+            self.secret_received_in_bits += cp1_pck.extract_payload()
+        else:
+            bits = self.secret_received_in_bits + cp1_pck.extract_payload(layout=layout)
+            self.secret_received_in_bits = bits[:128]
+
+    def is_init_pck(self, cp1_pck: CP1Package) -> bool:
+        """
+        :return: True in case the package is (a retransmission of) the init package of this session.
+        """
+        return cp1_pck.get_field_int(NTPField.TRANSMIT_TIMESTAMP) == self._init_transmit
+
+    def add_indexed_pck(self, cp1_pck: CP1Package, payload_size: int = 16):
+        """
+        Handles a package of an acknowledged or forward error corrected session: the payload is stored by the chunk
+        index of the package, so chunks may arrive in any order and more than once. Chunks with an index beyond the
+        erasure code are dropped.
+        :param cp1_pck:
+        :param payload_size: the number of payload bits per package.
+        """
+        index = cp1_pck.chunk_index()
+        if self.fec is not None and index >= self.fec.n:
+            self.log.warning('Chunk index ' + str(index) + ' is not part of the erasure code (n=' + str(self.fec.n)
+                             + '), chunk dropped.')
+            return
+        self._chunks[index] = cp1_pck.extract_payload(payload_size=payload_size)
+        if self.is_complete():
+            return
+        if self.fec is not None:
+            if len(self._chunks) >= self.fec.k:
+                data = self.fec.decode({index: bits_to_bytes(bits) for index, bits in self._chunks.items()})
+                self.secret_received_in_bits = ''.join(bytes_to_bits(chunk) for chunk in data)
+            return
+        count = 128 // payload_size
+        if all(i in self._chunks for i in range(count)):
+            self.secret_received_in_bits = ''.join(self._chunks[i] for i in range(count))
+
+    def ack_bitmap(self) -> int:
+        """
+        :return: the bitmap of all received chunks (bit i = chunk i).
+        """
+        bitmap = 0
+        for index in self._chunks:
+            bitmap |= 1 << index
+        return bitmap
+
+    def create_ack_pck(self, packet_factory: NTPPacketFactory = None) -> CP1Package:
+        """
+        Creates the acknowledgement of all chunks received so far, as an NTP server package.
+        :param packet_factory: creates the package, the default factory if not set.
+        """
+        factory = packet_factory if packet_factory is not None else default_packet_factory()
+        pck = CP1Package(factory.client_pck_bytes())
+        pck.set_mode(NTPMode.to_bit_string(NTPMode.SERVER))
+        function_code = CP1FunctionCode.MSG_ACK if self.is_complete() else CP1FunctionCode.ACK
+        pck.add_ack(function_code, self.ack_bitmap())
+        return pck
 
     def is_complete(self):
         """
-        Checks whether the 128 bit payload of this session is fully received or not.
+        Checks whether the 128 bit payload (or the complete stream) of this session is fully received or not.
         :return:
         """
+        if self.stream:
+            return self._stream_receiver.is_complete()
         return len(self.secret_received_in_bits) >= 128
 
+    def decrypt_stream(self) -> bytes:
+        """
+        :return: the message of a completely received stream, without its header. It is decrypted while received.
+        """
+        assert self.stream and self.is_complete()
+        return self._stream_receiver.message()
+
     def get_decryption_key_bytes(self):
         return self._decryption_key_bytes
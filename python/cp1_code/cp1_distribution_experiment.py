@@ -7,8 +7,8 @@ from scapy.layers.ntp import NTP
 
 from cp1_client import CP1Client
 from cp1_common_secrets import ADDR_2, STATIC_KEY, ADDR_1, PAYLOAD_BITS_120
-from ntp_raw import RawNTP
-from ntp_utils import extract_64timestamp_fraction
+from ntp_raw import RawNTP, NTPField
+from ntp_timestamp import ntp64_fraction_digits
 
 
 class CP1DistributionExperiment:
@@ -93,10 +93,10 @@ class CP1DistributionExperiment:
         plt.show()
 
     def _process_ntp_result(self, result: RawNTP):
-        orig_digits = extract_64timestamp_fraction(result.origin_timestamp())
-        trans_digits = extract_64timestamp_fraction(result.transmit_timestamp())
-        ref_digits = extract_64timestamp_fraction(result.reference_timestamp())
-        rec_digits = extract_64timestamp_fraction(result.receive_timestamp())
+        orig_digits = ntp64_fraction_digits(result.get_field_int(NTPField.ORIGIN_TIMESTAMP))
+        trans_digits = ntp64_fraction_digits(result.get_field_int(NTPField.TRANSMIT_TIMESTAMP))
+        ref_digits = ntp64_fraction_digits(result.get_field_int(NTPField.REFERENCE_TIMESTAMP))
+        rec_digits = ntp64_fraction_digits(result.get_field_int(NTPField.RECEIVE_TIMESTAMP))
 
         self.log.info('Raw bits: ' + orig_digits + ' ' + trans_digits + ' ' + ref_digits + ' ' + rec_digits)
 
@@ -16,7 +16,12 @@ class CP1FunctionCode(Enum):
 
     @staticmethod
     def to_bit_string(code):
-        if code is CP1FunctionCode.MSG_ONE:
-            return "011"
-        else:
+        if not isinstance(code, CP1FunctionCode):
             raise ValueError("No valid enum value supported: " + str(code))
+        return format(code.value, '03b')
+
+    @staticmethod
+    def from_bit_string(bit_string: str):
+        if len(bit_string) != 3 or not set(bit_string) <= {'0', '1'}:
+            raise ValueError("No valid function code: " + str(bit_string))
+        return CP1FunctionCode(int(bit_string, 2))
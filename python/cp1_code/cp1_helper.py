@@ -1,6 +1,6 @@
 import hashlib
 
-from bitstring import BitArray
+from bit_codec import bytes_to_bits
 
 _PROTOCOL_VERSION = '00'
 
@@ -12,9 +12,7 @@ def generate_address_hash(nonce: str, address: str, hash_length: int = 6) -> str
     """
     combined_str = (nonce + address).encode('ASCII')
     hash_digest = hashlib.md5(combined_str).digest()
-    bin_value = BitArray(bytes=hash_digest).bin
-    bin_value = bin_value[0:hash_length]
-    return bin_value
+    return bytes_to_bits(hash_digest[:(hash_length + 7) // 8])[:hash_length]
 
 
 def generate_version_hash(nonce: str, version: str, hash_length: int = 2) -> str:
@@ -1,25 +1,48 @@
 import logging
+from collections import OrderedDict, deque
+from threading import Lock
 
 from scapy.layers.inet import IP, UDP
 from scapy.layers.ntp import NTP
 from scapy.packet import Packet
-from scapy.sendrecv import send
 
 from cp1_client import CP1Client
 from cp1_common_secrets import PAYLOAD_BITS_120, ADDR_2
+from cp1_function_code import CP1FunctionCode
 from cp1_package import CP1Package
+from cp1_payload import CP1Payload
 from cp1_session import CP1Session
+from cp1_session_table import CP1SessionTable
 from ntp_crypto import NTPCrypto
-from ntp_raw import RawNTP
-from ntp_utils import init_ntp_client_pck
+from ntp_raw import NTPField, RawNTP
 from scapy_wrapper import ScapyWrapper
+from upstream_time_source import UpstreamTimeSource
 
 
 class CP1Interceptor(CP1Client):
     def __init__(self, address: str, static_key: str, sniff_interface: str = 'lo', self_ip_addr='192.168.0.1',
                  payload: str = PAYLOAD_BITS_120, client_address: str = ADDR_2,
+                 time_source: UpstreamTimeSource = None, sessions: CP1SessionTable = None, key_by_port: bool = True,
                  log=logging.getLogger('CP1Interceptor-Logger')):
+        """
+        Answers intercepted NTP requests with CP1 packages. Every client gets its own sending session, so many
+        clients receive their messages in parallel.
+        :param payload: the payload sent to clients without queued payloads (see add_payload).
+        :param time_source: provides the answers to the intercepted requests. Queries pool.ntp.org in the
+        background if not set.
+        :param sessions: the sending sessions of the clients, which also limits their number and drops idle
+        sessions. A table with default limits is used if not set. The queued payloads of a client are dropped together
+        with its evicted or timed out session, and payloads are queued for at most max_sessions clients.
+        :param key_by_port: whether the clients are told apart by ip and source port. Has to be False for clients
+        which change their source port with every request.
+        """
         super().__init__(address, static_key, sniff_interface, log)
+        self.sessions = sessions if sessions is not None else CP1SessionTable(log=log)
+        self.key_by_port = key_by_port
+        self._payloads = OrderedDict()  # client -> queue of payloads to send, the least recently queued first.
+        self._payload_lock = Lock()
+        self.sessions.on_drop = self._drop_payloads
+        self.time_source = time_source if time_source is not None else UpstreamTimeSource(log=log)
         self.scapy_wrapper = ScapyWrapper()
         self.crypto_tools = NTPCrypto()
         self.self_ip_addr = self_ip_addr
@@ -29,6 +52,7 @@ class CP1Interceptor(CP1Client):
     def listen(self):
         self.log.info(
             "Starting to listen for incoming NTP packages on interface: " + self.sniff_interface)
+        self.time_source.start()
         while True:
             if self.self_ip_addr is None:
                 pck = self.scapy_wrapper.next_ntp_packet(self.sniff_interface)
@@ -39,45 +63,83 @@ class CP1Interceptor(CP1Client):
 
             self.handle_incoming_pck(pck)
 
+    def client_key(self, pck: Packet):
+        """
+        :return: the key of the session of the sender of an intercepted request.
+        """
+        if self.key_by_port:
+            return pck[IP].src, pck[UDP].sport
+        return pck[IP].src
+
+    def add_payload(self, client, payload: str):
+        """
+        Queues a payload for one client, it is sent in the next session of this client.
+        :param client: the key of the client (see client_key).
+        :param payload: the payload bits (see add_secret_payload).
+        """
+        with self._payload_lock:
+            self._payloads.setdefault(client, deque()).append(payload)
+            self._payloads.move_to_end(client)
+            while len(self._payloads) > self.sessions.max_sessions:
+                evicted, queue = self._payloads.popitem(last=False)
+                self.log.warning(str(len(queue)) + ' queued payloads of ' + str(evicted) + ' dropped.')
+
+    def _drop_payloads(self, client):
+        with self._payload_lock:
+            queue = self._payloads.pop(client, None)
+        if queue:
+            self.log.info(str(len(queue)) + ' queued payloads of ' + str(client) + ' dropped with its session.')
+
+    def _next_payload(self, client) -> str:
+        with self._payload_lock:
+            queue = self._payloads.get(client)
+            if not queue:
+                return self.payload
+            payload = queue.popleft()
+            if not queue:
+                del self._payloads[client]
+            return payload
+
+    def _open_session(self, client) -> NTP:
+        self.log.debug("Init new session for " + str(client))
+        session = CP1Session(self.packet_factory)
+        next_pck = session.generate_init_pck(self.client_address)
+        payload = CP1Payload(CP1FunctionCode.MSG_ONE, self._next_payload(client))
+        session.add_secret_to_send(payload.complete_payload, self.static_key)
+        self.sessions.open(client, session.aes_nonce, session)
+        return next_pck
+
     def handle_incoming_pck(self, pck: Packet):
         ntp_pck = pck[NTP]
         cp1_pck = CP1Package(ntp_pck)
         self.log.info('Received pck bits: ' + str(cp1_pck._raw))
 
-        if self.send_session is None:
-            self.log.debug("Init new session (1).")
-            self.send_session = CP1Session()
-            next_pck = self.send_session.generate_init_pck(self.client_address)
-            self.add_secret_payload(self.payload, self.static_key)
-
+        client = self.client_key(pck)
+        session = self.sessions.lookup(client)
+        if session is None:
+            next_pck = self._open_session(client)
         else:
-            next_bits_to_send = self.send_session.secret_to_send.next_bits(self.payload_size)
-            self.log.debug("Next payload bits to send: " + str(next_bits_to_send))
-            new_cp1_pck = CP1Package(ntp_pck=init_ntp_client_pck())
+            next_bits_to_send = session.secret_to_send.next_bits(self.payload_size)
+            self.log.debug("Next payload bits to send to " + str(client) + ": " + str(next_bits_to_send))
+            new_cp1_pck = CP1Package(ntp_pck=self.packet_factory.client_pck_bytes())
             new_cp1_pck.add_payload(next_bits_to_send)
+            session.disguise_payload_pck(new_cp1_pck)
             next_pck = new_cp1_pck.ntp()
-
-        upstream_pck = self.scapy_wrapper.get_upstream_ntp()
-
-        upstream_pck[NTP].mode = 4
-        # upstream_pck[NTP].orig = ntp_pck.sent
-        upstream_pck[NTP].sent = next_pck[NTP].sent
-        upstream_pck[NTP].ref = next_pck[NTP].ref
-        upstream_pck[IP].src = pck[IP].dst
-        upstream_pck[IP].dst = pck[IP].src
-        upstream_pck[UDP].sport = pck[UDP].dport
-        upstream_pck[UDP].dport = pck[UDP].sport
-
-        up_raw = RawNTP(upstream_pck[NTP])
-        pck_raw = RawNTP(ntp_pck)
-        up_raw.set_origin_timestamp(pck_raw.transmit_timestamp())
-        upstream_pck[NTP] = up_raw.ntp()
+            if not session.secret_to_send.has_next_bits():
+                self.log.debug("Sending to " + str(client) + " complete. Terminating sending session.")
+                self.sessions.close(client)
+
+        # The answer is synthesized from a cached upstream sample, its origin is the transmit time of the request.
+        up_raw = self.time_source.response(bytes(ntp_pck))
+        if up_raw is None:
+            self.log.error("No upstream time available, the request is not answered.")
+            return
+        next_raw = RawNTP(next_pck)
+        up_raw.set_field_int(next_raw.get_field_int(NTPField.TRANSMIT_TIMESTAMP), NTPField.TRANSMIT_TIMESTAMP)
+        up_raw.set_field_int(next_raw.get_field_int(NTPField.REFERENCE_TIMESTAMP), NTPField.REFERENCE_TIMESTAMP)
+        upstream_pck = IP(src=pck[IP].dst, dst=pck[IP].src) / UDP(sport=pck[UDP].dport, dport=pck[UDP].sport) \
+            / up_raw.ntp()
 
         self.log.debug("Created new CP1 packet to send...")
 
-        upstream_pck.show()
-        send(upstream_pck)
-
-        if not self.has_next_pck():
-            self.log.debug("Init new session (2).")
-            self.send_session = None
+        self.scapy_wrapper.send(upstream_pck)
@@ -1,9 +1,81 @@
 import logging
+from collections import namedtuple
 
 from scapy.layers.ntp import NTPHeader
 
+from cp1_function_code import CP1FunctionCode
+from ntp_mode import NTPMode
 from ntp_raw import RawNTP, NTPField
 
+# Payload packages of an acknowledged session carry the index of their chunk behind the 16 payload bits.
+CHUNK_INDEX_POS = 56
+CHUNK_INDEX_LENGTH = 4
+MAX_CHUNKS = 1 << CHUNK_INDEX_LENGTH
+# Acknowledgements carry a function code followed by a bitmap of the received chunks (bit i = chunk i).
+ACK_POS = 40
+ACK_BITMAP_LENGTH = MAX_CHUNKS
+# The timestamps which carry a value in genuine packages of each NTP mode. The origin timestamp of a server answer is
+# a copy of the transmit timestamp of the request and therefore can not carry payload.
+_CARRIER_FIELDS = {
+    NTPMode.CLIENT: (NTPField.TRANSMIT_TIMESTAMP, NTPField.REFERENCE_TIMESTAMP),
+    NTPMode.SERVER: (NTPField.TRANSMIT_TIMESTAMP, NTPField.RECEIVE_TIMESTAMP, NTPField.REFERENCE_TIMESTAMP),
+    NTPMode.BROADCAST_SERVER: (NTPField.TRANSMIT_TIMESTAMP, NTPField.REFERENCE_TIMESTAMP),
+    NTPMode.SYMMETRIC_ACTIVE: (NTPField.TRANSMIT_TIMESTAMP, NTPField.RECEIVE_TIMESTAMP,
+                               NTPField.ORIGIN_TIMESTAMP, NTPField.REFERENCE_TIMESTAMP),
+    NTPMode.SYMMETRIC_PASSIVE: (NTPField.TRANSMIT_TIMESTAMP, NTPField.RECEIVE_TIMESTAMP,
+                                NTPField.ORIGIN_TIMESTAMP, NTPField.REFERENCE_TIMESTAMP),
+}
+
+
+class CP1CarrierSlot(namedtuple('CP1CarrierSlot', ['field', 'pos', 'length'])):
+    """
+    One part of a carrier layout: length payload bits at position pos of a 64 bit timestamp field.
+    """
+    __slots__ = ()
+
+
+class CP1CarrierLayout:
+    """
+    Describes where the payload bits of a package are placed: the bits are spread over the slots in their order.
+    Sender and receiver have to use the same layout.
+    """
+
+    def __init__(self, slots):
+        """
+        :param slots: the CP1CarrierSlots. Only the fraction part (pos >= 32) of the timestamps may be used, the
+        seconds form the nonces of a session.
+        """
+        self.slots = tuple(CP1CarrierSlot(*slot) for slot in slots)
+        assert len(self.slots) > 0
+        assert all(32 <= slot.pos and slot.pos + slot.length <= 64 for slot in self.slots)
+        self.capacity = sum(slot.length for slot in self.slots)
+
+    def fields(self) -> tuple:
+        """
+        :return: all fields used by this layout.
+        """
+        return tuple(slot.field for slot in self.slots)
+
+    @staticmethod
+    def for_mode(ntp_mode: NTPMode, field_budget: int = 16, pos: int = 40):
+        """
+        Creates a layout using every timestamp which carries a value in genuine packages of the mode.
+        :param ntp_mode: the mode of the payload packages.
+        :param field_budget: the number of payload bits per timestamp.
+        :param pos: the position of the payload bits within each timestamp.
+        """
+        return CP1CarrierLayout([CP1CarrierSlot(field, pos, field_budget) for field in _CARRIER_FIELDS[ntp_mode]])
+
+    def __eq__(self, other):
+        return isinstance(other, CP1CarrierLayout) and self.slots == other.slots
+
+    def __repr__(self):
+        return 'CP1CarrierLayout(' + str(list(self.slots)) + ')'
+
+
+# The layout of the original protocol: 16 payload bits in the transmit timestamp.
+DEFAULT_LAYOUT = CP1CarrierLayout([CP1CarrierSlot(NTPField.TRANSMIT_TIMESTAMP, 40, 16)])
+
 
 class CP1Package(RawNTP):
     """
@@ -31,14 +103,25 @@ class CP1Package(RawNTP):
         combined = second_part_transmit + second_part_reference
         return combined
 
-    def add_payload(self, payload, pos: int = 40, field: NTPField = NTPField.TRANSMIT_TIMESTAMP):
+    def add_payload(self, payload, pos: int = 40, field: NTPField = NTPField.TRANSMIT_TIMESTAMP,
+                    layout: CP1CarrierLayout = None):
         """
         Adds the CP1 payload to the CP1 package in order to send it.
         :param payload:
         :param pos:
         :param field:
+        :param layout: if set, the payload (layout.capacity bits) is spread over the slots of the layout, pos and
+        field are ignored.
         :return:
         """
+        if layout is not None:
+            assert len(payload) == layout.capacity
+            start = 0
+            for slot in layout.slots:
+                self.add_payload(payload[start:start + slot.length], slot.pos, slot.field)
+                start += slot.length
+            return
+
         field_value = self.get_field(field)
         field_value = field_value[:pos] + payload + field_value[pos + len(payload):]
 
@@ -46,16 +129,53 @@ class CP1Package(RawNTP):
 
         self.set_field(field_value, field)
 
-    def extract_payload(self, pos: int = 40, payload_size: int = 16, field: NTPField = NTPField.TRANSMIT_TIMESTAMP):
+    def extract_payload(self, pos: int = 40, payload_size: int = 16, field: NTPField = NTPField.TRANSMIT_TIMESTAMP,
+                        layout: CP1CarrierLayout = None):
         """
         Retrieves the complete payload from this CP1 package.
         :param payload_size:
         :param pos:
         :param field:
+        :param layout: if set, the payload is collected from the slots of the layout, the other parameters are
+        ignored.
         :return:
         """
+        if layout is not None:
+            return ''.join(self.get_field(slot.field)[slot.pos:slot.pos + slot.length] for slot in layout.slots)
+
         field_value = self.get_field(field)[pos:pos + payload_size]
 
         self.log.debug("Extracted payload: " + str(field_value))
 
         return field_value
+
+    def add_chunk_index(self, index: int, pos: int = CHUNK_INDEX_POS, field: NTPField = NTPField.TRANSMIT_TIMESTAMP):
+        """
+        Adds the index of the payload chunk carried by this package.
+        """
+        assert 0 <= index < MAX_CHUNKS
+        self.add_payload(format(index, '0' + str(CHUNK_INDEX_LENGTH) + 'b'), pos, field)
+
+    def chunk_index(self, pos: int = CHUNK_INDEX_POS, field: NTPField = NTPField.TRANSMIT_TIMESTAMP) -> int:
+        """
+        :return: the index of the payload chunk carried by this package.
+        """
+        return int(self.extract_payload(pos, CHUNK_INDEX_LENGTH, field), 2)
+
+    def add_ack(self, function_code: CP1FunctionCode, bitmap: int, pos: int = ACK_POS,
+                field: NTPField = NTPField.TRANSMIT_TIMESTAMP):
+        """
+        Turns this package into an acknowledgement.
+        :param function_code: ACK while chunks are missing, MSG_ACK once the message is complete.
+        :param bitmap: bit i is set in case chunk i was received.
+        """
+        assert 0 <= bitmap < 1 << ACK_BITMAP_LENGTH
+        self.add_payload(CP1FunctionCode.to_bit_string(function_code)
+                         + format(bitmap, '0' + str(ACK_BITMAP_LENGTH) + 'b'), pos, field)
+
+    def extract_ack(self, pos: int = ACK_POS, field: NTPField = NTPField.TRANSMIT_TIMESTAMP):
+        """
+        :return: (function code, bitmap) of an acknowledgement, see add_ack.
+        """
+        bits = self.extract_payload(pos, 3 + ACK_BITMAP_LENGTH, field)
+        return CP1FunctionCode.from_bit_string(bits[:3]), int(bits[3:], 2)
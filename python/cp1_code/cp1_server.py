@@ -1,15 +1,26 @@
 import logging
-from threading import Lock
+from collections import OrderedDict
+from queue import Full, Queue
+from threading import Event, Lock, Thread
 
+from scapy.layers.inet import IP, UDP
 from scapy.layers.ntp import NTP
 
+from bit_codec import bits_to_bytes, bytes_to_bits
+from cp1_address_matcher import CP1AddressMatcher
 from cp1_client_session import CP1ClientSession
-from cp1_helper import _PROTOCOL_VERSION, generate_address_hash, generate_version_hash
-from cp1_package import CP1Package
-from ntp_crypto import decrypt_bits_raw, NTPCrypto
+from cp1_package import CP1CarrierLayout, CP1Package
+from cp1_session_table import CP1SessionTable
+from ntp_crypto import BatchDecryptor, decrypt_bits_raw, MAX_STREAM_LENGTH, NTPCrypto
+from ntp_datagram import NTPDatagramReceiver
+from ntp_fec import ReedSolomonCode
 from ntp_raw import NTPField
+from ntp_sender import NTPSender
 from scapy_wrapper import ScapyWrapper
 
+_CAPTURE_POLL_INTERVAL_SEC = 0.2
+_MAX_CAPTURE_BACKOFF_SEC = 5
+
 
 class CP1Server:
     """
@@ -17,19 +28,61 @@ class CP1Server:
     """
 
     def __init__(self, cp1_address_bits: str, static_decryption_key_bits: str, sniff_interface: str = 'lo',
-                 self_ip_addr: str = None,
+                 self_ip_addr: str = None, decryptor: BatchDecryptor = None, receiver: NTPDatagramReceiver = None,
+                 sessions: CP1SessionTable = None, max_queue_size: int = 10000, acknowledge: bool = False,
+                 fec: ReedSolomonCode = None, carrier_layout: CP1CarrierLayout = None, stream: bool = False,
+                 max_stream_length: int = MAX_STREAM_LENGTH, sender: NTPSender = None,
                  log: logging.Logger = logging.getLogger('CP1Server-logger')):
+        """
+        :param cp1_address_bits: the address of this server, further addresses can be registered at the
+        address_matcher.
+        :param decryptor: an optional (started) BatchDecryptor, completed payloads are then decrypted on its worker
+        thread instead of the listening thread.
+        :param receiver: an optional NTPDatagramReceiver, which receives the packages without scapy. It has to
+        filter for the self_ip_addr on its own.
+        :param sessions: the table of the concurrently received sessions, a table with default limits is used if
+        not set.
+        :param max_queue_size: the maximum number of received packages waiting for each worker.
+        :param acknowledge: whether payload packages carry chunk indices and every package is acknowledged (see
+        CP1Session.enable_acknowledgement). The acknowledgements are returned by handle_incoming_ntp_pck, while
+        listening they are sent back to the source address and port of the acknowledged package.
+        :param fec: the erasure code, if the senders use forward error correction (see CP1Session.enable_fec).
+        :param carrier_layout: the layout of the payload packages, if the senders use a multi field layout (see
+        CP1Client.carrier_layout).
+        :param stream: whether the senders send stream secrets of arbitrary length (see CP1Client.add_secret_stream)
+        instead of 128 bit messages. Can not be combined with acknowledgements or forward error correction.
+        :param max_stream_length: the maximum length of a stream in bytes, the session of a sender announcing a longer
+        stream is dropped.
+        :param sender: sends the acknowledgements while listening, an NTPSender over a plain UDP socket if not set.
+        """
+        assert not stream or (not acknowledge and fec is None)
         self.log = log
         self._address = cp1_address_bits
+        self.address_matcher = CP1AddressMatcher([cp1_address_bits], log=log)
         self.static_key_bits = static_decryption_key_bits
         self.init_pck_field = NTPField.TRANSMIT_TIMESTAMP
         self.sniff_interface = sniff_interface
-        self.listen_session: CP1ClientSession = None
+        self.sessions = sessions if sessions is not None else CP1SessionTable(log=log)
+        self.max_queue_size = max_queue_size
+        self.dropped = 0  # Packages dropped, because the queue of their worker was full.
         self._listen_lock = Lock()
-        self._release_listen = False
+        self._stop_event = Event()
+        self._capture_thread: Thread = None
+        self._workers = []
+        self._work_queues = []
         self.self_ip_addr = self_ip_addr
         self.scapy_wrapper = ScapyWrapper()
         self.crypto_tools = NTPCrypto()
+        self.decryptor = decryptor
+        self.receiver = receiver
+        self.acknowledge = acknowledge
+        self.fec = fec
+        self.carrier_layout = carrier_layout
+        self.stream = stream
+        self.max_stream_length = max_stream_length
+        self.sender = sender if sender is not None else NTPSender(log=log)
+        self._completed_acks = OrderedDict()  # source ip -> the final acknowledgement of its last message
+        self._acks_lock = Lock()
 
     def address_and_version_check(self, pck: CP1Package) -> bool:
         """
@@ -37,84 +90,177 @@ class CP1Server:
         :param pck: The package to check
         :return: True in case it is meant for this client, False otherwise.
         """
-        init_field = pck.get_field(self.init_pck_field)
-        init_field = init_field[self.init_pck_field.length() - 8: self.init_pck_field.length()]
-        received_address_bits_hashed = init_field[0:6]
-        own_address_bits_hashed = generate_address_hash(pck.hash_nonce(), self._address)
-
-        if received_address_bits_hashed != own_address_bits_hashed:
-            self.log.debug('The received address hash did not match: ' + received_address_bits_hashed)
-            return False
-
-        received_version_bits_hashed = init_field[6:8]
-        own_version_bits_hashed = generate_version_hash(pck.hash_nonce(), _PROTOCOL_VERSION)
-
-        if received_version_bits_hashed != own_version_bits_hashed:
-            self.log.debug(
-                'The received version hash did not match the expected value: ' + str(received_version_bits_hashed))
-            return False
-
-        return True
+        return len(self.address_matcher.match(pck, self.init_pck_field)) > 0
 
-    def listen(self):
+    def listen(self, num_workers: int = 1) -> bool:
         """
-        Starts to listen for incoming NTP packages. This action is blocking so far.
-        :return:
+        Starts to listen for incoming NTP packages. This action is non-blocking: a capture thread receives the
+        packages and distributes them by their source ip to num_workers worker threads, which handle the sessions.
+        All packages of one sender are handled by the same worker and therefore in order.
+        :param num_workers: the number of worker threads.
+        :return: False in case the server is already listening, True otherwise.
         """
-        # TODO: Move this action to a new thread.
-        if self._listen_lock.locked():
-            return False
-        self._listen_async()
+        assert num_workers > 0
+        with self._listen_lock:
+            if self._capture_thread is not None:
+                return False
+            self.log.info("Starting to listen for incoming NTP packages on interface: " + self.sniff_interface)
+            self._stop_event.clear()
+            if self.acknowledge:
+                self.sender.open()  # Opened once here, since the workers share the socket.
+            self._work_queues = [Queue(maxsize=self.max_queue_size) for _ in range(num_workers)]
+            self._workers = [Thread(target=self._work, args=(queue,), name='CP1Server-worker-' + str(i), daemon=True)
+                             for i, queue in enumerate(self._work_queues)]
+            self._capture_thread = Thread(target=self._capture, name='CP1Server-capture', daemon=True)
+            for worker in self._workers:
+                worker.start()
+            self._capture_thread.start()
         return True
 
-    def _listen_async(self):
+    def stop(self):
         """
-        A synchronized method which waits for matching incoming NTP-packages and handles them accordingly to the
-        current Session status (initialized, or non-initialized).
-        :return:
+        Stops listening. The packages captured so far are handled before the workers terminate, open sessions are
+        cleared afterwards. The captures are closed as well, so packages arriving while stopped are not handled by
+        the next listen.
         """
-        self._listen_lock.acquire()
-        try:
-            self.log.info(
-                "Lock acquired, starting to listen for incoming NTP packages on interface: " + self.sniff_interface)
-            while True:
+        with self._listen_lock:
+            if self._capture_thread is None:
+                return
+            self._stop_event.set()
+            self._capture_thread.join()
+            self._capture_thread = None
+            self.scapy_wrapper.close()
+            for queue in self._work_queues:
+                queue.put(None)
+            for worker in self._workers:
+                worker.join()
+            self._workers = []
+            self._work_queues = []
+            self.sessions.clear()
+            self.sender.close()
+            self.log.info("Stopped listening.")
 
-                if self.self_ip_addr is None:
-                    pck = self.scapy_wrapper.next_ntp_packet(self.sniff_interface)
-                else:
-                    pck = self.scapy_wrapper.next_ntp_packet_for_target(self.sniff_interface, self.self_ip_addr)
+    def is_listening(self) -> bool:
+        return self._capture_thread is not None
 
-                self.log.info("NTP-Package received")
-
-                if self._release_listen:  # The listening should be aborted.
-                    self._release_listen = False
-                    return
+    def _next_pck(self, timeout: float):
+        """
+        :return: (ntp package, source ip, source port) of the next received package or None in case the timeout
+        expired.
+        """
+        if self.receiver is not None:
+            datagram = self.receiver.next_datagram(timeout)
+            return None if datagram is None else (datagram.payload, datagram.src_ip, datagram.sport)
+        if self.self_ip_addr is None:
+            pck = self.scapy_wrapper.next_ntp_packet(self.sniff_interface, timeout)
+        else:
+            pck = self.scapy_wrapper.next_ntp_packet_for_target(self.sniff_interface, self.self_ip_addr, timeout)
+        return None if pck is None else (pck[NTP], pck[IP].src, pck[UDP].sport)
 
-                self.handle_incoming_ntp_pck(pck[NTP])
+    def _capture(self):
+        # The capture thread only receives and distributes packages, so slow handling never blocks the capture.
+        failures = 0
+        while not self._stop_event.is_set():
+            try:
+                received = self._next_pck(_CAPTURE_POLL_INTERVAL_SEC)
+            except Exception as e:
+                # E.g. a closed socket, which fails immediately again: retry with an exponential backoff.
+                failures += 1
+                backoff = min(_CAPTURE_POLL_INTERVAL_SEC * 2 ** (failures - 1), _MAX_CAPTURE_BACKOFF_SEC)
+                self.log.error("Receiving failed (" + str(failures) + " times in a row, retrying in "
+                               + str(backoff) + " sec): " + str(e))
+                self._stop_event.wait(backoff)
+                continue
+            failures = 0
+            if received is None:
+                continue
+            queue = self._work_queues[hash(received[1]) % len(self._work_queues)]
+            try:
+                queue.put_nowait(received)
+            except Full:
+                self.dropped += 1
 
-        finally:
-            self.log.error("Session cleared after exception.")
-            self.listen_session = None
-            self._listen_lock.release()
+    def _work(self, queue: Queue):
+        while True:
+            received = queue.get()
+            if received is None:
+                return
+            ntp_pck, src_ip, sport = received
+            try:
+                ack = self.handle_incoming_ntp_pck(ntp_pck, src_ip)
+                if ack is not None:
+                    self.sender.send(ack.to_bytes(), src_ip, sport)
+            except Exception as e:
+                self.log.error("Handling of a package from " + str(src_ip) + " failed: " + str(e))
 
-    def handle_incoming_ntp_pck(self, ntp_pck: NTP):
+    def handle_incoming_ntp_pck(self, ntp_pck, src_ip: str = None) -> CP1Package:
+        """
+        :param ntp_pck: the received package, either as scapy NTP or in its wire format.
+        :param src_ip: the source ip of the package, which assigns it to the session of its sender. Without it,
+        all packages belong to one sender.
+        :return: the acknowledgement to send back to the sender, None if acknowledgements are disabled or the package
+        did not belong to a session.
+        """
         cp1_pck = CP1Package(ntp_pck)
         self.log.info('Received pck bits: ' + str(cp1_pck._raw))
-        if self.listen_session is None:
-            if not self.address_and_version_check(cp1_pck):
-                self.log.info('Package did not contain matching address or version')
+        session = self.sessions.lookup(src_ip)
+        if session is not None and session.is_init_pck(cp1_pck):  # A retransmitted init package is acknowledged only.
+            return session.create_ack_pck() if self.acknowledge else None
+
+        # Every package is checked for an init package, a sender which restarted replaces its unfinished session.
+        # The sender only disguises payload packages matching its own address, so a payload package may match another
+        # registered address by chance: only an init package for an address of the open session replaces it.
+        addresses = self.address_matcher.match(cp1_pck, self.init_pck_field)
+        if addresses and session is not None and not set(addresses) & set(session.addresses):
+            addresses = ()
+        if addresses:
+            self.log.info("Init pck for address(es) " + str(addresses) + " from " + str(src_ip)
+                          + ". Creating new session")
+            session = CP1ClientSession(self.static_key_bits, cp1_pck, self.fec, stream=self.stream,
+                                       max_stream_length=self.max_stream_length, addresses=addresses)
+            self.sessions.open(src_ip, cp1_pck.aes_nonce_bits(), session)
+            with self._acks_lock:
+                self._completed_acks.pop(src_ip, None)
+            return session.create_ack_pck() if self.acknowledge else None
+        if session is None:
+            self.log.info('Package did not contain matching address or version')
+            if not self.acknowledge:
+                return None
+            # The final acknowledgement may have been lost, the sender is still retransmitting.
+            with self._acks_lock:
+                return self._completed_acks.get(src_ip)
+
+        if not self.acknowledge and self.fec is None:
+            try:
+                session.add_next_pck(cp1_pck, self.carrier_layout)
+            except ValueError as e:
+                self.log.warning('Session of ' + str(src_ip) + ' dropped: ' + str(e))
+                self.sessions.discard(src_ip)
+                return None
+        else:
+            session.add_indexed_pck(cp1_pck)
+        ack = session.create_ack_pck() if self.acknowledge else None
+
+        if session.is_complete():
+            self.sessions.close(src_ip)
+            if self.stream:
+                self.log.info("DECRYPTED Stream: " + str(session.decrypt_stream()))
+                return ack
+            self.log.info("Payload completely received: " + str(session.secret_received_in_bits))
+            self.log.info("Using key to decrypt: " + str(session.get_decryption_key_bytes()))
+            if self.decryptor is None:
+                decoded_bits = decrypt_bits_raw(
+                    encrypted_bits=session.secret_received_in_bits,
+                    decryption_key_bytes=session.get_decryption_key_bytes())
+                self.log.info("DECRYPTED Payload: " + str(decoded_bits))
             else:
-                self.log.info("Init pck. Creating new session")
-                self.listen_session = CP1ClientSession(self.static_key_bits, cp1_pck)
-            return
-
-        self.listen_session.add_next_pck(cp1_pck)
-
-        if self.listen_session.is_complete():
-            self.log.info("Payload completely received: " + str(self.listen_session.secret_received_in_bits))
-            self.log.info("Using key to decrypt: " + str(self.listen_session.get_decryption_key_bytes()))
-            decoded_bits = decrypt_bits_raw(
-                encrypted_bits=self.listen_session.secret_received_in_bits,
-                decryption_key_bytes=self.listen_session.get_decryption_key_bytes())
-            self.log.info("DECRYPTED Payload: " + str(decoded_bits))
-            self.listen_session = None
+                future = self.decryptor.submit(session.get_decryption_key_bytes(),
+                                               bits_to_bytes(session.secret_received_in_bits))
+                future.add_done_callback(
+                    lambda f: self.log.info("DECRYPTED Payload: " + bytes_to_bits(f.result())))
+            if self.acknowledge:
+                with self._acks_lock:
+                    self._completed_acks[src_ip] = ack
+                    if len(self._completed_acks) > self.sessions.max_sessions:
+                        self._completed_acks.popitem(last=False)
+        return ack
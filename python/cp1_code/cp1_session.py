@@ -1,13 +1,15 @@
 import logging
 
-from bitstring import BitArray
 from scapy.layers.ntp import NTP
 
+from bit_codec import bits_to_bytes, bytes_to_bits
+from cp1_address_matcher import CP1AddressMatcher
 from cp1_helper import _PROTOCOL_VERSION, generate_address_hash, generate_version_hash
-from cp1_package import CP1Package
-from ntp_crypto import NTPSecret, NTPCrypto
+from cp1_package import CP1Package, MAX_CHUNKS
+from ntp_crypto import NTPSecret, NTPCrypto, NTPStreamSecret, stream_with_header
+from ntp_fec import ReedSolomonCode
+from ntp_packet_factory import NTPPacketFactory, default_packet_factory
 from ntp_raw import NTPField
-from ntp_utils import init_ntp_pck
 
 
 class CP1Session:
@@ -15,14 +17,24 @@ class CP1Session:
     A data container which stores session data of one CP1 Session data exchange.
     """
 
-    def __init__(self):
+    def __init__(self, packet_factory: NTPPacketFactory = None):
+        """
+        :param packet_factory: creates the init package, defaults to the shared factory without pool.
+        """
+        self.packet_factory = packet_factory if packet_factory is not None else default_packet_factory()
         self.aes_nonce = None
         self.init_pck_field = NTPField.TRANSMIT_TIMESTAMP
         self.secret_to_send: NTPSecret = None
         self.secret_received = ''
         self.log = logging.getLogger('default-logger')
         self.complete_key_in_bytes = None
+        self.stream_nonce: bytes = None
+        self._address_matcher: CP1AddressMatcher = None
         self.crypto_tools = NTPCrypto()
+        self.window_size = 0  # 0 disables the acknowledgements.
+        self._chunks = []
+        self._acknowledged = set()
+        self._sent = set()
 
     def add_secret_to_send(self, plaintext, static_key):
         """
@@ -33,7 +45,7 @@ class CP1Session:
         """
         combined_key = self.crypto_tools.generate_aes_key_bytes(static_key, self.aes_nonce)
         self.complete_key_in_bytes = combined_key
-        payload_bytes = BitArray(bin=plaintext).bytes
+        payload_bytes = bits_to_bytes(plaintext)
         self.log.debug('Plaintext to encrypt in bits: ' + str(plaintext))
         self.log.debug('Key used for encryption: ' + str(combined_key))
         self.secret_to_send = NTPSecret(payload_bytes=payload_bytes, key_bytes=combined_key)
@@ -41,6 +53,24 @@ class CP1Session:
 
         return self.secret_to_send
 
+    def add_stream_to_send(self, message, static_key, length: int = None):
+        """
+        Adds a message of arbitrary length (str, bytes or an iterable of bytes chunks) which is encrypted lazily
+        as an NTPStreamSecret, while its bits are sent. The message is prefixed with its length (see
+        stream_with_header).
+        The nonce of the stream is taken from the init package, so generate_init_pck has to be called first.
+        :param message:
+        :param static_key:
+        :param length: the length of the message in bytes, only needed for an iterable of chunks.
+        :return:
+        """
+        if self.stream_nonce is None:
+            raise ValueError('No init package was generated, the receiver could not recover the stream nonce.')
+        message = stream_with_header(message, length)
+        self.complete_key_in_bytes = self.crypto_tools.generate_aes_key_bytes(static_key, self.aes_nonce)
+        self.secret_to_send = NTPStreamSecret(message, self.complete_key_in_bytes, nonce=self.stream_nonce)
+        return self.secret_to_send
+
     def generate_init_pck(self, address: str) -> NTP:
         """
         Creates a new init package containing the hashed version number and address information.
@@ -48,14 +78,13 @@ class CP1Session:
         :param address: The address to hash and insert into the package.
         :return: the NTP package filled with address and version information.
         """
-        ntp = init_ntp_pck()
-
-        raw_ntp = CP1Package(ntp)
+        raw_ntp = CP1Package(self.packet_factory.init_pck_bytes())
         self.log.debug("Init pck field: " + str(self.init_pck_field))
         self.log.debug(
             'Value of init-package-field before transformation: ' + str(raw_ntp.get_field(self.init_pck_field)))
 
         self.aes_nonce = raw_ntp.aes_nonce_bits()
+        self._address_matcher = CP1AddressMatcher([address])
         address_hashed = generate_address_hash(raw_ntp.hash_nonce(), address)
         self.log.debug('Address hash: ' + str(address_hashed))
         version_hashed = generate_version_hash(raw_ntp.hash_nonce(), _PROTOCOL_VERSION)
@@ -64,12 +93,24 @@ class CP1Session:
         field_value = field_value[:len(field_value) - 8] + address_hashed + version_hashed
         assert len(field_value) == 64
         raw_ntp.set_field(field_value, self.init_pck_field)
+        # The complete init field (including the random low order bits) is the nonce of stream secrets.
+        self.stream_nonce = raw_ntp.get_field_int(self.init_pck_field).to_bytes(8, 'big')
         self.log.debug(
             'Value of init-package-field after transformation: ' + str(raw_ntp.get_field(self.init_pck_field)))
 
         ntp = raw_ntp.ntp()
         return ntp
 
+    def disguise_payload_pck(self, cp1_pck: CP1Package):
+        """
+        The receiver takes every package whose init field matches the address and version hash as a new init
+        package. A payload package matches by chance (1 in 256), its last bit of the init field is flipped in this
+        case. This bit must not carry payload.
+        :param cp1_pck: the payload package to send, changed in place.
+        """
+        if self._address_matcher is not None and self._address_matcher.match(cp1_pck, self.init_pck_field):
+            cp1_pck.set_field_int(cp1_pck.get_field_int(self.init_pck_field) ^ 1, self.init_pck_field)
+
     def next_pck(self, cp1_pck: CP1Package):
         """
         Handles the next NTP package, extracts the payload and adds it to the session storage.
@@ -84,3 +125,72 @@ class CP1Session:
         :return:
         """
         return len(self.secret_received) >= 128
+
+    def enable_acknowledgement(self, payload_size: int = 16, window_size: int = 4):
+        """
+        Splits the secret to send into indexed chunks, which are sent with a sliding window and retransmitted
+        selectively until the receiver acknowledges them (see next_chunk and handle_ack).
+        :param payload_size: the number of bits per chunk.
+        :param window_size: the maximum number of chunks sent but not yet acknowledged.
+        """
+        assert self.secret_to_send is not None and window_size > 0
+        bits = self.secret_to_send.get_all_bits()
+        self._chunks = [bits[i:i + payload_size] for i in range(0, len(bits), payload_size)]
+        assert len(self._chunks) <= MAX_CHUNKS
+        self.window_size = window_size
+        self._acknowledged = set()
+        self._sent = set()
+
+    def enable_fec(self, fec: ReedSolomonCode, payload_size: int = 16):
+        """
+        Splits the secret to send into fec.k indexed chunks and adds fec.n - fec.k parity chunks, so the receiver can
+        restore the secret from any fec.k of them without a return channel. All chunks are returned once by next_chunk.
+        :param fec: the erasure code, its k has to match the number of payload chunks of the secret.
+        :param payload_size: the number of bits per chunk, a multiple of 8.
+        """
+        assert self.secret_to_send is not None and payload_size % 8 == 0
+        bits = self.secret_to_send.get_all_bits()
+        data = [bits_to_bytes(bits[i:i + payload_size]) for i in range(0, len(bits), payload_size)]
+        assert len(data) == fec.k and fec.n <= MAX_CHUNKS
+        self._chunks = [bytes_to_bits(chunk) for chunk in fec.encode(data)]
+        self.window_size = fec.n
+        self._acknowledged = set()
+        self._sent = set()
+
+    def _window(self) -> list:
+        unacknowledged = [i for i in range(len(self._chunks)) if i not in self._acknowledged]
+        return unacknowledged[:self.window_size]
+
+    def next_chunk(self):
+        """
+        :return: (index, bits) of the next chunk within the window which was not sent yet, or None in case the
+        window is exhausted and an acknowledgement (or a timeout) is needed first.
+        """
+        for index in self._window():
+            if index not in self._sent:
+                self._sent.add(index)
+                return index, self._chunks[index]
+        return None
+
+    def handle_ack(self, bitmap: int):
+        """
+        Processes the bitmap of an acknowledgement. Unacknowledged chunks below the highest acknowledged chunk are
+        considered lost and are sent again.
+        :param bitmap: bit i is set in case the receiver has got chunk i.
+        """
+        self._acknowledged.update(i for i in range(len(self._chunks)) if bitmap >> i & 1)
+        if self._acknowledged:
+            highest = max(self._acknowledged)
+            self._sent -= {i for i in self._sent if i < highest and i not in self._acknowledged}
+
+    def retransmit_unacknowledged(self):
+        """
+        Marks all unacknowledged chunks for a retransmission, e.g. when no acknowledgement arrived in time.
+        """
+        self._sent &= self._acknowledged
+
+    def is_acknowledged(self) -> bool:
+        """
+        :return: True in case the receiver has acknowledged all chunks.
+        """
+        return len(self._acknowledged) == len(self._chunks)
@@ -0,0 +1,150 @@
+import logging
+import time
+from collections import OrderedDict
+from threading import RLock
+
+from cp1_client_session import CP1ClientSession
+
+
+class CP1SessionTable:
+    """
+    Holds the receiving sessions of many concurrent CP1 senders. Sessions are keyed by (source ip, aes nonce) of their
+    init package, payload packages are assigned by their source ip to the latest session of this source. The
+    CP1Interceptor keeps its sending sessions here as well, keyed by the address of each client.
+    Sessions which are idle for too long are dropped, and if the maximum number of sessions is reached, the least
+    recently active session is evicted. Thread safe.
+    """
+
+    def __init__(self, max_sessions: int = 64, idle_timeout_sec: float = 10, clock=time.monotonic, on_drop=None,
+                 log: logging.Logger = logging.getLogger('CP1SessionTable-logger')):
+        """
+        :param max_sessions: the maximum number of concurrently open sessions.
+        :param idle_timeout_sec: sessions without a package for this time are dropped.
+        :param clock: returns the current time in seconds, exchangeable for tests.
+        :param on_drop: called with the source of a session which is evicted or timed out, e.g. to release state kept
+        per source elsewhere. Called while the table is locked.
+        :param log:
+        """
+        self.log = log
+        self.max_sessions = max_sessions
+        self.idle_timeout_sec = idle_timeout_sec
+        self._clock = clock
+        self.on_drop = on_drop
+        self._sessions = OrderedDict()  # (source ip, aes nonce) -> [session, last activity], the LRU entry first.
+        self._by_source = {}  # source ip -> (source ip, aes nonce) of its latest session
+        self._lock = RLock()
+        self.opened = 0
+        self.completed = 0
+        self.evicted = 0
+        self.timed_out = 0
+        self.replaced = 0
+        self.discarded = 0
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def open(self, src_ip: str, aes_nonce: str, session: CP1ClientSession):
+        """
+        Adds the session of a received init package. An unfinished session of the same source is replaced.
+        :param src_ip: the source ip of the init package.
+        :param aes_nonce: the aes nonce bits of the init package.
+        :param session: the new session.
+        """
+        key = (src_ip, aes_nonce)
+        with self._lock:
+            self.expire()
+            previous = self._by_source.get(src_ip)
+            if previous is not None and previous in self._sessions:
+                self.log.info('Unfinished session of ' + str(src_ip) + ' replaced by a new session.')
+                del self._sessions[previous]
+                self.replaced += 1
+            while len(self._sessions) >= self.max_sessions:
+                (evicted_ip, _), _ = self._sessions.popitem(last=False)
+                self._by_source.pop(evicted_ip, None)
+                self.log.info('Session of ' + str(evicted_ip) + ' evicted.')
+                self.evicted += 1
+                self._notify_drop(evicted_ip)
+            self._sessions[key] = [session, self._clock()]
+            self._by_source[src_ip] = key
+            self.opened += 1
+
+    def lookup(self, src_ip: str) -> CP1ClientSession:
+        """
+        :param src_ip: the source ip of a received package.
+        :return: the open session of this source (which is marked as active) or None.
+        """
+        with self._lock:
+            key = self._by_source.get(src_ip)
+            entry = self._sessions.get(key) if key is not None else None
+            if entry is None:
+                return None
+            now = self._clock()
+            if now - entry[1] > self.idle_timeout_sec:
+                self._drop(key)
+                self.timed_out += 1
+                self._notify_drop(src_ip)
+                return None
+            entry[1] = now
+            self._sessions.move_to_end(key)
+            return entry[0]
+
+    def close(self, src_ip: str):
+        """
+        Removes the completed session of the given source.
+        """
+        with self._lock:
+            key = self._by_source.get(src_ip)
+            if key is not None and key in self._sessions:
+                self._drop(key)
+                self.completed += 1
+
+    def discard(self, src_ip: str):
+        """
+        Removes the session of the given source without counting it as completed, e.g. after an invalid package.
+        """
+        with self._lock:
+            key = self._by_source.get(src_ip)
+            if key is not None and key in self._sessions:
+                self._drop(key)
+                self.discarded += 1
+
+    def expire(self):
+        """
+        Drops all sessions which are idle for longer than the idle timeout.
+        """
+        with self._lock:
+            now = self._clock()
+            while self._sessions:
+                key, (_, last_activity) = next(iter(self._sessions.items()))
+                if now - last_activity <= self.idle_timeout_sec:
+                    break
+                self.log.info('Session of ' + str(key[0]) + ' timed out.')
+                self._drop(key)
+                self.timed_out += 1
+                self._notify_drop(key[0])
+
+    def clear(self):
+        with self._lock:
+            self._sessions.clear()
+            self._by_source.clear()
+
+    def _drop(self, key):
+        del self._sessions[key]
+        if self._by_source.get(key[0]) == key:
+            del self._by_source[key[0]]
+
+    def _notify_drop(self, src_ip):
+        if self.on_drop is not None:
+            self.on_drop(src_ip)
+
+    def partial_sessions(self) -> int:
+        """
+        :return: the number of sessions which were dropped before their payload was completely received.
+        """
+        return self.evicted + self.timed_out + self.replaced + self.discarded
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'active': len(self._sessions), 'opened': self.opened, 'completed': self.completed,
+                    'evicted': self.evicted, 'timed_out': self.timed_out, 'replaced': self.replaced,
+                    'discarded': self.discarded}
@@ -1,13 +1,25 @@
+import logging
+import time
 import unittest
 
 from scapy.layers.ntp import NTPHeader
 
+from bit_codec import bytes_to_bits
 from cp1_client import CP1Client
+from cp1_function_code import CP1FunctionCode
 from cp1_helper import generate_address_hash, generate_version_hash
-from cp1_package import CP1Package
+from cp1_package import CP1CarrierLayout, CP1Package
+from cp1_server import CP1Server
 from cp1_session import CP1Session
+from ntp_crypto import BatchDecryptor
+from ntp_datagram import NTPDatagram
+from ntp_mode import NTPMode
+from ntp_packet_factory import default_packet_factory
+from ntp_raw import NTPField
 from ntp_utils import bit_to_long
-from test_constants import KEY_BITS_192
+from scapy_wrapper import ScapyWrapper
+from test_constants import KEY_BITS_192, PAYLOAD_BITS_120
+from test_utils import FakeCaptureSocket
 
 _first_32_bit = '00101111111111111110111010000111'
 _last_24_bit = '000000000000000000000000'
@@ -30,6 +42,22 @@ class CP1Tests(unittest.TestCase):
         self.assertEqual(expected_hash, result_hash)
 
 
+class CP1FunctionCodeTests(unittest.TestCase):
+
+    def test_from_bit_string_all_codes_round_trip(self):
+        # Act
+        result = [CP1FunctionCode.from_bit_string(CP1FunctionCode.to_bit_string(code)) for code in CP1FunctionCode]
+
+        # Assert
+        self.assertEqual(result, list(CP1FunctionCode))
+        self.assertEqual(CP1FunctionCode.to_bit_string(CP1FunctionCode.MSG_ONE), '011')
+
+    def test_from_bit_string_invalid_value_error_raised(self):
+        # Act & Assert
+        with self.assertRaises(ValueError):
+            CP1FunctionCode.from_bit_string('0110')
+
+
 class CP1ClientTests(unittest.TestCase):
     def test_address_and_version_check_true(self):
         # Arrange
@@ -48,6 +76,299 @@ class CP1ClientTests(unittest.TestCase):
         self.assertTrue(result)
 
 
+def _cp1_packages(address: str, message: bytes) -> list:
+    """
+    :return: the init package and all payload packages of a CP1 message in their wire format.
+    """
+    session = CP1Session()
+    packages = [bytes(session.generate_init_pck(address))]
+    session.add_secret_to_send(bytes_to_bits(message), KEY_BITS_192)
+    while session.secret_to_send.has_next_bits():
+        pck = CP1Package(default_packet_factory().client_pck_bytes())
+        pck.add_payload(session.secret_to_send.next_bits(16))
+        session.disguise_payload_pck(pck)
+        packages.append(pck.to_bytes())
+    return packages
+
+
+class _ListReceiver:
+    """
+    Replaces the NTPDatagramReceiver and returns the given datagrams, afterwards None for every call.
+    """
+
+    def __init__(self, datagrams):
+        self._datagrams = list(datagrams)
+
+    def next_datagram(self, timeout=None):
+        if not self._datagrams:
+            time.sleep(timeout)
+            return None
+        return self._datagrams.pop(0)
+
+
+class _FailingReceiver:
+    """
+    Replaces the NTPDatagramReceiver of a closed socket, every call fails immediately.
+    """
+
+    def __init__(self):
+        self.calls = 0
+
+    def next_datagram(self, timeout=None):
+        self.calls += 1
+        raise OSError('Bad file descriptor')
+
+
+class _ListSender:
+    """
+    Replaces the NTPSender and keeps every sent package with its destination.
+    """
+
+    def __init__(self):
+        self.sent = []
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def send(self, payload: bytes, ip_addr: str, dst_port: int = None):
+        self.sent.append((payload, ip_addr, dst_port))
+
+
+class CP1ServerTests(unittest.TestCase):
+    def test_handle_incoming_ntp_pck_server_mode_carrier_layout_decrypted_from_three_payload_pcks(self):
+        # Arrange
+        address = '011011'
+        log = logging.getLogger('CP1ServerTests-logger')
+        layout = CP1CarrierLayout.for_mode(NTPMode.SERVER)
+        server = CP1Server(cp1_address_bits=address, static_decryption_key_bits=KEY_BITS_192,
+                           carrier_layout=layout, log=log)
+        client = CP1Client('000000', KEY_BITS_192)
+        client.carrier_layout = layout
+        packages = client.prebuild_message(address, PAYLOAD_BITS_120, NTPMode.SERVER)
+
+        # Act
+        with self.assertLogs(log, level='INFO') as logs:
+            for pck in packages:
+                server.handle_incoming_ntp_pck(pck, '10.0.0.1')
+
+        # Assert
+        self.assertEqual(len(packages), 4)
+        self.assertEqual(server.sessions.completed, 1)
+        self.assertIn(PAYLOAD_BITS_120, '\n'.join(line for line in logs.output if 'DECRYPTED Payload' in line))
+
+    def test_handle_incoming_ntp_pck_two_interleaved_senders_both_decrypted(self):
+        # Arrange
+        address = '011011'
+        log = logging.getLogger('CP1ServerTests-logger')
+        server = CP1Server(cp1_address_bits=address, static_decryption_key_bits=KEY_BITS_192, log=log)
+        senders = {'10.0.0.1': b'first message...', '10.0.0.2': b'second message..'}
+        packages = {ip: _cp1_packages(address, message) for ip, message in senders.items()}
+
+        # Act
+        with self.assertLogs(log, level='INFO') as logs:
+            for first, second in zip(packages['10.0.0.1'], packages['10.0.0.2']):
+                server.handle_incoming_ntp_pck(first, '10.0.0.1')
+                server.handle_incoming_ntp_pck(second, '10.0.0.2')
+
+        # Assert
+        for message in senders.values():
+            self.assertIn('DECRYPTED Payload: ' + bytes_to_bits(message), '\n'.join(logs.output))
+        self.assertEqual(server.sessions.completed, 2)
+
+    def test_handle_incoming_ntp_pck_stream_secret_decrypted_at_stream_end(self):
+        # Arrange
+        address = '011011'
+        log = logging.getLogger('CP1ServerTests-logger')
+        server = CP1Server(cp1_address_bits=address, static_decryption_key_bits=KEY_BITS_192, stream=True, log=log)
+        message = bytes(range(50))
+        client = CP1Client('000000', KEY_BITS_192)
+        packages = [bytes(client.create_init_pck(address))]
+        client.add_secret_stream(iter([message[:20], message[20:]]), KEY_BITS_192, length=len(message))
+        while client.has_next_pck():
+            packages.append(client.create_next_pck().to_bytes())
+
+        # Act
+        with self.assertLogs(log, level='INFO') as logs:
+            for pck in packages[:-1]:
+                server.handle_incoming_ntp_pck(pck, '10.0.0.1')
+            completed_before_end = server.sessions.completed
+            server.handle_incoming_ntp_pck(packages[-1], '10.0.0.1')
+
+        # Assert
+        self.assertEqual(len(packages), 1 + (4 + len(message)) * 8 // 16)
+        self.assertEqual(completed_before_end, 0)
+        self.assertEqual(server.sessions.completed, 1)
+        self.assertIn('DECRYPTED Stream: ' + str(message), '\n'.join(logs.output))
+
+    def test_handle_incoming_ntp_pck_stream_longer_than_max_length_session_dropped(self):
+        # Arrange
+        address = '011011'
+        server = CP1Server(cp1_address_bits=address, static_decryption_key_bits=KEY_BITS_192, stream=True,
+                           max_stream_length=16)
+        client = CP1Client('000000', KEY_BITS_192)
+        packages = [bytes(client.create_init_pck(address))]
+        client.add_secret_stream(bytes(17), KEY_BITS_192)
+        while client.has_next_pck():
+            packages.append(client.create_next_pck().to_bytes())
+
+        # Act
+        for pck in packages[:3]:
+            server.handle_incoming_ntp_pck(pck, '10.0.0.1')
+
+        # Assert
+        self.assertEqual(server.sessions.discarded, 1)
+        self.assertEqual(len(server.sessions), 0)
+        self.assertEqual(server.sessions.completed, 0)
+
+    def test_handle_incoming_ntp_pck_sender_restarts_mid_message_new_session_decrypted(self):
+        # Arrange
+        address = '011011'
+        log = logging.getLogger('CP1ServerTests-logger')
+        server = CP1Server(cp1_address_bits=address, static_decryption_key_bits=KEY_BITS_192, log=log)
+        aborted = _cp1_packages(address, b'aborted message.')
+        restarted = _cp1_packages(address, b'second attempt..')
+
+        # Act
+        with self.assertLogs(log, level='INFO') as logs:
+            for pck in aborted[:4] + restarted:
+                server.handle_incoming_ntp_pck(pck, '10.0.0.1')
+
+        # Assert
+        decrypted = [line for line in logs.output if 'DECRYPTED Payload' in line]
+        self.assertEqual(len(decrypted), 1)
+        self.assertIn(bytes_to_bits(b'second attempt..'), decrypted[0])
+        self.assertEqual(server.sessions.completed, 1)
+        self.assertEqual(server.sessions.replaced, 1)
+
+    def test_handle_incoming_ntp_pck_payload_matches_other_address_session_kept(self):
+        # Arrange
+        address = '011011'
+        other_address = '100100'
+        log = logging.getLogger('CP1ServerTests-logger')
+        server = CP1Server(cp1_address_bits=address, static_decryption_key_bits=KEY_BITS_192, log=log)
+        server.address_matcher.add_address(other_address)
+        packages = _cp1_packages(address, b'several targets')
+        # The last 8 bit of the transmit timestamp hold the hashes, the payload is in front of them.
+        collision = CP1Package(packages[3])
+        for low_bits in range(256):
+            collision.set_field_int(collision.get_field_int(NTPField.TRANSMIT_TIMESTAMP) & ~0xFF | low_bits,
+                                    NTPField.TRANSMIT_TIMESTAMP)
+            if server.address_matcher.match(collision) == (other_address,):
+                break
+        packages[3] = collision.to_bytes()
+
+        # Act
+        with self.assertLogs(log, level='INFO') as logs:
+            for pck in packages:
+                server.handle_incoming_ntp_pck(pck, '10.0.0.1')
+
+        # Assert
+        self.assertEqual(server.address_matcher.match(CP1Package(packages[3])), (other_address,))
+        self.assertIn(bytes_to_bits(b'several targets'), '\n'.join(logs.output))
+        self.assertEqual(server.sessions.replaced, 0)
+        self.assertEqual(server.sessions.completed, 1)
+
+    def test_listen_receiving_fails_repeatedly_retried_with_backoff(self):
+        # Arrange
+        receiver = _FailingReceiver()
+        server = CP1Server(cp1_address_bits='011011', static_decryption_key_bits=KEY_BITS_192, receiver=receiver,
+                           log=logging.getLogger('CP1ServerTests-logger'))
+
+        # Act
+        with self.assertLogs('CP1ServerTests-logger', level='ERROR'):
+            server.listen()
+            time.sleep(1)
+            server.stop()
+
+        # Assert
+        self.assertGreaterEqual(receiver.calls, 2)
+        self.assertLessEqual(receiver.calls, 4)  # 0.2 + 0.4 + 0.8 sec backoff
+
+    def test_listen_after_stop_capture_closed_and_reopened(self):
+        # Arrange
+        sockets = []
+
+        def factory(iface, bpf_filter):
+            sockets.append(FakeCaptureSocket([]))
+            return sockets[-1]
+        server = CP1Server(cp1_address_bits='011011', static_decryption_key_bits=KEY_BITS_192)
+        server.scapy_wrapper = ScapyWrapper(socket_factory=factory)
+
+        def listen_until_opened(num_sockets: int):
+            server.listen()
+            deadline = time.monotonic() + 5
+            while len(sockets) < num_sockets and time.monotonic() < deadline:
+                time.sleep(0.01)
+
+        # Act
+        listen_until_opened(1)
+        server.stop()
+        closed_after_stop = sockets[0].closed
+        listen_until_opened(2)
+        server.stop()
+
+        # Assert
+        self.assertTrue(closed_after_stop)
+        self.assertEqual(len(sockets), 2)
+        self.assertTrue(sockets[1].closed)
+
+    def test_listen_acknowledge_ack_sent_to_source_address_and_port(self):
+        # Arrange
+        address = '011011'
+        init_pck = _cp1_packages(address, b'acknowledge me..')[0]
+        sender = _ListSender()
+        server = CP1Server(cp1_address_bits=address, static_decryption_key_bits=KEY_BITS_192, acknowledge=True,
+                           receiver=_ListReceiver([NTPDatagram('10.0.0.1', '10.0.0.100', 40000, 123, init_pck)]),
+                           sender=sender)
+
+        # Act
+        server.listen()
+        deadline = time.monotonic() + 5
+        while not sender.sent and time.monotonic() < deadline:
+            time.sleep(0.01)
+        server.stop()
+
+        # Assert
+        self.assertEqual(len(sender.sent), 1)
+        ack, ip_addr, port = sender.sent[0]
+        self.assertEqual((ip_addr, port), ('10.0.0.1', 40000))
+        self.assertEqual(CP1Package(ack).extract_ack(), (CP1FunctionCode.ACK, 0))
+
+    def test_listen_three_workers_all_senders_decrypted_in_background(self):
+        # Arrange
+        address = '011011'
+        senders = {'10.0.0.' + str(i): bytes([65 + i]) * 16 for i in range(6)}
+        packages = {ip: _cp1_packages(address, message) for ip, message in senders.items()}
+        datagrams = [NTPDatagram(ip, '10.0.0.100', 123, 123, pcks[i])
+                     for i in range(9) for ip, pcks in packages.items()]
+        decryptor = BatchDecryptor()
+        futures = []
+        submit = decryptor.submit
+        decryptor.submit = lambda key, data: futures.append(submit(key, data)) or futures[-1]
+        decryptor.start()
+        server = CP1Server(cp1_address_bits=address, static_decryption_key_bits=KEY_BITS_192, decryptor=decryptor,
+                           receiver=_ListReceiver(datagrams))
+
+        # Act
+        started = server.listen(num_workers=3)
+        second_start = server.listen()
+        deadline = time.monotonic() + 5
+        while server.sessions.completed < len(senders) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        server.stop()
+        decryptor.stop()
+
+        # Assert
+        self.assertTrue(started)
+        self.assertFalse(second_start)
+        self.assertFalse(server.is_listening())
+        decrypted = sorted(future.result(timeout=1) for future in futures)
+        self.assertEqual(decrypted, sorted(senders.values()))
+
+
 class CP1PackageTests(unittest.TestCase):
     def test_hash_nonce(self):
         # Arrange
@@ -0,0 +1,72 @@
+import unittest
+
+from cp1_address_matcher import CP1AddressMatcher
+from cp1_helper import generate_address_hash, generate_version_hash
+from cp1_package import CP1Package
+
+_first_32_bit = '00101111111111111110111010000111'
+_last_24_bit = '000000000000000000000000'
+
+
+def _init_pck(address: str, version: str = '00') -> CP1Package:
+    pck = CP1Package()
+    hashes = generate_address_hash(_first_32_bit, address) + generate_version_hash(_first_32_bit, version)
+    pck.set_transmit_timestamp(_first_32_bit + _last_24_bit + hashes)
+    return pck
+
+
+class CP1AddressMatcherTests(unittest.TestCase):
+
+    def test_match_registered_addresses_each_address_found(self):
+        # Arrange
+        addresses = [format(i, '06b') for i in range(20)]
+        matcher = CP1AddressMatcher(addresses)
+
+        # Act
+        results = [matcher.match(_init_pck(address)) for address in addresses]
+
+        # Assert
+        for address, result in zip(addresses, results):
+            self.assertIn(address, result)
+        self.assertEqual(matcher.misses, 1)
+        self.assertEqual(matcher.hits, 19)
+
+    def test_match_unknown_address_empty_result(self):
+        # Arrange
+        matcher = CP1AddressMatcher(['011011'])
+        pck = _init_pck('011011')
+        inverted_hashes = ''.join('1' if bit == '0' else '0' for bit in pck.transmit_timestamp()[56:])
+        pck.set_transmit_timestamp(pck.transmit_timestamp()[:56] + inverted_hashes)
+
+        # Act
+        result = matcher.match(pck)
+
+        # Assert
+        self.assertEqual(result, ())
+
+    def test_match_other_version_empty_result(self):
+        # Arrange
+        matcher = CP1AddressMatcher(['011011'], version='01')
+        pck = _init_pck('011011', version='00')
+
+        # Act
+        result = matcher.match(pck)
+
+        # Assert
+        self.assertNotIn('011011', result)
+
+    def test_add_address_after_match_cache_invalidated(self):
+        # Arrange
+        matcher = CP1AddressMatcher(['011011'])
+        matcher.match(_init_pck('011011'))
+
+        # Act
+        matcher.add_address('110110')
+        result = matcher.match(_init_pck('110110'))
+
+        # Assert
+        self.assertIn('110110', result)
+
+
+if __name__ == '__main__':
+    unittest.main()
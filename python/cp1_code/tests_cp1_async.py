@@ -0,0 +1,113 @@
+import asyncio
+import logging
+import unittest
+
+from cp1_async import CP1AsyncClient, CP1AsyncServer
+from cp1_client import CP1Client
+from cp1_server import CP1Server
+from ntp_fec import ReedSolomonCode
+from test_constants import KEY_BITS_192, PAYLOAD_BITS_120
+
+
+class CP1AsyncTests(unittest.TestCase):
+
+    def test_send_message_many_concurrent_clients_all_messages_decrypted(self):
+        # Arrange
+        address = '011011'
+        log = logging.getLogger('CP1AsyncTests-logger')
+        server = CP1Server(cp1_address_bits=address, static_decryption_key_bits=KEY_BITS_192, log=log)
+        async_server = CP1AsyncServer(server, local_addr=('127.0.0.1', 0))
+
+        async def run():
+            await async_server.start()
+            clients = [CP1AsyncClient(CP1Client(address='000000', static_key=KEY_BITS_192), async_server.local_addr)
+                       for _ in range(20)]
+            await asyncio.gather(*(client.send_message(address, PAYLOAD_BITS_120, interval_sec=0.001)
+                                   for client in clients))
+            for _ in range(200):
+                if server.sessions.completed >= len(clients):
+                    break
+                await asyncio.sleep(0.01)
+            async_server.close()
+
+        # Act
+        with self.assertLogs(log, level='INFO') as logs:
+            asyncio.run(run())
+
+        # Assert
+        decrypted = [line for line in logs.output if 'DECRYPTED Payload' in line]
+        self.assertEqual(len(decrypted), 20)
+        self.assertEqual(server.sessions.completed, 20)
+        self.assertEqual(server.sessions.partial_sessions(), 0)
+
+    def test_send_message_acknowledged_lossy_path_message_completely_received(self):
+        # Arrange
+        address = '011011'
+        log = logging.getLogger('CP1AsyncTests-logger')
+        server = CP1Server(cp1_address_bits=address, static_decryption_key_bits=KEY_BITS_192, acknowledge=True,
+                           log=log)
+        async_server = CP1AsyncServer(server, local_addr=('127.0.0.1', 0))
+        received = []
+        handle = async_server._handle
+
+        def lossy_handle(data, peer):
+            received.append(data)
+            if len(received) % 3 == 0:  # Every third package is lost.
+                return None
+            return handle(data, peer)
+
+        async_server._handle = lossy_handle
+
+        async def run():
+            await async_server.start()
+            client = CP1AsyncClient(CP1Client(address='000000', static_key=KEY_BITS_192), async_server.local_addr)
+            result = await client.send_message_acknowledged(address, PAYLOAD_BITS_120, timeout_sec=0.05)
+            async_server.close()
+            return result
+
+        # Act
+        with self.assertLogs(log, level='INFO') as logs:
+            result = asyncio.run(run())
+
+        # Assert
+        self.assertTrue(result)
+        self.assertEqual(server.sessions.completed, 1)
+        self.assertEqual(len([line for line in logs.output if 'DECRYPTED Payload' in line]), 1)
+
+    def test_send_message_fec_chunks_lost_message_restored_without_answers(self):
+        # Arrange
+        address = '011011'
+        log = logging.getLogger('CP1AsyncTests-logger')
+        fec = ReedSolomonCode(8, 12)
+        server = CP1Server(cp1_address_bits=address, static_decryption_key_bits=KEY_BITS_192, fec=fec, log=log)
+        async_server = CP1AsyncServer(server, local_addr=('127.0.0.1', 0), respond=False)
+        received = []
+        handle = async_server._handle
+
+        def lossy_handle(data, peer):
+            received.append(data)
+            if len(received) in (2, 5, 9, 12):  # Four of the twelve chunks are lost.
+                return None
+            return handle(data, peer)
+
+        async_server._handle = lossy_handle
+
+        async def run():
+            await async_server.start()
+            client = CP1AsyncClient(CP1Client(address='000000', static_key=KEY_BITS_192), async_server.local_addr)
+            await client.send_message_fec(address, PAYLOAD_BITS_120, fec)
+            while len(received) < 13:
+                await asyncio.sleep(0.01)
+            async_server.close()
+
+        # Act
+        with self.assertLogs(log, level='INFO') as logs:
+            asyncio.run(asyncio.wait_for(run(), 5))
+
+        # Assert
+        self.assertEqual(server.sessions.completed, 1)
+        self.assertEqual(len([line for line in logs.output if 'DECRYPTED Payload' in line]), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
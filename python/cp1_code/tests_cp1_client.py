@@ -1,7 +1,12 @@
+import socket
 import unittest
 
 from cp1_client import CP1Client
+from cp1_server import CP1Server
 from cp1_session import CP1Session
+from ntp_raw import NTPField, RawNTP
+from ntp_sender import NTPSender
+from ntp_timestamp import ntp_timestamp_now
 from test_constants import PAYLOAD_BITS_120, KEY_BITS_192
 
 
@@ -19,6 +24,50 @@ class CP1ClientTests(unittest.TestCase):
         # Assert
         self.assertEqual(client.send_session.secret_to_send.total_payload_length, 128)
 
+    def test_send_message_udp_sender_all_packages_received_and_decoded(self):
+        # Arrange
+        receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        receiver.bind(('127.0.0.1', 0))
+        receiver.settimeout(2)
+        address = '011011'
+        sender = NTPSender(dst_port=receiver.getsockname()[1])
+        client = CP1Client('000000', KEY_BITS_192, sender=sender)
+        server = CP1Server(cp1_address_bits=address, static_decryption_key_bits=KEY_BITS_192)
+
+        # Act
+        client.send_message('127.0.0.1', address, PAYLOAD_BITS_120)
+        for _ in range(sender.packets_sent):
+            server.handle_incoming_ntp_pck(receiver.recvfrom(1024)[0])
+        sender.close()
+        receiver.close()
+
+        # Assert
+        self.assertEqual(sender.packets_sent, 1 + 128 // client.payload_size)
+        self.assertEqual(server.sessions.completed, 1)
+
+    def test_send_message_paced_transmit_timestamps_taken_at_send_time(self):
+        # Arrange
+        receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        receiver.bind(('127.0.0.1', 0))
+        receiver.settimeout(2)
+        sender = NTPSender(dst_port=receiver.getsockname()[1])
+        client = CP1Client('000000', KEY_BITS_192, sender=sender)
+
+        # Act
+        client.send_message('127.0.0.1', '011011', PAYLOAD_BITS_120, interval_sec=0.05)
+        received = ntp_timestamp_now()
+        transmits = [RawNTP(receiver.recvfrom(1024)[0]).get_field_int(NTPField.TRANSMIT_TIMESTAMP)
+                     for _ in range(sender.packets_sent)]
+        sender.close()
+        receiver.close()
+
+        # Assert
+        self.assertEqual(len(transmits), 1 + 128 // client.payload_size)
+        # Prebuilt packages would carry almost the same time, all of them before the first one was sent.
+        gaps = [(second - first) / (1 << 32) for first, second in zip(transmits, transmits[1:])]
+        self.assertGreater(min(gaps), 0.03)
+        self.assertLess((received - transmits[-1]) / (1 << 32), 0.05)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,8 +1,10 @@
+import logging
 import unittest
 
 from cp1_client_session import CP1ClientSession
 from cp1_package import CP1Package
 from ntp_crypto import NTPCrypto
+from ntp_fec import ReedSolomonCode
 from test_constants import KEY_BITS_192
 
 
@@ -32,3 +34,25 @@ class CP1ClientSessionTests(unittest.TestCase):
 
         # Assert
         self.assertEqual(result, comparing_result)
+
+    def test_add_indexed_pck_index_beyond_fec_chunk_dropped(self):
+        # Arrange
+        log = logging.getLogger('CP1ClientSessionTests-logger')
+        session = CP1ClientSession(KEY_BITS_192, CP1Package(), fec=ReedSolomonCode(8, 12), log=log)
+        packages = []
+        for index in [13] + list(range(8)):
+            pck = CP1Package()
+            pck.add_payload(format(index, '016b'))
+            pck.add_chunk_index(index)
+            packages.append(pck)
+
+        # Act
+        with self.assertLogs(log, level='WARNING'):
+            session.add_indexed_pck(packages[0])
+        for pck in packages[1:]:
+            session.add_indexed_pck(pck)
+
+        # Assert
+        self.assertTrue(session.is_complete())
+        self.assertEqual(session.ack_bitmap(), 0xFF)
+        self.assertEqual(session.secret_received_in_bits, ''.join(format(i, '016b') for i in range(8)))
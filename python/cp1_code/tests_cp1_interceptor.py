@@ -0,0 +1,116 @@
+import logging
+import unittest
+
+from scapy.layers.inet import IP, UDP
+from scapy.layers.ntp import NTP
+
+from bit_codec import bytes_to_bits
+from cp1_interceptor import CP1Interceptor
+from cp1_server import CP1Server
+from cp1_session_table import CP1SessionTable
+from ntp_raw import RawNTP
+from test_constants import KEY_BITS_192
+from test_utils import FakeClock
+
+_ADDRESS = '011011'
+
+
+class _LocalTimeSource:
+    """
+    Replaces the UpstreamTimeSource, every answer is a copy of the request.
+    """
+
+    def response(self, request: bytes = None) -> RawNTP:
+        return RawNTP.from_bytes(request)
+
+
+class CP1InterceptorTests(unittest.TestCase):
+
+    def setUp(self):
+        self.interceptor = CP1Interceptor(address='000000', static_key=KEY_BITS_192, client_address=_ADDRESS,
+                                          time_source=_LocalTimeSource())
+        self.sent = []
+        self.interceptor.scapy_wrapper.send = self.sent.append
+
+    def _request(self, client_ip: str, sport: int = 123):
+        return IP(src=client_ip, dst='10.0.0.100') / UDP(sport=sport, dport=123) / NTP()
+
+    def test_handle_incoming_pck_two_interleaved_clients_both_receive_own_message(self):
+        # Arrange
+        log = logging.getLogger('CP1InterceptorTests-logger')
+        server = CP1Server(cp1_address_bits=_ADDRESS, static_decryption_key_bits=KEY_BITS_192, log=log)
+        messages = {'10.0.0.1': bytes_to_bits(b'first message..')[:120],
+                    '10.0.0.2': bytes_to_bits(b'second message.')[:120]}
+        for client_ip, message in messages.items():
+            self.interceptor.add_payload((client_ip, 123), message)
+
+        # Act
+        for _ in range(9):
+            for client_ip in messages:
+                self.interceptor.handle_incoming_pck(self._request(client_ip))
+        with self.assertLogs(log, level='INFO') as logs:
+            for answer in self.sent:
+                server.handle_incoming_ntp_pck(bytes(answer[NTP]), answer[IP].dst)
+
+        # Assert
+        output = '\n'.join(line for line in logs.output if 'DECRYPTED Payload' in line)
+        for message in messages.values():
+            self.assertIn(message, output)
+        self.assertEqual(server.sessions.completed, 2)
+        self.assertEqual(self.interceptor.sessions.completed, 2)
+
+    def test_handle_incoming_pck_same_ip_other_port_separate_session(self):
+        # Act
+        self.interceptor.handle_incoming_pck(self._request('10.0.0.1', 40000))
+        self.interceptor.handle_incoming_pck(self._request('10.0.0.1', 40001))
+
+        # Assert
+        self.assertEqual(self.interceptor.sessions.opened, 2)
+        self.assertEqual(len(self.interceptor.sessions), 2)
+
+    def test_handle_incoming_pck_max_sessions_reached_oldest_evicted(self):
+        # Arrange
+        self.interceptor.sessions.max_sessions = 2
+
+        # Act
+        for client_ip in ('10.0.0.1', '10.0.0.2', '10.0.0.3'):
+            self.interceptor.handle_incoming_pck(self._request(client_ip))
+
+        # Assert
+        self.assertEqual(len(self.interceptor.sessions), 2)
+        self.assertEqual(self.interceptor.sessions.evicted, 1)
+        self.assertIsNone(self.interceptor.sessions.lookup(('10.0.0.1', 123)))
+
+    def test_handle_incoming_pck_session_timed_out_queued_payloads_dropped(self):
+        # Arrange
+        clock = FakeClock(0.0)
+        interceptor = CP1Interceptor(address='000000', static_key=KEY_BITS_192, client_address=_ADDRESS,
+                                     time_source=_LocalTimeSource(),
+                                     sessions=CP1SessionTable(idle_timeout_sec=5, clock=clock))
+        interceptor.scapy_wrapper.send = self.sent.append
+        for _ in range(3):
+            interceptor.add_payload(('10.0.0.1', 123), bytes_to_bits(b'queued message.')[:120])
+        interceptor.handle_incoming_pck(self._request('10.0.0.1'))
+        clock.now = 6
+
+        # Act
+        interceptor.handle_incoming_pck(self._request('10.0.0.2'))
+
+        # Assert
+        self.assertEqual(interceptor.sessions.timed_out, 1)
+        self.assertNotIn(('10.0.0.1', 123), interceptor._payloads)
+
+    def test_add_payload_more_clients_than_max_sessions_oldest_queue_dropped(self):
+        # Arrange
+        self.interceptor.sessions.max_sessions = 2
+
+        # Act
+        for client_ip in ('10.0.0.1', '10.0.0.2', '10.0.0.3'):
+            self.interceptor.add_payload((client_ip, 123), bytes_to_bits(b'queued message.')[:120])
+
+        # Assert
+        self.assertEqual(list(self.interceptor._payloads), [('10.0.0.2', 123), ('10.0.0.3', 123)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,8 @@
 import logging
 import unittest
 
-from cp1_package import CP1Package
+from cp1_package import CP1CarrierLayout, CP1CarrierSlot, CP1Package
+from ntp_mode import NTPMode
 from ntp_raw import NTPField
 
 
@@ -42,6 +43,35 @@ class CP1PackageTests(unittest.TestCase):
         # Assert
         self.assertEqual(result, payload)
 
+    def test_add_payload_layout_extract_payload_same_layout_payload_restored(self):
+        # Arrange
+        layout = CP1CarrierLayout([CP1CarrierSlot(NTPField.TRANSMIT_TIMESTAMP, 40, 16),
+                                   CP1CarrierSlot(NTPField.RECEIVE_TIMESTAMP, 44, 20)])
+        payload = '10' * 18
+        pck = CP1Package()
+
+        # Act
+        pck.add_payload(payload, layout=layout)
+        result = pck.extract_payload(layout=layout)
+
+        # Assert
+        self.assertEqual(result, payload)
+        self.assertEqual(pck.extract_payload(), payload[:16])
+        self.assertEqual(pck.get_field(NTPField.RECEIVE_TIMESTAMP)[44:], payload[16:])
+
+    def test_for_mode_server_origin_timestamp_not_used(self):
+        # Act
+        layout = CP1CarrierLayout.for_mode(NTPMode.SERVER, field_budget=20)
+
+        # Assert
+        self.assertNotIn(NTPField.ORIGIN_TIMESTAMP, layout.fields())
+        self.assertEqual(layout.capacity, 60)
+
+    def test_init_slot_in_seconds_part_raises(self):
+        # Act, Assert
+        with self.assertRaises(AssertionError):
+            CP1CarrierLayout([CP1CarrierSlot(NTPField.TRANSMIT_TIMESTAMP, 24, 16)])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,7 +1,23 @@
 import unittest
 
+from cp1_address_matcher import CP1AddressMatcher
 from cp1_package import CP1Package
 from cp1_session import CP1Session
+from ntp_raw import NTPField
+from test_constants import KEY_BITS_192
+
+
+def _with_transmit(pck: CP1Package, transmit: int) -> CP1Package:
+    pck.set_field_int(transmit, NTPField.TRANSMIT_TIMESTAMP)
+    return pck
+
+
+def _acknowledged_session(window_size: int) -> CP1Session:
+    session = CP1Session()
+    session.generate_init_pck('011011')
+    session.add_secret_to_send('01' * 64, KEY_BITS_192)
+    session.enable_acknowledgement(payload_size=16, window_size=window_size)
+    return session
 
 
 class CP1SessionTests(unittest.TestCase):
@@ -33,6 +49,86 @@ class CP1SessionTests(unittest.TestCase):
         # Assert
         self.assertTrue(result)
 
+    def test_add_stream_to_send_no_init_pck_value_error(self):
+        # Arrange
+        session = CP1Session()
+
+        # Act & Assert
+        with self.assertRaises(ValueError):
+            session.add_stream_to_send(b'message', KEY_BITS_192)
+
+    def test_disguise_payload_pck_matches_init_hash_no_match_afterwards(self):
+        # Arrange
+        session = CP1Session()
+        session.generate_init_pck('011011')
+        matcher = CP1AddressMatcher(['011011'])
+        pck = CP1Package()
+        pck.add_payload('1010101010101010')
+        transmit = pck.get_field_int(NTPField.TRANSMIT_TIMESTAMP) & ~0xFF
+        matching = next(transmit | i for i in range(256) if matcher.match(_with_transmit(pck, transmit | i)))
+        pck = _with_transmit(pck, matching)
+
+        # Act
+        session.disguise_payload_pck(pck)
+
+        # Assert
+        self.assertEqual(matcher.match(pck), ())
+        self.assertEqual(pck.get_field_int(NTPField.TRANSMIT_TIMESTAMP), matching ^ 1)
+        self.assertEqual(pck.extract_payload(), '1010101010101010')
+
+    def test_next_chunk_window_exhausted_none_returned(self):
+        # Arrange
+        session = _acknowledged_session(window_size=3)
+
+        # Act
+        indices = [session.next_chunk()[0] for _ in range(3)]
+        result = session.next_chunk()
+
+        # Assert
+        self.assertEqual(indices, [0, 1, 2])
+        self.assertIsNone(result)
+
+    def test_handle_ack_gap_in_bitmap_only_missing_chunk_resent_and_window_moved(self):
+        # Arrange
+        session = _acknowledged_session(window_size=3)
+        for _ in range(3):
+            session.next_chunk()
+
+        # Act
+        session.handle_ack(0b101)
+        indices = [session.next_chunk()[0] for _ in range(3)]
+
+        # Assert
+        self.assertEqual(indices, [1, 3, 4])
+        self.assertIsNone(session.next_chunk())
+
+    def test_retransmit_unacknowledged_timeout_window_sent_again(self):
+        # Arrange
+        session = _acknowledged_session(window_size=2)
+        session.next_chunk()
+        session.next_chunk()
+
+        # Act
+        session.retransmit_unacknowledged()
+        result = session.next_chunk()
+
+        # Assert
+        self.assertEqual(result[0], 0)
+
+    def test_is_acknowledged_all_chunks_acknowledged_true_returned(self):
+        # Arrange
+        session = _acknowledged_session(window_size=8)
+
+        # Act
+        session.handle_ack(0b01111111)
+        partial = session.is_acknowledged()
+        session.handle_ack(0b11111111)
+        complete = session.is_acknowledged()
+
+        # Assert
+        self.assertFalse(partial)
+        self.assertTrue(complete)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,84 @@
+import unittest
+
+from cp1_session_table import CP1SessionTable
+from test_utils import FakeClock
+
+
+class CP1SessionTableTests(unittest.TestCase):
+
+    def test_lookup_two_sources_own_session_returned(self):
+        # Arrange
+        table = CP1SessionTable()
+        table.open('10.0.0.1', 'nonce-1', 'session-1')
+        table.open('10.0.0.2', 'nonce-2', 'session-2')
+
+        # Act
+        first = table.lookup('10.0.0.1')
+        second = table.lookup('10.0.0.2')
+        unknown = table.lookup('10.0.0.3')
+
+        # Assert
+        self.assertEqual(first, 'session-1')
+        self.assertEqual(second, 'session-2')
+        self.assertIsNone(unknown)
+
+    def test_lookup_idle_timeout_exceeded_none_returned(self):
+        # Arrange
+        clock = FakeClock(0.0)
+        table = CP1SessionTable(idle_timeout_sec=5, clock=clock)
+        table.open('10.0.0.1', 'nonce-1', 'session-1')
+        clock.now = 6
+
+        # Act
+        result = table.lookup('10.0.0.1')
+
+        # Assert
+        self.assertIsNone(result)
+        self.assertEqual(table.timed_out, 1)
+        self.assertEqual(len(table), 0)
+
+    def test_open_max_sessions_reached_least_recently_active_evicted(self):
+        # Arrange
+        table = CP1SessionTable(max_sessions=2)
+        table.open('10.0.0.1', 'nonce-1', 'session-1')
+        table.open('10.0.0.2', 'nonce-2', 'session-2')
+        table.lookup('10.0.0.1')
+
+        # Act
+        table.open('10.0.0.3', 'nonce-3', 'session-3')
+
+        # Assert
+        self.assertIsNone(table.lookup('10.0.0.2'))
+        self.assertEqual(table.lookup('10.0.0.1'), 'session-1')
+        self.assertEqual(table.evicted, 1)
+        self.assertEqual(table.partial_sessions(), 1)
+
+    def test_open_same_source_unfinished_session_replaced(self):
+        # Arrange
+        table = CP1SessionTable()
+        table.open('10.0.0.1', 'nonce-1', 'session-1')
+
+        # Act
+        table.open('10.0.0.1', 'nonce-2', 'session-2')
+
+        # Assert
+        self.assertEqual(table.lookup('10.0.0.1'), 'session-2')
+        self.assertEqual(table.stats()['replaced'], 1)
+        self.assertEqual(len(table), 1)
+
+    def test_close_completed_session_removed_and_counted(self):
+        # Arrange
+        table = CP1SessionTable()
+        table.open('10.0.0.1', 'nonce-1', 'session-1')
+
+        # Act
+        table.close('10.0.0.1')
+
+        # Assert
+        self.assertIsNone(table.lookup('10.0.0.1'))
+        self.assertEqual(table.completed, 1)
+        self.assertEqual(table.partial_sessions(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,11 +2,12 @@ import logging
 
 from scapy.layers.ntp import NTP
 from scapy.packet import Packet
-from scapy.sendrecv import sniff
 
+from bit_codec import BitStreamDecoder
+from capture_source import CaptureSource
 from cp2_common_secret import CP2_ONE_BITS, CP2_ZERO_BITS, CP2_NO_BITS
 from log_utils import file_logger
-from ntp_utils import bit_to_ascii
+from ntp_datagram import NTPDatagramReceiver
 
 
 class CP2Client:
@@ -14,8 +15,11 @@ class CP2Client:
     Describes a secret client that uses the alteration of the stratum value to read secret information.
     """
 
-    def __init__(self, sniff_interface='lo', server_ip: str = '1.1.1.1',
+    def __init__(self, sniff_interface='lo', server_ip: str = '1.1.1.1', receiver: NTPDatagramReceiver = None,
                  log: logging.Logger = logging.getLogger("CP2Client-logger")):
+        """
+        :param receiver: an optional NTPDatagramReceiver, which receives the packages without scapy.
+        """
         self.sniff_interface = sniff_interface
         self.msg_bit_string = ''
         self.no_bits = CP2_NO_BITS
@@ -23,16 +27,18 @@ class CP2Client:
         self.one_bits = CP2_ONE_BITS
         self.last_stratum = 0
         self.complete_msg = ''
+        self.received_bytes = bytearray()
+        self._decoder = BitStreamDecoder()
         self.log = log
         self.server_ip = server_ip
+        self.capture: CaptureSource = None  # Created on first use, only needed without a receiver.
+        self.receiver = receiver
 
     def run(self):
         self.log.info("Starting CP2 client, listening on interface: " + str(self.sniff_interface))
         while True:
             # Wait for the next incoming NTP package
-            pck = self.next_ntp_packet()
-            ntp_pck = pck[NTP]
-            stratum = ntp_pck.stratum
+            stratum = self.next_stratum()
             self.log.info("NTP package with stratum " + str(stratum) + " received.")
             self.handle_stratum(stratum)
 
@@ -75,7 +81,9 @@ class CP2Client:
         # Case: The bit message is filled.
         if len(self.msg_bit_string) == 8:
             self.log.info("Message received (bin): " + self.msg_bit_string)
-            self.log.info("Message received (char): " + str(bit_to_ascii(self.msg_bit_string)))
+            received_byte = self._decoder.feed(self.msg_bit_string)
+            self.received_bytes += received_byte
+            self.log.info("Message received (char): " + str(received_byte.decode(errors='replace')))
             self.complete_msg = self.msg_bit_string
             self.__client_reset()
             return
@@ -87,14 +95,26 @@ class CP2Client:
         self.msg_bit_string = ''
         return
 
+    def next_stratum(self) -> int:
+        """
+        Waits for the next NTP package of the server. This method is blocking.
+        :return: the stratum of the package.
+        """
+        if self.receiver is None:
+            return self.next_ntp_packet()[NTP].stratum
+        while True:
+            datagram = self.receiver.next_datagram()
+            if datagram.src_ip == self.server_ip and len(datagram.payload) > 1:
+                return datagram.payload[1]
+
     def next_ntp_packet(self) -> Packet:
         """
         Sniffs for the next incoming ntp package. This method is blocking
         :return: the sniffed package.
         """
-        results = sniff(filter='udp and port 123 and src ' + str(self.server_ip), count=1, iface=self.sniff_interface)
-        pck = (results[0])
-        return pck
+        if self.capture is None:
+            self.capture = CaptureSource(self.sniff_interface, 'udp and port 123 and src ' + str(self.server_ip))
+        return self.capture.next_packet()
 
 
 if __name__ == '__main__':
@@ -12,6 +12,7 @@ class CP2Tests(unittest.TestCase):
         # Assert
         self.assertEqual('', client.msg_bit_string)
         self.assertEqual(0, client.last_stratum)
+        self.assertIsNone(client.capture)
 
     def test_complete_msg_correctly_filled(self):
         # Arrange
@@ -0,0 +1,85 @@
+import asyncio
+import logging
+
+from cp3_handler import CP3Handler
+from cp3_package import CP3Mode, CP3Package
+from ntp_mode import NTPMode
+from ntp_udp_transport import NTP_PORT, NTPDatagramProtocol, create_ntp_endpoint, ntp_server_response
+
+
+class CP3AsyncServer:
+    """
+    Receives CP3 messages on an ordinary UDP socket in an asyncio event loop instead of sniffing with scapy. The
+    first halves of the messages are kept per peer (ip, port), so any number of clients can send concurrently.
+    """
+
+    def __init__(self, handler: CP3Handler, local_addr=('0.0.0.0', NTP_PORT), respond: bool = True, on_message=None,
+                 log: logging.Logger = logging.getLogger('CP3AsyncServer-logger')):
+        """
+        :param handler: holds the static key and decrypts the messages.
+        :param local_addr: (ip, port) to listen on.
+        :param respond: whether every request is answered like by a regular NTP server.
+        :param on_message: an optional callable (peer, decrypted bytes) called for every received message.
+        :param log:
+        """
+        self.log = log
+        self.handler = handler
+        self.local_addr = local_addr
+        self.respond = respond
+        self.on_message = on_message
+        self.pending = {}  # peer -> payload bits of its last mode 1 package
+        self.protocol: NTPDatagramProtocol = None
+
+    async def start(self):
+        self.protocol = await create_ntp_endpoint(self._handle, local_addr=self.local_addr, log=self.log)
+        self.local_addr = self.protocol.transport.get_extra_info('sockname')
+        self.log.info('Listening for CP3 packages on ' + str(self.local_addr))
+
+    def _handle(self, data: bytes, peer) -> bytes:
+        pck = CP3Package(data)
+        mode = pck.get_cp3_mode()
+        if mode is CP3Mode.PCK_1:
+            self.pending[peer] = pck.extract_payload()
+        elif mode is CP3Mode.PCK_2 and peer in self.pending:
+            msg = self.pending.pop(peer) + pck.extract_payload()
+            on_decrypted = None if self.on_message is None else (lambda decrypted: self.on_message(peer, decrypted))
+            self.handler.decrypt_msg(msg, on_decrypted)
+        return ntp_server_response(data) if self.respond else None
+
+    def close(self):
+        if self.protocol is not None:
+            self.protocol.close()
+            self.protocol = None
+
+
+class CP3AsyncClient:
+    """
+    Sends CP3 messages over an ordinary UDP socket in an asyncio event loop.
+    """
+
+    def __init__(self, handler: CP3Handler, remote_addr,
+                 log: logging.Logger = logging.getLogger('CP3AsyncClient-logger')):
+        """
+        :param handler: creates the packages.
+        :param remote_addr: (ip, port) of the CP3 server.
+        :param log:
+        """
+        self.log = log
+        self.handler = handler
+        self.remote_addr = remote_addr
+
+    async def send_message(self, payload_bits: str, interval_sec: float = 0, ntp_mode: NTPMode = NTPMode.CLIENT):
+        """
+        Sends the 128 bit message as a mode 1 and a mode 2 package.
+        :param payload_bits: the encrypted message.
+        :param interval_sec: the time to wait between both packages, other peers are served meanwhile.
+        :param ntp_mode:
+        """
+        assert len(payload_bits) == 128
+        protocol = await create_ntp_endpoint(remote_addr=self.remote_addr, log=self.log)
+        try:
+            protocol.send(bytes(self.handler.create_cp3_pck(payload_bits[:64], CP3Mode.PCK_1, ntp_mode)))
+            await asyncio.sleep(interval_sec)
+            protocol.send(bytes(self.handler.create_cp3_pck(payload_bits[64:], CP3Mode.PCK_2, ntp_mode)))
+        finally:
+            protocol.close()
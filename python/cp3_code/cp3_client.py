@@ -17,7 +17,7 @@ class CP3Client(CP3Handler):
         :param static_key_bits:
         :param log:
         """
-        super().__init__(static_key_bits, log)
+        super().__init__(static_key_bits, log=log)
         self.log = log
         self.send_interval_sec = send_interval_sec
         self.send_interval_between_pck_sec = send_interval_between_pck_sec
@@ -1,32 +1,61 @@
 import logging
+import time
 from datetime import datetime
+from functools import partial
 
 import ntplib
-from bitstring import BitArray
 from scapy.layers.inet import IP, UDP
 from scapy.layers.ntp import NTP
 
+from bit_codec import bits_to_bytes, bytes_to_bits
 from cp3_package import CP3Package, CP3Mode
-from ntp_crypto import decrypt_bits
+from ntp_crypto import BatchDecryptor, decrypt_bits, MAX_STREAM_LENGTH, NTPStreamReceiver, NTPStreamSecret, \
+    stream_with_header
 from ntp_mode import NTPMode
+from ntp_sender import NTPSender
 from scapy_wrapper import ScapyWrapper
 
 
 class CP3Handler:
 
-    def __init__(self, static_key_bits: str, log: logging.Logger = logging.getLogger('CP3Handler-logger')):
+    def __init__(self, static_key_bits: str, log: logging.Logger = logging.getLogger('CP3Handler-logger'),
+                 decryptor: BatchDecryptor = None, sender: NTPSender = None, stream: bool = False,
+                 max_stream_length: int = MAX_STREAM_LENGTH):
         """
         The core of every CP3 server and client. Provides functions to work with packages and process them.
         :param static_key_bits:
         :param log:
+        :param decryptor: an optional (started) BatchDecryptor, received messages are then decrypted on its worker
+        thread instead of the receiving thread.
+        :param sender: sends the packages over a kept socket. If not set, every package is sent with scapy.
+        :param stream: whether the received packages carry stream secrets (see send_stream) instead of 128 bit
+        messages.
+        :param max_stream_length: received streams announcing more bytes are dropped.
         """
         self.log = log
+        self.decryptor = decryptor
+        self.sender = sender
+        self.stream = stream
+        self.max_stream_length = max_stream_length
+        self._stream_receiver: NTPStreamReceiver = None
         self.static_key_bits = static_key_bits
         self.msg: str = ''
         self.scappy_wrapper = ScapyWrapper()
 
+    @property
+    def static_key_bits(self) -> str:
+        return self._static_key_bits
+
+    @static_key_bits.setter
+    def static_key_bits(self, static_key_bits: str):
+        # The key is converted once, instead of for every received message.
+        self._static_key_bits = static_key_bits
+        self._static_key_bytes = bits_to_bytes(static_key_bits)
+
     def read_incoming_pck(self, pck: CP3Package) -> bool:
         mode = pck.get_cp3_mode()
+        if self.stream:
+            return self.read_stream_payload(pck.extract_payload(), mode)
         if mode is CP3Mode.PCK_1:
             self.msg = pck.extract_payload()
             self.log.debug("CP3_Mode_1 package received and payload set: " + self.msg)
@@ -34,13 +63,64 @@ class CP3Handler:
         elif mode is CP3Mode.PCK_2:
             self.msg += pck.extract_payload()
             self.log.debug("CP3_Mode_1 package received and complete payload now: " + self.msg)
-            decrypted_bytes = decrypt_bits(self.msg, BitArray(bin=self.static_key_bits).bytes)
-            self.log.info("Decrypted payload: " + str(decrypted_bytes))
+            self.decrypt_msg(self.msg)
             return True
         else:
             self.log.debug("Package had no corresponding CP3 mode")
             return False
 
+    def read_stream_payload(self, payload_bits: str, cp3_mode: CP3Mode, on_decrypted=None) -> bool:
+        """
+        Handles the payload of a received package of a stream (see stream_payloads): a mode 1 package starts a new
+        stream with the nonce it carries, the following mode 2 packages are decrypted while they arrive until the
+        length announced by the stream is reached.
+        :param payload_bits: the 64 payload bits of the package.
+        :param cp3_mode: the CP3 mode of the package.
+        :param on_decrypted: an optional callable, which is called with the decrypted message.
+        :return: False in case the package is not part of a stream.
+        """
+        if cp3_mode is CP3Mode.NONE:
+            self.log.debug("Package had no corresponding CP3 mode")
+            return False
+        if cp3_mode is CP3Mode.PCK_1:
+            self._stream_receiver = NTPStreamReceiver(self._static_key_bytes, bits_to_bytes(payload_bits),
+                                                      self.max_stream_length)
+            self.log.debug("CP3 stream started.")
+            return True
+        if self._stream_receiver is None:
+            self.log.debug("CP3 mode 2 package received without a stream in progress.")
+            return False
+        try:
+            self._stream_receiver.feed(payload_bits)
+        except ValueError as e:
+            self.log.warning("CP3 stream dropped: " + str(e))
+            self._stream_receiver = None
+            return True
+        if self._stream_receiver.is_complete():
+            message = self._stream_receiver.message()
+            self._stream_receiver = None
+            self.log.info("Decrypted stream: " + str(message))
+            if on_decrypted is not None:
+                on_decrypted(message)
+        return True
+
+    def decrypt_msg(self, msg: str, on_decrypted=None):
+        """
+        Decrypts and logs a completely received message, on the worker thread of the decryptor if there is one.
+        :param msg: the 128 payload bits of a mode 1 and mode 2 package.
+        :param on_decrypted: an optional callable, which is called with the decrypted bytes.
+        """
+        def handle(decrypted_bytes: bytes):
+            self.log.info("Decrypted payload: " + str(decrypted_bytes))
+            if on_decrypted is not None:
+                on_decrypted(decrypted_bytes)
+
+        if self.decryptor is None:
+            handle(decrypt_bits(msg, self._static_key_bytes))
+        else:
+            future = self.decryptor.submit(self._static_key_bytes, bits_to_bytes(msg))
+            future.add_done_callback(lambda f: handle(f.result()))
+
     def create_cp3_pck(self, payload_bits: str, cp3_mode: CP3Mode, ntp_mode: NTPMode) -> NTP:
         assert len(payload_bits) == 64
 
@@ -59,8 +139,10 @@ class CP3Handler:
         ntp = self.create_cp3_pck(payload_bits, cp3_mode, ntp_mode)
         self.log.debug("Sending of NTP Mode " + str(cp3_mode) + " package with payload: "
                        + payload_bits + " to " + str(ip_addr))
-        self.scappy_wrapper.send(IP(dst=ip_addr) / UDP() / ntp)
-
+        if self.sender is None:
+            self.scappy_wrapper.send(IP(dst=ip_addr) / UDP() / ntp)
+        else:
+            self.sender.send(bytes(ntp), ip_addr)
 
     def send_pck_1(self, payload_bits: str, ip_addr: str, ntp_mode: NTPMode = NTPMode.CLIENT):
         self._send_cp3_pck(payload_bits, ip_addr, CP3Mode.PCK_1, ntp_mode)
@@ -68,6 +150,69 @@ class CP3Handler:
     def send_pck_2(self, payload_bits: str, ip_addr: str, ntp_mode: NTPMode = NTPMode.CLIENT):
         self._send_cp3_pck(payload_bits, ip_addr, CP3Mode.PCK_2, ntp_mode)
 
+    def create_stream_secret(self, message, length: int = None) -> NTPStreamSecret:
+        """
+        Creates the secret of a message of arbitrary length for send_stream: the message is prefixed with its length
+        (see stream_with_header) and encrypted with the static key under a random nonce, which is sent first.
+        :param message: the message as str, bytes or an iterable of bytes chunks.
+        :param length: the length of the message in bytes, only needed for an iterable of chunks.
+        """
+        return NTPStreamSecret(stream_with_header(message, length), self._static_key_bytes)
+
+    def send_stream(self, secret: NTPStreamSecret, ip_addr: str, interval_sec: float = 0,
+                    ntp_mode: NTPMode = NTPMode.CLIENT):
+        """
+        Sends a stream secret (see create_stream_secret) as a CP3 mode 1 package followed by mode 2 packages, 64 bits
+        per package (see stream_payloads). The last package is padded with 0 bits. The receiver needs stream=True.
+        :param secret: the secret created by create_stream_secret.
+        :param ip_addr:
+        :param interval_sec: the time to wait between two packages.
+        :param ntp_mode:
+        """
+        if self.sender is not None:
+            # Without pacing all packages are built up front, with pacing each one at its send time, so its
+            # timestamps are not behind the send time.
+            if interval_sec > 0:
+                packages = self.stream_builders(secret, ntp_mode)
+            else:
+                packages = self.prebuild_stream(secret, ntp_mode)
+            self.sender.send_all(packages, ip_addr, interval_sec)
+            return
+        for payload_bits, cp3_mode in self.stream_payloads(secret):
+            self._send_cp3_pck(payload_bits, ip_addr, cp3_mode, ntp_mode)
+            time.sleep(interval_sec)
+
+    def prebuild_stream(self, secret: NTPStreamSecret, ntp_mode: NTPMode = NTPMode.CLIENT) -> list:
+        """
+        Creates all packages of send_stream up front. Their timestamps are taken now, so they are meant to be sent
+        back to back.
+        :return: the packages in their wire format.
+        """
+        return [build() for build in self.stream_builders(secret, ntp_mode)]
+
+    def _cp3_pck_bytes(self, payload_bits: str, cp3_mode: CP3Mode, ntp_mode: NTPMode) -> bytes:
+        return bytes(self.create_cp3_pck(payload_bits, cp3_mode, ntp_mode))
+
+    def stream_builders(self, secret: NTPStreamSecret, ntp_mode: NTPMode = NTPMode.CLIENT):
+        """
+        Like prebuild_stream, but yields a callable for every package, which creates the package in its wire format
+        when it is called (see NTPSender.send_all).
+        :return: a generator of the callables.
+        """
+        for payload_bits, cp3_mode in self.stream_payloads(secret):
+            yield partial(self._cp3_pck_bytes, payload_bits, cp3_mode, ntp_mode)
+
+    @staticmethod
+    def stream_payloads(secret: NTPStreamSecret):
+        """
+        The payloads of the packages of a stream: a mode 1 package carries the 64 bit nonce of the stream, the
+        encrypted stream follows in mode 2 packages. A receiver can therefore resynchronise at every new stream.
+        :return: a generator of (payload bits, CP3Mode).
+        """
+        yield bytes_to_bits(secret.nonce), CP3Mode.PCK_1
+        while secret.has_next_bits():
+            yield secret.next_bits(64).ljust(64, '0'), CP3Mode.PCK_2
+
     def __restore_ntp_pck(self, ntp: NTP) -> NTP:
         self.log.debug('Send timestamp for reconstruction: ' + str(ntp.sent))
         sent_time_stamp = datetime.fromtimestamp(ntplib.ntp_to_system_time(ntp.sent))
@@ -1,25 +1,30 @@
 import logging
 
 from scapy.layers.inet import UDP, IP
+from scapy.layers.ntp import NTP
 
 from cp3_common_secrets import CP3_STATIC_KEY
 from cp3_handler import CP3Handler
 from log_utils import file_logger
+from upstream_time_source import UpstreamTimeSource
 
 
 class CP3Server(CP3Handler):
     def __init__(self, static_key_bits: str, listen_interface: str, self_ip,
-                 log: logging.Logger = logging.getLogger('CP3Server-logger')):
+                 time_source: UpstreamTimeSource = None, log: logging.Logger = logging.getLogger('CP3Server-logger')):
         """
         Provides functionality to answer requests of a CP3 client but does not care about the restoration of NTP
         packages.
+        :param time_source: provides the answers to the requests. Queries pool.ntp.org in the background if not set.
         """
-        super().__init__(static_key_bits, log)
+        super().__init__(static_key_bits, log=log)
+        self.time_source = time_source if time_source is not None else UpstreamTimeSource(log=log)
         self.listen_interface: str = listen_interface
         self.self_ip: str = self_ip
 
     def listen_for_client_requests(self):
         self.log.debug("Server is listening for incoming NTP packages on interface " + str(self.listen_interface) + " and self IP " + str(self.self_ip))
+        self.time_source.start()
         while True:
             pck = self.scappy_wrapper.next_ntp_packet_for_target(self.listen_interface, self.self_ip)
             self.log.debug("Captured an incoming NTP package")
@@ -28,11 +33,12 @@ class CP3Server(CP3Handler):
             # TODO Check if this is an CP3 package.
             # TODO Handle incoming package (e.g. extract information)
 
-            answer_pck = self.scappy_wrapper.get_upstream_ntp()
+            answer = self.time_source.response(bytes(pck[NTP]))
+            if answer is None:
+                self.log.error("No upstream time available, the request is not answered.")
+                continue
 
-            self.log.debug("Send a request for real time to the pool NTP server.")
-
-            self.scappy_wrapper.restore_ntp_mitm_pck(answer_pck, pck[UDP].sport, pck[IP].dst)
+            answer_pck = IP(src=pck[IP].dst, dst=pck[IP].src) / UDP(sport=123, dport=pck[UDP].sport) / answer.ntp()
 
             self.log.debug("Answer send to: " + answer_pck[IP].dst)
 
@@ -1,18 +1,34 @@
+import logging
 import unittest
 from datetime import datetime
 
 import ntplib
 from scapy.layers.ntp import NTP
 
+from bit_codec import bytes_to_bits
 from cp3_handler import CP3Handler
-from cp3_package import CP3Package
+from cp3_package import CP3Mode, CP3Package
 from ntp_mode import NTPMode
 from ntp_raw import RawNTP
 from ntp_utils import init_ntp_pck
 
+_KEY_BITS = '0110' * 48
+
 
 class CP3HandlerTests(unittest.TestCase):
 
+    def test_init_log_passed_positionally_no_decryptor_set(self):
+        # Arrange
+        log = logging.getLogger('CP3HandlerTests-logger')
+
+        # Act
+        handler = CP3Handler('', log)
+
+        # Assert
+        self.assertIs(handler.log, log)
+        self.assertIsNone(handler.decryptor)
+        self.assertIsNone(handler.sender)
+
     def test_restore_pck_client_pck_with_changed_year(self):
         # Arrange
         client = CP3Handler('')
@@ -85,6 +101,39 @@ class CP3HandlerTests(unittest.TestCase):
         # Assert
         self.assertEqual(origin_first_32 + received_first_32, client.msg)
 
+    def test_read_stream_payload_payloads_of_stream_message_decrypted(self):
+        # Arrange
+        sender = CP3Handler(_KEY_BITS)
+        receiver = CP3Handler(_KEY_BITS, stream=True)
+        message = bytes(range(100))
+        secret = sender.create_stream_secret(iter([message[:30], message[30:]]), length=len(message))
+        received = []
+
+        # Act
+        payloads = list(sender.stream_payloads(secret))
+        for payload_bits, cp3_mode in payloads:
+            receiver.read_stream_payload(payload_bits, cp3_mode, on_decrypted=received.append)
+
+        # Assert
+        self.assertEqual(payloads[0], (bytes_to_bits(secret.nonce), CP3Mode.PCK_1))
+        self.assertEqual({cp3_mode for _, cp3_mode in payloads[1:]}, {CP3Mode.PCK_2})
+        self.assertEqual(received, [message])
+
+    def test_read_stream_payload_length_above_max_stream_length_stream_dropped(self):
+        # Arrange
+        sender = CP3Handler(_KEY_BITS)
+        receiver = CP3Handler(_KEY_BITS, stream=True, max_stream_length=8)
+        secret = sender.create_stream_secret(bytes(9))
+        received = []
+
+        # Act
+        with self.assertLogs(receiver.log, level='WARNING'):
+            for payload_bits, cp3_mode in sender.stream_payloads(secret):
+                receiver.read_stream_payload(payload_bits, cp3_mode, on_decrypted=received.append)
+
+        # Assert
+        self.assertEqual(received, [])
+
 
 if __name__ == '__main__':
     unittest.main()
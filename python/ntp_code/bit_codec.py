@@ -0,0 +1,89 @@
+_DEFAULT_CHUNK_SIZE = 4096
+
+
+def bytes_to_bits(data) -> str:
+    """
+    Converts bytes to a string of bits in the format '0101'. Leading zero bytes are kept.
+    :param data: a bytes like object.
+    :return: a string of len(data) * 8 bits.
+    """
+    if len(data) == 0:
+        return ''
+    return format(int.from_bytes(data, 'big'), '0' + str(len(data) * 8) + 'b')
+
+
+def bits_to_bytes(bits: str) -> bytes:
+    """
+    Converts a string of bits in the format '0101' to bytes. Leading zero bytes are kept.
+    :param bits: a string of 0s and 1s, dividable by 8.
+    :return: len(bits) / 8 bytes.
+    """
+    assert len(bits) % 8 == 0
+    if len(bits) == 0:
+        return b''
+    return int(bits, 2).to_bytes(len(bits) // 8, 'big')
+
+
+def encode_bits(source, chunk_size: int = _DEFAULT_CHUNK_SIZE):
+    """
+    Incrementally converts bytes to bit strings.
+    :param source: either a bytes like object or an iterable of bytes like chunks (e.g. a file opened in 'rb' mode
+    or a generator).
+    :param chunk_size: the maximum number of bytes converted at once, this bounds the size of every yielded string.
+    :return: a generator of bit strings, each at most chunk_size * 8 bits long.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = (source,)
+    for chunk in source:
+        view = memoryview(chunk)
+        for start in range(0, len(view), chunk_size):
+            yield bytes_to_bits(view[start:start + chunk_size])
+
+
+def decode_bits(bit_chunks):
+    """
+    Incrementally converts bit strings of arbitrary length to bytes.
+    :param bit_chunks: an iterable of bit strings, their lengths do not have to be multiples of 8.
+    :return: a generator of the decoded bytes.
+    :raises ValueError: in case the total number of bits is not dividable by 8.
+    """
+    decoder = BitStreamDecoder()
+    for bits in bit_chunks:
+        data = decoder.feed(bits)
+        if data:
+            yield data
+    decoder.close()
+
+
+class BitStreamDecoder:
+    """
+    Converts a stream of bit strings to bytes. Bits which do not yet form a complete byte are kept until the next
+    call of feed, therefore the decoder never holds more than 7 bits of the message.
+    """
+
+    def __init__(self):
+        self._pending = ''
+
+    def feed(self, bits: str) -> bytes:
+        """
+        :param bits: the next bits of the stream in the format '0101'.
+        :return: all bytes completed by the given bits (may be empty).
+        """
+        bits = self._pending + bits
+        complete = len(bits) - len(bits) % 8
+        self._pending = bits[complete:]
+        return bits_to_bytes(bits[:complete])
+
+    def pending_bits(self) -> int:
+        """
+        :return: the number of bits which are not yet part of a complete byte.
+        """
+        return len(self._pending)
+
+    def close(self):
+        """
+        Ends the stream.
+        :raises ValueError: in case bits of an incomplete byte are left.
+        """
+        if self._pending:
+            raise ValueError('The bit stream ended with an incomplete byte: ' + self._pending)
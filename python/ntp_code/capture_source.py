@@ -0,0 +1,163 @@
+import logging
+import select
+import struct
+import time
+from queue import Empty, Full, Queue
+from threading import Event, Lock, Thread
+
+from scapy.config import conf
+from scapy.packet import Packet
+
+# Linux: getsockopt(SOL_PACKET, PACKET_STATISTICS) returns a struct tpacket_stats (packets, drops) and resets it.
+_SOL_PACKET = 263
+_PACKET_STATISTICS = 6
+_POLL_INTERVAL_SEC = 0.2
+
+
+class CaptureSource:
+    """
+    A long-lived capture of one interface. The capture socket (including the compiled BPF filter) is opened once
+    and a reader thread moves every captured package into a bounded queue, therefore no package is lost between two
+    calls of next_packet and the socket setup is not repeated for every package.
+    """
+
+    def __init__(self, sniff_interface: str, bpf_filter: str = 'udp and port 123', max_queue_size: int = 10000,
+                 socket_factory=None, log: logging.Logger = logging.getLogger('CaptureSource-logger')):
+        """
+        :param sniff_interface: the interface to capture.
+        :param bpf_filter: the filter applied by the kernel.
+        :param max_queue_size: the maximum number of captured but not yet consumed packages. Further packages are
+        dropped and counted in queue_drops.
+        :param socket_factory: creates the capture socket from (iface, filter), scapy's L2listen socket by default.
+        :param log:
+        """
+        self.log = log
+        self.sniff_interface = sniff_interface
+        self.bpf_filter = bpf_filter
+        self._socket_factory = socket_factory if socket_factory is not None \
+            else (lambda iface, bpf_filter: conf.L2listen(iface=iface, filter=bpf_filter))
+        self._queue = Queue(maxsize=max_queue_size)
+        self._socket = None
+        self._reader: Thread = None
+        self._stop_event = Event()
+        self._start_lock = Lock()
+        self._error: Exception = None  # The error which ended the reader thread.
+        self.packets_captured = 0
+        self.queue_drops = 0
+        self._kernel_drops = 0
+
+    def start(self):
+        """
+        Opens the capture socket and starts the reader thread. Does nothing if the capture is already running.
+        """
+        with self._start_lock:
+            if self._reader is not None:
+                return
+            self.log.info('Opening capture on interface ' + str(self.sniff_interface) + ' with filter: '
+                          + self.bpf_filter)
+            self._socket = self._socket_factory(self.sniff_interface, self.bpf_filter)
+            self._stop_event.clear()
+            self._error = None
+            self._reader = Thread(target=self._read, name='CaptureSource-' + str(self.sniff_interface), daemon=True)
+            self._reader.start()
+
+    def stop(self):
+        """
+        Stops the reader thread and closes the capture socket. Packages still in the queue can be consumed.
+        """
+        with self._start_lock:
+            if self._reader is None:
+                return
+            self._stop_event.set()
+            self._reader.join()
+            self._reader = None
+            self._update_kernel_drops()
+            try:
+                self._socket.close()
+            except OSError as e:
+                self.log.warning('Closing the capture socket failed: ' + repr(e))
+            self._socket = None
+
+    def is_running(self) -> bool:
+        return self._reader is not None
+
+    def _read(self):
+        while not self._stop_event.is_set():
+            try:
+                readable, _, _ = select.select([self._socket], [], [], _POLL_INTERVAL_SEC)
+                if not readable:
+                    continue
+                pck = self._socket.recv()
+            except Exception as e:
+                # The consumers are waiting on the queue, they raise the error (see next_packet).
+                self.log.exception('Capturing on interface ' + str(self.sniff_interface) + ' failed: ' + repr(e))
+                self._error = e
+                return
+            if pck is None:
+                continue
+            self.packets_captured += 1
+            try:
+                self._queue.put_nowait(pck)
+            except Full:
+                self.queue_drops += 1
+
+    def next_packet(self, timeout: float = None) -> Packet:
+        """
+        Returns the next captured package. This method is blocking and starts the capture if necessary.
+        :param timeout: the maximum time to wait in seconds, None waits forever.
+        :return: the package (with OSI layer 2 to 4 still attached) or None in case the timeout expired.
+        :raises Exception: the error which ended the capture, once all packages captured before are consumed. The
+        capture is closed then and reopened by the next call.
+        """
+        self.start()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = _POLL_INTERVAL_SEC if deadline is None else min(_POLL_INTERVAL_SEC, deadline - time.monotonic())
+            try:
+                return self._queue.get(timeout=max(wait, 0))
+            except Empty:
+                pass
+            error = self._error
+            if error is not None:
+                self.stop()
+                raise error
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+
+    def next_packets(self, max_n: int, timeout: float = None) -> list:
+        """
+        Waits for the next captured package and returns it together with all packages captured in the meantime.
+        :param max_n: the maximum number of packages to return.
+        :param timeout: the maximum time to wait for the first package, None waits forever.
+        :return: a list of at most max_n packages, empty in case the timeout expired.
+        :raises Exception: the error which ended the capture (see next_packet).
+        """
+        first = self.next_packet(timeout)
+        if first is None:
+            return []
+        packets = [first]
+        while len(packets) < max_n:
+            try:
+                packets.append(self._queue.get_nowait())
+            except Empty:
+                break
+        return packets
+
+    def _update_kernel_drops(self):
+        ins = getattr(self._socket, 'ins', None)
+        try:
+            stats = ins.getsockopt(_SOL_PACKET, _PACKET_STATISTICS, 8)
+        except (AttributeError, OSError):
+            return  # Not a linux packet socket.
+        _, drops = struct.unpack('II', stats)
+        self._kernel_drops += drops
+
+    def kernel_drops(self) -> int:
+        """
+        :return: the number of packages dropped by the kernel since the capture was started, because the reader
+        thread did not keep up. Always 0 if the capture socket does not report statistics.
+        """
+        with self._start_lock:
+            if self._socket is not None:
+                self._update_kernel_drops()
+            return self._kernel_drops
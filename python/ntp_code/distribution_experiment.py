@@ -6,8 +6,8 @@ from scapy.layers.inet import IP, UDP
 from scapy.layers.ntp import NTP
 from scapy.sendrecv import sr1
 
-from ntp_raw import RawNTP
-from ntp_utils import extract_64timestamp_fraction
+from ntp_raw import RawNTP, NTPField
+from ntp_timestamp import ntp64_fraction_digits
 
 
 class DistributionExperiment:
@@ -90,10 +90,10 @@ class DistributionExperiment:
         plt.show()
 
     def _process_ntp_result(self, result: RawNTP):
-        orig_digits = extract_64timestamp_fraction(result.origin_timestamp())
-        trans_digits = extract_64timestamp_fraction(result.transmit_timestamp())
-        ref_digits = extract_64timestamp_fraction(result.reference_timestamp())
-        rec_digits = extract_64timestamp_fraction(result.receive_timestamp())
+        orig_digits = ntp64_fraction_digits(result.get_field_int(NTPField.ORIGIN_TIMESTAMP))
+        trans_digits = ntp64_fraction_digits(result.get_field_int(NTPField.TRANSMIT_TIMESTAMP))
+        ref_digits = ntp64_fraction_digits(result.get_field_int(NTPField.REFERENCE_TIMESTAMP))
+        rec_digits = ntp64_fraction_digits(result.get_field_int(NTPField.RECEIVE_TIMESTAMP))
 
         self.log.info('Raw bits: ' + orig_digits + ' ' + trans_digits + ' ' + ref_digits + ' ' + rec_digits)
 
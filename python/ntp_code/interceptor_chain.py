@@ -0,0 +1,280 @@
+import logging
+import struct
+from enum import Enum
+
+from scapy.layers.inet import IP, UDP
+from scapy.layers.ntp import NTP
+
+from ntp_datagram import NTPDatagram, parse_ip_packet
+from ntp_raw import RawNTP
+from ntp_timestamp import ntp_timestamp_now, unix_ns_to_ntp64
+
+_UDP_HEADER_LENGTH = 8
+_IPPROTO_UDP = 17
+
+
+class Verdict(Enum):
+    """
+    The decision of a stage about one package.
+    """
+    CONTINUE = 1  # Pass the package on to the next stage, it is accepted after the last stage.
+    ACCEPT = 2  # Accept the package (with all modifications so far), the following stages are skipped.
+    DROP = 3  # Drop the package, the following stages are skipped.
+
+
+def _internet_checksum(data) -> int:
+    if len(data) % 2:
+        data = bytes(data) + b'\x00'
+    total = sum(struct.unpack('!' + str(len(data) // 2) + 'H', data))
+    while total >> 16:
+        total = (total & 0xFFFF) + (total >> 16)
+    return ~total & 0xFFFF
+
+
+class PacketView:
+    """
+    One package passed through an InterceptorChain. The package is parsed lazily: stages working on raw bytes use
+    ntp() (a RawNTP, modified in place), stages working with scapy use scapy() or replace the package with
+    set_scapy(). The scapy dissection is only done once per package, no matter how many stages need it.
+    """
+
+    def __init__(self, datagram: NTPDatagram, ip_packet: bytes = None):
+        """
+        :param datagram: the addresses, ports, NTP payload and kernel receive time of the package.
+        :param ip_packet: the complete IPv4 package, if the package was intercepted on layer 3 (e.g. netfilter).
+        """
+        self.datagram = datagram
+        self.ip_packet = ip_packet
+        self._ntp: RawNTP = None
+        self._scapy = None
+
+    @classmethod
+    def from_ip_packet(cls, ip_packet: bytes, timestamp_ns: int = None):
+        """
+        :return: the view of an IPv4 package, None if it does not carry an UDP datagram.
+        """
+        datagram = parse_ip_packet(ip_packet)
+        if datagram is None:
+            return None
+        return cls(datagram._replace(timestamp_ns=timestamp_ns), bytes(ip_packet))
+
+    def receive_time(self) -> int:
+        """
+        :return: the receive time of the package as 64 bit NTP timestamp, the current time if unknown.
+        """
+        if self.datagram.timestamp_ns is None:
+            return ntp_timestamp_now()
+        return unix_ns_to_ntp64(self.datagram.timestamp_ns)
+
+    def ntp(self) -> RawNTP:
+        """
+        :return: the NTP package, modifications are kept. If the package was replaced by a scapy package, it is
+        converted back once.
+        """
+        if self._ntp is None:
+            if self._scapy is not None:
+                self._flatten_scapy()
+            self._ntp = RawNTP(self.datagram.payload)
+        return self._ntp
+
+    def _flatten_scapy(self):
+        # The scapy package becomes the new original, so modifications of the IP and UDP layer are kept as well.
+        data = bytes(self._scapy)
+        self._scapy = None
+        datagram = parse_ip_packet(data)
+        if datagram is None:
+            raise ValueError('The package is not an IPv4/UDP package anymore.')
+        self.datagram = datagram._replace(timestamp_ns=self.datagram.timestamp_ns)
+        if self.ip_packet is not None:
+            self.ip_packet = data
+
+    def snapshot(self):
+        """
+        :return: the current state of the package, including all modifications so far (see restore).
+        """
+        return (self.datagram, self.ip_packet, None if self._ntp is None else self._ntp.to_bytes(),
+                None if self._scapy is None else self._scapy.copy())
+
+    def restore(self, state):
+        """
+        Discards all modifications made after the given snapshot was taken.
+        """
+        self.datagram, self.ip_packet, ntp, self._scapy = state
+        self._ntp = None if ntp is None else RawNTP(ntp)
+
+    def set_ntp(self, ntp: RawNTP):
+        self._ntp = ntp
+        self._scapy = None
+
+    def scapy(self):
+        """
+        :return: the package dissected by scapy (IP()/UDP()/NTP()), modifications are kept.
+        """
+        if self._scapy is None:
+            if self.ip_packet is not None:
+                self._scapy = IP(self.ip_bytes())
+            else:
+                self._scapy = IP(src=self.datagram.src_ip, dst=self.datagram.dst_ip) \
+                              / UDP(sport=self.datagram.sport, dport=self.datagram.dport) / NTP(self.payload())
+            self._ntp = None
+        return self._scapy
+
+    def set_scapy(self, pck):
+        """
+        Replaces the package by a scapy package (IP()/UDP()/NTP()).
+        """
+        self._scapy = pck
+        self._ntp = None
+
+    def payload(self) -> bytes:
+        """
+        :return: the NTP package with all modifications in its wire format.
+        """
+        if self._scapy is not None:
+            return bytes(self._scapy[NTP]) if self._scapy.haslayer(NTP) else b''
+        if self._ntp is not None:
+            return self._ntp.to_bytes()
+        return self.datagram.payload
+
+    def ip_bytes(self) -> bytes:
+        """
+        :return: the complete IPv4 package with all modifications. A modified NTP payload is written into the
+        original package and the UDP checksum is updated, without any scapy involvement.
+        """
+        if self._scapy is not None:
+            return bytes(self._scapy)
+        if self.ip_packet is None:
+            return bytes(IP(src=self.datagram.src_ip, dst=self.datagram.dst_ip)
+                         / UDP(sport=self.datagram.sport, dport=self.datagram.dport) / NTP(self.payload()))
+        payload = self.payload()
+        if payload == self.datagram.payload:
+            return self.ip_packet
+        udp_offset = (self.ip_packet[0] & 0x0F) * 4
+        packet = bytearray(self.ip_packet[:udp_offset + _UDP_HEADER_LENGTH]) + payload
+        assert len(packet) == len(self.ip_packet), 'The length of the NTP payload must not change.'
+        if packet[udp_offset + 6:udp_offset + 8] != b'\x00\x00':  # 0 means the sender did not use a checksum.
+            udp = packet[udp_offset:]
+            udp[6:8] = b'\x00\x00'
+            pseudo_header = bytes(packet[12:20]) + struct.pack('!BBH', 0, _IPPROTO_UDP, len(udp))
+            checksum = _internet_checksum(pseudo_header + bytes(udp)) or 0xFFFF
+            struct.pack_into('!H', packet, udp_offset + 6, checksum)
+        return bytes(packet)
+
+
+class InterceptorStage:
+    """
+    One stage of an InterceptorChain. Override process (for the whole batch) or process_one (per package).
+    A stage which works with scapy packages sets needs_scapy, the chain then dissects the packages of the batch
+    before the stage is called.
+    """
+    needs_scapy = False
+
+    def process(self, views: list) -> list:
+        """
+        :param views: the PacketViews of the batch, modifications are made on them.
+        :return: a Verdict (or None for CONTINUE) for every view.
+        """
+        return [self.process_one(view) for view in views]
+
+    def process_one(self, view: PacketView) -> Verdict:
+        return Verdict.CONTINUE
+
+
+class InterceptorChain:
+    """
+    An ordered chain of stages, which processes batches of packages. Every package passes the stages in their
+    order until a stage accepts or drops it. Several covert channels can thereby work side by side on one queue.
+    """
+
+    def __init__(self, stages=(), log: logging.Logger = logging.getLogger('InterceptorChain-logger')):
+        """
+        :param stages: the InterceptorStages in their order.
+        :param log:
+        """
+        self.log = log
+        self.stages = list(stages)
+
+    def add_stage(self, stage: InterceptorStage):
+        self.stages.append(stage)
+
+    def needs_scapy(self) -> bool:
+        """
+        :return: True in case any stage works with scapy packages.
+        """
+        return any(stage.needs_scapy for stage in self.stages)
+
+    def process(self, views: list) -> list:
+        """
+        Passes a batch of packages through all stages. If a stage fails, the modifications it made are undone and
+        the packages of its batch are passed on unchanged by this stage.
+        :param views: the PacketViews of the batch.
+        :return: the final Verdict (ACCEPT or DROP) of every view.
+        """
+        verdicts = [Verdict.ACCEPT] * len(views)
+        active = list(range(len(views)))
+        for stage in self.stages:
+            if not active:
+                break
+            batch = [views[i] for i in active]
+            snapshots = [view.snapshot() for view in batch]
+            try:
+                if stage.needs_scapy:
+                    for view in batch:
+                        view.scapy()
+                results = stage.process(batch)
+            except Exception as e:
+                self.log.error('Stage ' + type(stage).__name__ + ' failed, its modifications are undone: ' + str(e))
+                for view, snapshot in zip(batch, snapshots):
+                    view.restore(snapshot)
+                continue
+            remaining = []
+            for i, result in zip(active, results):
+                if result is None or result is Verdict.CONTINUE:
+                    remaining.append(i)
+                else:
+                    verdicts[i] = result
+            active = remaining
+        return verdicts
+
+
+class ScapyCallbackStage(InterceptorStage):
+    """
+    Adapts the callbacks of the NetfilterWrapper (pre_check and handle_pck, e.g. of the CP3Interceptor) to a stage.
+    """
+    needs_scapy = True
+
+    def __init__(self, pre_check, handle_pck):
+        """
+        :param pre_check: returns False for scapy packages which are not meant for handle_pck.
+        :param handle_pck: manipulates a scapy package and returns the new one.
+        """
+        self.pre_check = pre_check
+        self.handle_pck = handle_pck
+
+    def process_one(self, view: PacketView) -> Verdict:
+        pck = view.scapy()
+        if self.pre_check(pck):
+            view.set_scapy(self.handle_pck(pck))
+        return Verdict.CONTINUE
+
+
+class NTPInterceptorStage(InterceptorStage):
+    """
+    Adapts an NTPInterceptor (see ntp_server) to a stage, working on raw NTP packages.
+    """
+
+    def __init__(self, interceptor, response: bool = False):
+        """
+        :param interceptor: the NTPInterceptor.
+        :param response: whether the stage handles responses (intercept_res_raw) instead of requests
+        (intercept_req_raw).
+        """
+        self.interceptor = interceptor
+        self.response = response
+
+    def process_one(self, view: PacketView) -> Verdict:
+        if self.response:
+            view.set_ntp(self.interceptor.intercept_res_raw(view.ntp()))
+        else:
+            self.interceptor.intercept_req_raw(view.ntp(), view.receive_time())
+        return Verdict.CONTINUE
@@ -1,12 +1,17 @@
 import logging
+import select
 
 from netfilterqueue import NetfilterQueue
-from scapy.layers.inet import IP
+
+from interceptor_chain import InterceptorChain, PacketView, ScapyCallbackStage, Verdict
+
+_POLL_INTERVAL_SEC = 0.2
 
 
 class NetfilterWrapper:
 
-    def __init__(self, pre_check, handle_pck, log: logging.Logger = logging.getLogger('NetfilterWrapper-Logger')):
+    def __init__(self, pre_check=None, handle_pck=None, chain: InterceptorChain = None, max_batch_size: int = 64,
+                 log: logging.Logger = logging.getLogger('NetfilterWrapper-Logger')):
         """
         A wrapper for NetfilterQueue functions. Provides some possibilities to bind outside functions to check
         and manipulate incoming functions.
@@ -14,29 +19,84 @@ class NetfilterWrapper:
         :param pre_check: A function which should check whether the given Scapy packet is meant for the interceptor.
         this method should return False in case the Packet is not meant for the handler.
         :param handle_pck: A function which can manipulate the given Scapy packet and should return a new one.
+        :param chain: the interceptor chain which processes the queued packages. The pre_check and handle_pck
+        functions are appended to it as a ScapyCallbackStage.
+        :param max_batch_size: the maximum number of queued packages passed to the chain at once.
         """
         self.log = log
         self.nfqueue: NetfilterQueue = None
         self.pre_check = pre_check
         self.handle_pck = handle_pck
+        self.chain = chain if chain is not None else InterceptorChain(log=log)
+        if pre_check is not None and handle_pck is not None:
+            self.chain.add_stage(ScapyCallbackStage(pre_check, handle_pck))
+        self.max_batch_size = max_batch_size
+        self._pending = []
 
     def bind(self, filter_number: int = 0):
         self.log.info('Bind to Netfilter Queue Nr.: ' + str(filter_number))
         self.nfqueue = NetfilterQueue()
-        self.nfqueue.bind(filter_number, self.modify)
+        self.nfqueue.bind(filter_number, self._collect)
 
     def modify(self, packet):
-        pkt = IP(packet.get_payload())
+        """
+        Passes a single queued package through the chain and sets its verdict.
+        """
         self.log.debug("Netfilter pkt received.")
+        self._process([packet])
 
-        if not self.pre_check(pkt):
-            self.log.debug('Pre check failed!')
-            packet.accept()
-            return
+    def _collect(self, packet):
+        # The verdict is set later for the whole batch, so the payload has to outlive the callback.
+        packet.retain()
+        self._pending.append(packet)
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
 
-        manipulated_pck = self.handle_pck(pkt)
-        packet.set_payload(manipulated_pck.__bytes__())
-        packet.accept()
+    def _flush(self):
+        packets, self._pending = self._pending, []
+        if packets:
+            self._process(packets)
+
+    def _process(self, packets: list):
+        views = []
+        for packet in packets:
+            timestamp = packet.get_timestamp()
+            view = PacketView.from_ip_packet(packet.get_payload(),
+                                             int(timestamp * 1e9) if timestamp > 0 else None)
+            views.append(view)
+        try:
+            verdicts = self.chain.process([view for view in views if view is not None])
+        except Exception as e:
+            self.log.exception('The chain failed, ' + str(len(packets)) + ' packages are accepted unchanged: '
+                               + repr(e))
+            for packet in packets:
+                packet.accept()
+            return
+        verdicts = iter(verdicts)
+        for packet, view in zip(packets, views):
+            if view is None:  # Not an UDP package, nothing to intercept.
+                packet.accept()
+                continue
+            verdict = next(verdicts)
+            if verdict is Verdict.DROP:
+                packet.drop()
+                continue
+            try:
+                manipulated = view.ip_bytes()
+                if manipulated != view.ip_packet:
+                    packet.set_payload(manipulated)
+            except Exception as e:
+                self.log.error('The modified package could not be built, the original is accepted: ' + repr(e))
+            packet.accept()
 
     def run(self):
-        self.nfqueue.run()
\ No newline at end of file
+        """
+        Processes the queued packages in batches: all packages waiting in the queue are collected and then passed
+        through the chain at once. This method is blocking.
+        """
+        fd = self.nfqueue.get_fd()
+        while True:
+            readable, _, _ = select.select([fd], [], [], _POLL_INTERVAL_SEC)
+            if readable:
+                self.nfqueue.run(block=False)
+            self._flush()
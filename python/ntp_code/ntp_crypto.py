@@ -1,20 +1,93 @@
 import logging
+import os
+import struct
+from collections import OrderedDict
+from concurrent.futures import Future
+from itertools import chain
+from queue import Empty, Queue
+from threading import Lock, Thread
 
 from Crypto.Cipher import AES
-from bitstring import BitArray
 
+from bit_codec import BitStreamDecoder, bits_to_bytes, bytes_to_bits, decode_bits
 
-def _repair_key(key: str) -> str:
-    while len(key) < 32:
-        key += ' '
-    key = key[:32]
-    return key
+# Stream secrets start with the length of the message in bytes, so the receiver knows where the stream ends.
+STREAM_HEADER = struct.Struct('!I')
+# The default limit of receivers for the length of a stream in bytes, the header could announce up to 4 GiB.
+MAX_STREAM_LENGTH = 1 << 20
 
 
-def _repair_data(data: str) -> str:
-    while len(data) % 16 != 0:
-        data += ' '
-    return data
+def _repair_key(key) -> bytes:
+    """
+    Pads (with spaces) or truncates the given key to 32 byte.
+    :param key: the key as str or bytes.
+    """
+    if isinstance(key, str):
+        key = key.encode()
+    key = bytes(key[:32])
+    return key + b' ' * (32 - len(key))
+
+
+def _repair_data(data) -> bytes:
+    """
+    Pads (with spaces) the given data to a multiple of the AES block size.
+    :param data: the data as str or bytes.
+    """
+    if isinstance(data, str):
+        data = data.encode()
+    return bytes(data) + b' ' * (-len(data) % 16)
+
+
+class CipherCache:
+    """
+    A LRU bounded cache of AES-ECB cipher objects keyed by the (repaired) key bytes, which avoids repeating the
+    key setup for every message encrypted or decrypted under the same key. Thread safe.
+    """
+
+    def __init__(self, max_size: int = 256):
+        """
+        :param max_size: the maximum number of cached cipher objects.
+        """
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._ciphers = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        """
+        :param key: the key as str or bytes, it is repaired to 32 byte like in all other ntp_crypto functions.
+        :return: an AES cipher object in the ECB mode for the given key.
+        """
+        key = _repair_key(key)
+        with self._lock:
+            cipher = self._ciphers.get(key)
+            if cipher is not None:
+                self._ciphers.move_to_end(key)
+                self.hits += 1
+                return cipher
+            self.misses += 1
+        cipher = AES.new(key, AES.MODE_ECB)
+        with self._lock:
+            self._ciphers[key] = cipher
+            if len(self._ciphers) > self.max_size:
+                self._ciphers.popitem(last=False)
+        return cipher
+
+    def clear(self):
+        """
+        Removes all cached cipher objects and resets the counters.
+        """
+        with self._lock:
+            self._ciphers.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self._ciphers)
+
+
+cipher_cache = CipherCache()
 
 
 def decrypt_bits(encrypted_bits, decryption_key_bytes) -> bytes:
@@ -24,9 +97,8 @@ def decrypt_bits(encrypted_bits, decryption_key_bytes) -> bytes:
     :param decryption_key_bytes: the key as bytes (of length 16, 24 or 32)
     :return: the decrypted bits as UTF8 string.
     """
-    decryption_key_bytes = _repair_key(decryption_key_bytes)
-    cipher = AES.new(decryption_key_bytes, AES.MODE_ECB)
-    encrypted_bytes = BitArray(bin=encrypted_bits).bytes
+    cipher = cipher_cache.get(decryption_key_bytes)
+    encrypted_bytes = bits_to_bytes(encrypted_bits)
     data = cipher.decrypt(encrypted_bytes)
     return data
 
@@ -48,11 +120,132 @@ def decrypt_bits_raw(encrypted_bits, decryption_key_bytes) -> str:
     :param decryption_key_bytes: the key as bytes (of length 16, 24 or 32)
     :return: the decrypted bits (128) without any transformation.
     """
-    decryption_key = _repair_key(decryption_key_bytes)
-    cipher = AES.new(decryption_key_bytes, AES.MODE_ECB)
-    encrypted_bytes = BitArray(bin=encrypted_bits).bytes
-    data = cipher.decrypt(encrypted_bytes)
-    return BitArray(bytes=data).bin
+    return bytes_to_bits(decrypt_bits(encrypted_bits, decryption_key_bytes))
+
+
+def _check_block_length(encrypted_bytes):
+    if len(encrypted_bytes) % 16 != 0:
+        raise ValueError('An encrypted message is a multiple of 16 byte long, got ' + str(len(encrypted_bytes)))
+
+
+def decrypt_batch(pairs) -> list:
+    """
+    Decrypts many messages in the AES ECB mode at once. The messages are grouped by their key and every group is
+    decrypted with a single multi-block call of the cached cipher, which avoids the per-call overhead of decrypting
+    every message on its own.
+    :param pairs: an iterable of (key, encrypted bytes) tuples, every message has to be a multiple of 16 byte long.
+    :return: the decrypted bytes of every message, in the order of the given pairs.
+    :raises ValueError: in case a message is not a multiple of 16 byte long.
+    """
+    groups = OrderedDict()
+    count = 0
+    for index, (key, encrypted_bytes) in enumerate(pairs):
+        _check_block_length(encrypted_bytes)
+        groups.setdefault(_repair_key(key), []).append((index, bytes(encrypted_bytes)))
+        count += 1
+
+    results = [None] * count
+    for key, messages in groups.items():
+        data = cipher_cache.get(key).decrypt(b''.join(encrypted for _, encrypted in messages))
+        start = 0
+        for index, encrypted in messages:
+            results[index] = data[start:start + len(encrypted)]
+            start += len(encrypted)
+    return results
+
+
+class BatchDecryptor:
+    """
+    Decrypts messages on a worker thread. Receivers submit completed messages and continue with the next package,
+    the worker collects all messages submitted in the meantime and decrypts them with decrypt_batch.
+    """
+
+    def __init__(self, max_batch_size: int = 256, log: logging.Logger = logging.getLogger('BatchDecryptor-logger')):
+        """
+        :param max_batch_size: the maximum number of messages decrypted in one batch.
+        :param log:
+        """
+        self.log = log
+        self.max_batch_size = max_batch_size
+        self._queue = Queue()
+        self._worker: Thread = None
+        self.batches = 0
+        self.messages = 0
+
+    def submit(self, key, encrypted_bytes) -> Future:
+        """
+        Queues a message for the decryption. The worker has to be started (see start), otherwise the returned future
+        is never completed.
+        :param key: the key as str or bytes.
+        :param encrypted_bytes: the encrypted message, a multiple of 16 byte long.
+        :return: a future which holds the decrypted bytes.
+        :raises ValueError: in case the message is not a multiple of 16 byte long.
+        """
+        _check_block_length(encrypted_bytes)
+        future = Future()
+        self._queue.put((key, encrypted_bytes, future))
+        return future
+
+    def start(self):
+        """
+        Starts the worker thread. Does nothing if it is already running.
+        """
+        if self._worker is not None:
+            return
+        self._worker = Thread(target=self._work, name='BatchDecryptor-worker', daemon=True)
+        self._worker.start()
+
+    def stop(self):
+        """
+        Decrypts all messages submitted so far and stops the worker thread.
+        """
+        if self._worker is None:
+            return
+        self._queue.put(None)
+        self._worker.join()
+        self._worker = None
+
+    def _next_batch(self) -> list:
+        batch = [self._queue.get()]
+        while batch[-1] is not None and len(batch) < self.max_batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except Empty:
+                break
+        return batch
+
+    def _work(self):
+        running = True
+        while running:
+            batch = self._next_batch()
+            if batch[-1] is None:  # The stop marker is always the last element of a batch.
+                batch.pop()
+                running = False
+            if not batch:
+                continue
+            try:
+                results = decrypt_batch((key, encrypted) for key, encrypted, _ in batch)
+            except Exception as e:
+                # Only the futures of the messages which fail on their own fail.
+                self.log.error('Decryption of a batch of ' + str(len(batch)) + ' messages failed, decrypting them one '
+                               'by one: ' + str(e))
+                self._work_one_by_one(batch)
+                continue
+            self.batches += 1
+            self.messages += len(batch)
+            for (_, _, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def _work_one_by_one(self, batch: list):
+        for key, encrypted, future in batch:
+            try:
+                result = decrypt_batch([(key, encrypted)])[0]
+            except Exception as e:
+                self.log.error('Decryption of a message failed: ' + str(e))
+                future.set_exception(e)
+                continue
+            self.messages += 1
+            future.set_result(result)
 
 
 class NTPSecret:
@@ -69,19 +262,17 @@ class NTPSecret:
         self._encoded_data = self.__encode(payload_bytes, key_bytes)
         self._encoded_bits = self.__encode_bits()
         self._position_counter = 0
-        self.total_payload_length = len(payload_bytes)
+        self.total_payload_length = len(self._encoded_bits)  # In bits, like the position counter.
 
     @staticmethod
     def __encode(payload_bytes, key_bytes):
         payload = _repair_data(payload_bytes)
-        key_bytes = _repair_key(key_bytes)
-        cipher = AES.new(key_bytes, AES.MODE_ECB)
-        ciphertext = cipher.encrypt(payload_bytes)
+        cipher = cipher_cache.get(key_bytes)
+        ciphertext = cipher.encrypt(payload)
         return ciphertext
 
     def __encode_bits(self) -> str:
-        bits = BitArray(bytes=self._encoded_data)
-        return str(bits.bin)
+        return bytes_to_bits(self._encoded_data)
 
     def __str__(self):
         return self._encoded_bits
@@ -110,6 +301,191 @@ class NTPSecret:
         return str(self._encoded_bits)
 
 
+def _ctr_keystream(cipher, nonce: bytes, counter: int, blocks: int) -> bytes:
+    # The keystream blocks AES(key, nonce | n) for n = counter ... counter + blocks - 1, in one cipher call.
+    return cipher.encrypt(b''.join(nonce + (counter + i).to_bytes(8, 'big') for i in range(blocks)))
+
+
+def ctr_xor_stream(chunks, key_bytes, nonce: bytes):
+    """
+    Encrypts or decrypts (both are the same operation) a stream of bytes in a counter mode based on the cached
+    AES-ECB cipher of the key: the n-th block of 16 bytes is XORed with AES(key, nonce | n).
+    :param chunks: an iterable of bytes like chunks of any size.
+    :param key_bytes: the key (repaired to 32 byte).
+    :param nonce: 8 byte, must never be used twice with the same key.
+    :return: a generator yielding the en- or decrypted data, one chunk per input chunk.
+    """
+    assert len(nonce) == 8
+    cipher = cipher_cache.get(key_bytes)
+    counter = 0
+    keystream = b''
+    for chunk in chunks:
+        chunk = bytes(chunk)
+        while len(keystream) < len(chunk):
+            blocks = (len(chunk) - len(keystream) + 15) // 16
+            keystream += _ctr_keystream(cipher, nonce, counter, blocks)
+            counter += blocks
+        data = int.from_bytes(chunk, 'big') ^ int.from_bytes(keystream[:len(chunk)], 'big')
+        keystream = keystream[len(chunk):]
+        yield data.to_bytes(len(chunk), 'big')
+
+
+class NTPStreamSecret:
+    def __init__(self, message, key_bytes, nonce: bytes = None, chunk_size: int = 64,
+                 log: logging.Logger = logging.getLogger('NTPStreamSecret-logger')):
+        """
+        A secret of arbitrary length, which is encrypted lazily in a counter mode (see ctr_xor_stream) while its
+        bits are consumed. Offers the same interface as NTPSecret, but only holds a few blocks of the message at
+        any time, independent of the message size.
+        :param message: the payload as str, bytes or an iterable of bytes chunks (e.g. a file opened in 'rb' mode).
+        :param key_bytes: the key to encrypt (16, 24 or 32 byte)
+        :param nonce: 8 byte, which must never be used twice with the same key. A random nonce is used by default.
+        :param chunk_size: the number of plaintext bytes encrypted at once.
+        :param log: a logger for this instance.
+        """
+        self.log = log
+        self.nonce = nonce if nonce is not None else os.urandom(8)
+        if isinstance(message, str):
+            message = message.encode()
+        if isinstance(message, (bytes, bytearray, memoryview)):
+            message = (message,)
+        self._encrypted_chunks = ctr_xor_stream(self.__rechunk(message, chunk_size), key_bytes, self.nonce)
+        self._buffer = ''
+        self.bits_delivered = 0
+
+    @staticmethod
+    def __rechunk(chunks, chunk_size: int):
+        for chunk in chunks:
+            view = memoryview(chunk)
+            for start in range(0, len(view), chunk_size):
+                yield view[start:start + chunk_size]
+
+    def _fill(self) -> bool:
+        """
+        Encrypts the next chunk of the message into the bit buffer.
+        :return: False in case the message is exhausted.
+        """
+        chunk = next(self._encrypted_chunks, None)
+        if chunk is None:
+            return False
+        self._buffer += bytes_to_bits(chunk)
+        return True
+
+    def next_bits(self, amount: int) -> str:
+        """
+        :param amount: the number of bits to return
+        :return: returns the next amount bits (less at the end of the message) and counts up internally.
+        """
+        while len(self._buffer) < amount and self._fill():
+            pass
+        result = self._buffer[:amount]
+        self._buffer = self._buffer[amount:]
+        self.bits_delivered += len(result)
+        return result
+
+    def has_next_bits(self) -> bool:
+        """
+        :return: True in case the secret has still bits to offer, False otherwise.
+        """
+        while not self._buffer:
+            if not self._fill():
+                return False
+        return True
+
+
+def decrypt_stream(bit_chunks, key_bytes, nonce: bytes):
+    """
+    Decrypts a message encrypted by NTPStreamSecret incrementally.
+    :param bit_chunks: an iterable of the received bit strings (format '0101'), of any length.
+    :param key_bytes: the key used for the encryption.
+    :param nonce: the nonce used for the encryption.
+    :return: a generator of the decrypted bytes.
+    """
+    return ctr_xor_stream(decode_bits(bit_chunks), key_bytes, nonce)
+
+
+def stream_with_header(message, length: int = None):
+    """
+    Prefixes a message with its length (see STREAM_HEADER), as expected by NTPStreamReceiver.
+    :param message: the message as str, bytes or an iterable of bytes chunks.
+    :param length: the length of the message in bytes, only needed for an iterable of chunks.
+    :return: an iterable of bytes chunks for NTPStreamSecret.
+    """
+    if isinstance(message, str):
+        message = message.encode()
+    if isinstance(message, (bytes, bytearray, memoryview)):
+        length = len(message)
+        message = (message,)
+    elif length is None:
+        raise ValueError('The length of a message given as chunks is needed.')
+    return chain((STREAM_HEADER.pack(length),), message)
+
+
+class NTPStreamReceiver:
+    """
+    Decrypts a stream secret (a message prefixed by stream_with_header and encrypted as NTPStreamSecret) while its
+    bits arrive. Every received byte is decrypted at once with the next bytes of the keystream, which is generated
+    block by block. Only the decrypted message is kept, whose length is limited by max_length.
+    """
+
+    def __init__(self, key_bytes, nonce: bytes, max_length: int = MAX_STREAM_LENGTH):
+        """
+        :param key_bytes: the key used for the encryption.
+        :param nonce: the nonce used for the encryption (8 byte).
+        :param max_length: streams whose header announces more bytes are rejected.
+        """
+        if len(nonce) != 8:
+            raise ValueError('The nonce of a stream has 8 byte, got ' + str(len(nonce)))
+        self.max_length = max_length
+        self.length: int = None  # The length of the message in bytes, known as soon as the header is received.
+        self._cipher = cipher_cache.get(key_bytes)
+        self._nonce = nonce
+        self._counter = 0
+        self._keystream = b''
+        self._decoder = BitStreamDecoder()
+        self._received = bytearray()  # The decrypted header and message.
+
+    def feed(self, bits: str):
+        """
+        Decrypts the next received bits. Bits beyond the end of the stream (e.g. padding) are ignored.
+        :param bits: the bits in the format '0101', of any length.
+        :raises ValueError: in case the header announces a message longer than max_length.
+        """
+        if self.is_complete():
+            return
+        data = self._decoder.feed(bits)
+        if not data:
+            return
+        if len(self._keystream) < len(data):
+            blocks = (len(data) - len(self._keystream) + 15) // 16
+            self._keystream += _ctr_keystream(self._cipher, self._nonce, self._counter, blocks)
+            self._counter += blocks
+        decrypted = int.from_bytes(data, 'big') ^ int.from_bytes(self._keystream[:len(data)], 'big')
+        self._keystream = self._keystream[len(data):]
+        self._received += decrypted.to_bytes(len(data), 'big')
+        if self.length is None and len(self._received) >= STREAM_HEADER.size:
+            length = STREAM_HEADER.unpack_from(self._received)[0]
+            if length > self.max_length:
+                raise ValueError('The stream announces ' + str(length) + ' bytes, at most ' + str(self.max_length)
+                                 + ' are accepted.')
+            self.length = length
+        if self.length is not None:
+            del self._received[STREAM_HEADER.size + self.length:]
+
+    def is_complete(self) -> bool:
+        """
+        :return: True in case the complete message is received.
+        """
+        return self.length is not None and len(self._received) >= STREAM_HEADER.size + self.length
+
+    def message(self) -> bytes:
+        """
+        :return: the decrypted message without its header.
+        """
+        assert self.is_complete()
+        return bytes(self._received[STREAM_HEADER.size:])
+
+
 class NTPCrypto:
 
     def __init__(self, log: logging.Logger = logging.getLogger("NTPCrypto-logger")):
@@ -130,7 +506,7 @@ class NTPCrypto:
         combined_bits = static_key + aes_nonce
         self.log.debug("Generating aes key with bits: " + str(combined_bits))
 
-        result_bytes = BitArray(bin=combined_bits).bytes
+        result_bytes = bits_to_bytes(combined_bits)
         self.log.debug("Generating aes key with bytes: " + str(result_bytes) + " and length: " + str(len(result_bytes)))
 
         return result_bytes
@@ -0,0 +1,219 @@
+import logging
+import socket
+import struct
+import time
+from collections import namedtuple
+
+from ntp_raw import RawNTP
+from socket_timestamps import LatencyHistogram, enable_kernel_timestamps, recv_with_timestamp
+
+_ETH_HEADER_LENGTH = 14
+_ETH_P_IP = 0x0800
+_ETH_P_8021Q = 0x8100
+_IPPROTO_UDP = 17
+_UDP_HEADER_LENGTH = 8
+_PACKET_OUTGOING = 4  # The package type (sll_pkttype) of packages sent by this host.
+_NTP_PORT = 123
+
+_PCAP_MAGIC_US = 0xA1B2C3D4
+_PCAP_MAGIC_NS = 0xA1B23C4D
+_PCAP_HEADER_LENGTH = 24
+_PCAP_RECORD_HEADER_LENGTH = 16
+_LINKTYPE_ETHERNET = 1
+_LINKTYPE_RAW = (101, 228)  # Raw IP packages without a link layer header.
+_LINKTYPE_LINUX_SLL = 113  # Captures of the 'any' interface.
+_SLL_HEADER_LENGTH = 16
+
+_IP_HEADER = struct.Struct('!BxHxxHBBxx4s4s')  # Version/IHL, total length, flags/fragment offset, TTL, protocol
+_UDP_HEADER = struct.Struct('!HHH')  # Source port, destination port, length
+
+
+class NTPDatagram(namedtuple('NTPDatagram', 'src_ip dst_ip sport dport payload timestamp_ns', defaults=(None,))):
+    """
+    An immutable record of a received NTP datagram: the addresses and ports of the IP and UDP headers, the NTP
+    package in its wire format and the kernel receive time in ns since the unix epoch, if known.
+    """
+    __slots__ = ()
+
+    def raw(self) -> RawNTP:
+        """
+        :return: the NTP package as RawNTP (a copy).
+        """
+        return RawNTP.from_bytes(self.payload)
+
+    def to_scapy(self):
+        """
+        Dissects the datagram with scapy. Intended for debugging only, since the dissection is expensive.
+        :return: the datagram as IP()/UDP()/NTP().
+        """
+        from scapy.layers.inet import IP, UDP
+        from scapy.layers.ntp import NTP
+        return IP(src=self.src_ip, dst=self.dst_ip) / UDP(sport=self.sport, dport=self.dport) / NTP(self.payload)
+
+
+def parse_ip_packet(data, offset: int = 0) -> NTPDatagram:
+    """
+    Parses an IPv4 package carrying an UDP datagram with fixed offsets, without any dissection of the payload.
+    :param data: a bytes like object.
+    :param offset: the position of the IP header within data.
+    :return: the datagram or None, in case data does not hold a complete, unfragmented IPv4/UDP package.
+    """
+    view = memoryview(data)
+    if len(view) < offset + _IP_HEADER.size:
+        return None
+    version_ihl, total_length, fragment, _, protocol, src, dst = _IP_HEADER.unpack_from(view, offset)
+    if version_ihl >> 4 != 4 or protocol != _IPPROTO_UDP or fragment & 0x3FFF:
+        return None
+    udp_offset = offset + (version_ihl & 0x0F) * 4
+    end = min(offset + total_length, len(view))
+    if end < udp_offset + _UDP_HEADER_LENGTH:
+        return None
+    sport, dport, udp_length = _UDP_HEADER.unpack_from(view, udp_offset)
+    payload_end = min(udp_offset + udp_length, end)
+    payload = bytes(view[udp_offset + _UDP_HEADER_LENGTH:payload_end])
+    return NTPDatagram(socket.inet_ntoa(src), socket.inet_ntoa(dst), sport, dport, payload)
+
+
+def parse_ethernet_frame(frame) -> NTPDatagram:
+    """
+    Parses an Ethernet frame (optionally with one 802.1Q tag) carrying an IPv4/UDP package.
+    :param frame: a bytes like object.
+    :return: the datagram or None, in case the frame does not carry an IPv4/UDP package.
+    """
+    if len(frame) < _ETH_HEADER_LENGTH:
+        return None
+    offset = 12
+    ether_type = int.from_bytes(frame[offset:offset + 2], 'big')
+    if ether_type == _ETH_P_8021Q:
+        offset += 4
+        ether_type = int.from_bytes(frame[offset:offset + 2], 'big')
+    if ether_type != _ETH_P_IP:
+        return None
+    return parse_ip_packet(frame, offset + 2)
+
+
+def read_pcap(file_path: str):
+    """
+    Reads all IPv4/UDP datagrams of a capture file in the classic pcap format, record by record with fixed offsets
+    instead of a scapy dissection of every package.
+    :param file_path: the path to the pcap file.
+    :return: a generator of (frame number as shown by Wireshark, starting at 1, NTPDatagram with the capture time as
+    timestamp_ns). Frames which do not carry an IPv4/UDP datagram are skipped, but counted.
+    """
+    with open(file_path, 'rb') as file:
+        header = file.read(_PCAP_HEADER_LENGTH)
+        if len(header) < _PCAP_HEADER_LENGTH:
+            raise ValueError('Not a pcap file: ' + file_path)
+        for byte_order in ('<', '>'):
+            magic, = struct.unpack(byte_order + 'I', header[:4])
+            if magic in (_PCAP_MAGIC_US, _PCAP_MAGIC_NS):
+                break
+        else:
+            raise ValueError('Not a pcap file (pcapng is not supported): ' + file_path)
+        fraction_ns = 1 if magic == _PCAP_MAGIC_NS else 1000
+        link_type, = struct.unpack(byte_order + 'I', header[20:24])
+        record_header = struct.Struct(byte_order + 'IIII')  # Seconds, fraction, captured length, original length
+
+        frame_number = 0
+        while True:
+            record = file.read(_PCAP_RECORD_HEADER_LENGTH)
+            if len(record) < _PCAP_RECORD_HEADER_LENGTH:
+                return
+            seconds, fraction, captured_length, _ = record_header.unpack(record)
+            frame = file.read(captured_length)
+            frame_number += 1
+            if link_type == _LINKTYPE_ETHERNET:
+                datagram = parse_ethernet_frame(frame)
+            elif link_type in _LINKTYPE_RAW:
+                datagram = parse_ip_packet(frame)
+            elif link_type == _LINKTYPE_LINUX_SLL:
+                is_ip = frame[_SLL_HEADER_LENGTH - 2:_SLL_HEADER_LENGTH] == _ETH_P_IP.to_bytes(2, 'big')
+                datagram = parse_ip_packet(frame, _SLL_HEADER_LENGTH) if is_ip else None
+            else:
+                raise ValueError('Unsupported link type of the pcap file: ' + str(link_type))
+            if datagram is not None:
+                yield frame_number, datagram._replace(timestamp_ns=seconds * 1000000000 + fraction * fraction_ns)
+
+
+class NTPDatagramReceiver:
+    """
+    Receives NTP datagrams from a raw AF_PACKET socket (Linux, requires root or CAP_NET_RAW) and parses them with
+    parse_ethernet_frame. Scapy is not involved at all.
+    """
+
+    def __init__(self, sniff_interface: str, port: int = _NTP_PORT, target_ip_addr: str = None,
+                 include_outgoing: bool = False, log: logging.Logger = logging.getLogger('NTPDatagramReceiver-logger')):
+        """
+        :param sniff_interface: the interface to receive from.
+        :param port: only datagrams from or to this port are returned.
+        :param target_ip_addr: if set, only datagrams sent to this address and port are returned.
+        :param include_outgoing: whether datagrams sent by this host are returned as well.
+        :param log:
+        """
+        self.log = log
+        self.sniff_interface = sniff_interface
+        self.port = port
+        self.target_ip_addr = target_ip_addr
+        self.include_outgoing = include_outgoing
+        self._socket: socket.socket = None
+        self.frames_received = 0
+        self.frames_ignored = 0
+        self.latency = LatencyHistogram()  # From the kernel receive time until a datagram is returned.
+
+    def open(self):
+        """
+        Opens the raw socket. Called by next_datagram if necessary.
+        """
+        if self._socket is not None:
+            return
+        self._socket = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(_ETH_P_IP))
+        self._socket.bind((self.sniff_interface, 0))
+        enable_kernel_timestamps(self._socket)
+        self.log.info('Raw socket opened on interface ' + str(self.sniff_interface))
+
+    def close(self):
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    def accepts(self, datagram: NTPDatagram) -> bool:
+        """
+        :return: True in case the datagram matches the port and target address of this receiver.
+        """
+        if datagram is None:
+            return False
+        if self.target_ip_addr is not None:
+            return datagram.dport == self.port and datagram.dst_ip == self.target_ip_addr
+        return datagram.dport == self.port or datagram.sport == self.port
+
+    def next_datagram(self, timeout: float = None) -> NTPDatagram:
+        """
+        Receives the next matching NTP datagram. This method is blocking.
+        :param timeout: the maximum time to wait in seconds, None waits forever.
+        :return: the datagram or None in case the timeout expired.
+        """
+        self.open()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            if deadline is None:
+                self._socket.settimeout(None)
+            else:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._socket.settimeout(remaining)
+            try:
+                frame, address, kernel_ns = recv_with_timestamp(self._socket, 65535)
+            except socket.timeout:
+                return None
+            self.frames_received += 1
+            if not self.include_outgoing and address[2] == _PACKET_OUTGOING:
+                self.frames_ignored += 1
+                continue
+            datagram = parse_ethernet_frame(frame)
+            if self.accepts(datagram):
+                if kernel_ns is None:
+                    return datagram
+                self.latency.record_since(kernel_ns)
+                return datagram._replace(timestamp_ns=kernel_ns)
+            self.frames_ignored += 1
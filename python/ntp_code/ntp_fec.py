@@ -0,0 +1,117 @@
+_GF_POLYNOMIAL = 0x11D  # x^8 + x^4 + x^3 + x^2 + 1
+_GF_EXP = [0] * 512
+_GF_LOG = [0] * 256
+
+
+def _init_tables():
+    value = 1
+    for power in range(255):
+        _GF_EXP[power] = value
+        _GF_LOG[value] = power
+        value <<= 1
+        if value & 0x100:
+            value ^= _GF_POLYNOMIAL
+    for power in range(255, 512):
+        _GF_EXP[power] = _GF_EXP[power - 255]
+
+
+_init_tables()
+
+
+def gf_mul(a: int, b: int) -> int:
+    """
+    Multiplies two elements of GF(256).
+    """
+    if a == 0 or b == 0:
+        return 0
+    return _GF_EXP[_GF_LOG[a] + _GF_LOG[b]]
+
+
+def gf_inv(a: int) -> int:
+    """
+    :return: the multiplicative inverse of an element of GF(256).
+    """
+    if a == 0:
+        raise ZeroDivisionError('0 has no inverse in GF(256)')
+    return _GF_EXP[255 - _GF_LOG[a]]
+
+
+def _mul_row(factor: int, row: bytes) -> bytes:
+    if factor == 0:
+        return bytes(len(row))
+    log_factor = _GF_LOG[factor]
+    return bytes(0 if value == 0 else _GF_EXP[log_factor + _GF_LOG[value]] for value in row)
+
+
+def _add_rows(a: bytes, b: bytes) -> bytes:
+    return (int.from_bytes(a, 'big') ^ int.from_bytes(b, 'big')).to_bytes(len(a), 'big')
+
+
+class ReedSolomonCode:
+    """
+    A systematic Reed-Solomon (Cauchy) erasure code over GF(256): k data chunks are extended by n - k parity
+    chunks, and the data can be restored from any k of the n chunks, as long as the index of each chunk is known.
+    All chunks of one message have the same length, every byte position is coded independently.
+    """
+
+    def __init__(self, k: int, n: int):
+        """
+        :param k: the number of data chunks.
+        :param n: the total number of chunks (k <= n <= 256).
+        """
+        assert 0 < k <= n <= 256
+        self.k = k
+        self.n = n
+        # Row j of the Cauchy matrix: 1 / (x_j + y_i) with x_j = k + j and y_i = i, all x_j and y_i are distinct.
+        self._parity_rows = [[gf_inv((k + j) ^ i) for i in range(k)] for j in range(n - k)]
+
+    def _row(self, index: int) -> list:
+        if index < self.k:
+            return [1 if i == index else 0 for i in range(self.k)]
+        return self._parity_rows[index - self.k]
+
+    def encode(self, chunks: list) -> list:
+        """
+        :param chunks: the k data chunks as bytes of equal length.
+        :return: all n chunks, the first k are the unchanged data chunks.
+        """
+        assert len(chunks) == self.k
+        assert len({len(chunk) for chunk in chunks}) == 1
+        chunks = [bytes(chunk) for chunk in chunks]
+        result = list(chunks)
+        for row in self._parity_rows:
+            parity = bytes(len(chunks[0]))
+            for factor, chunk in zip(row, chunks):
+                parity = _add_rows(parity, _mul_row(factor, chunk))
+            result.append(parity)
+        return result
+
+    def decode(self, received: dict) -> list:
+        """
+        :param received: a dict mapping the index of each received chunk to its bytes, at least k entries.
+        :return: the k data chunks.
+        :raises ValueError: in case less than k chunks were received.
+        """
+        if len(received) < self.k:
+            raise ValueError('At least ' + str(self.k) + ' chunks are needed, only ' + str(len(received))
+                             + ' were received.')
+        if all(i in received for i in range(self.k)):
+            return [bytes(received[i]) for i in range(self.k)]
+
+        # Gauss-Jordan elimination of [A | chunks] with A holding the generator rows of k received chunks.
+        indices = sorted(received)[:self.k]
+        matrix = [list(self._row(index)) for index in indices]
+        values = [bytes(received[index]) for index in indices]
+        for column in range(self.k):
+            pivot = next(r for r in range(column, self.k) if matrix[r][column] != 0)
+            matrix[column], matrix[pivot] = matrix[pivot], matrix[column]
+            values[column], values[pivot] = values[pivot], values[column]
+            inverse = gf_inv(matrix[column][column])
+            matrix[column] = [gf_mul(inverse, value) for value in matrix[column]]
+            values[column] = _mul_row(inverse, values[column])
+            for r in range(self.k):
+                factor = matrix[r][column]
+                if r != column and factor != 0:
+                    matrix[r] = [a ^ gf_mul(factor, b) for a, b in zip(matrix[r], matrix[column])]
+                    values[r] = _add_rows(values[r], _mul_row(factor, values[column]))
+        return values
@@ -0,0 +1,138 @@
+import logging
+import random
+import time
+from collections import deque
+from threading import Event, Thread
+
+from scapy.layers.ntp import NTP
+
+from ntp_timestamp import ntp_timestamp_now
+
+# The first 16 byte (LI, VN, mode, stratum, poll, precision, root delay/dispersion, reference id) of a scapy NTP().
+_HEADER_TEMPLATE = bytes(NTP())[:16]
+_ZERO_TIMESTAMP = bytes(8)
+
+
+class NTPPacketFactory:
+    """
+    Creates the NTP packages used by the covert channels directly in their wire format. The current time is stamped
+    into the timestamps and their last bits are filled with random values from a single random draw.
+    Optionally keeps a pool of ready packages which is refilled by a background thread, so the send path does not
+    have to construct packages at all.
+    """
+
+    def __init__(self, num_of_digits_to_fill_up: int = 12, pool_size: int = 0, max_age_sec: float = 0.2,
+                 log: logging.Logger = logging.getLogger('NTPPacketFactory-Logger')):
+        """
+        :param num_of_digits_to_fill_up: the number of low order bits of each timestamp to fill with random values.
+        :param pool_size: the number of packages of each type kept in the pool, 0 disables the pool.
+        :param max_age_sec: packages older than this are not taken from the pool, since their timestamps would be
+        noticeably behind the current time.
+        :param log:
+        """
+        self.log = log
+        self.num_of_digits_to_fill_up = num_of_digits_to_fill_up
+        self.pool_size = pool_size
+        self.max_age_sec = max_age_sec
+        self._random = random.SystemRandom()
+        self._init_pool = deque(maxlen=max(pool_size, 1))
+        self._client_pool = deque(maxlen=max(pool_size, 1))
+        self._stop_event = Event()
+        self._refill_thread: Thread = None
+        self.pool_hits = 0
+        self.pool_misses = 0
+
+    def _stamp(self, now: int, rand: int) -> int:
+        mask = (1 << self.num_of_digits_to_fill_up) - 1
+        return (now & ~mask) | (rand & mask)
+
+    def create_init_pck_bytes(self) -> bytes:
+        """
+        Creates a new NTP package, fills all 4 64 bit timestamps with the current time and fills up the last bits
+        with random values.
+        :return: the package in its wire format.
+        """
+        now = ntp_timestamp_now()
+        bits = self.num_of_digits_to_fill_up
+        rand = self._random.getrandbits(4 * bits) if bits > 0 else 0
+        timestamps = b''.join(self._stamp(now, rand >> (i * bits)).to_bytes(8, 'big') for i in range(4))
+        return _HEADER_TEMPLATE + timestamps
+
+    def create_client_pck_bytes(self) -> bytes:
+        """
+        Creates a new NTP package, fills only the transmit timestamp with the current time and fills up its last
+        bits with random values. The other timestamps are set to 0.
+        :return: the package in its wire format.
+        """
+        bits = self.num_of_digits_to_fill_up
+        rand = self._random.getrandbits(bits) if bits > 0 else 0
+        transmit = self._stamp(ntp_timestamp_now(), rand).to_bytes(8, 'big')
+        return _HEADER_TEMPLATE + _ZERO_TIMESTAMP * 3 + transmit
+
+    def init_pck_bytes(self) -> bytes:
+        """
+        :return: an init package (see create_init_pck_bytes), taken from the pool if possible.
+        """
+        return self._take(self._init_pool, self.create_init_pck_bytes)
+
+    def client_pck_bytes(self) -> bytes:
+        """
+        :return: a client package (see create_client_pck_bytes), taken from the pool if possible.
+        """
+        return self._take(self._client_pool, self.create_client_pck_bytes)
+
+    def _take(self, pool: deque, create) -> bytes:
+        if self.pool_size > 0:
+            try:
+                created, pck = pool.popleft()
+                if time.monotonic() - created <= self.max_age_sec:
+                    self.pool_hits += 1
+                    return pck
+            except IndexError:
+                pass
+            self.pool_misses += 1
+        return create()
+
+    def start(self):
+        """
+        Starts the background thread which keeps the pool filled with fresh packages. Does nothing if the pool is
+        disabled or already running.
+        """
+        if self.pool_size <= 0 or self._refill_thread is not None:
+            return
+        self._stop_event.clear()
+        self._refill_thread = Thread(target=self._refill, name='NTPPacketFactory-refill', daemon=True)
+        self._refill_thread.start()
+
+    def stop(self):
+        """
+        Stops the background refill thread and empties the pool.
+        """
+        if self._refill_thread is None:
+            return
+        self._stop_event.set()
+        self._refill_thread.join()
+        self._refill_thread = None
+        self._init_pool.clear()
+        self._client_pool.clear()
+
+    def _refill(self):
+        # New packages are added on the left, the oldest one drops out on the right of the bounded deque. This way
+        # the pool is renewed completely every max_age_sec / 2.
+        interval = self.max_age_sec / (2 * self.pool_size)
+        self.log.debug('Refilling the package pool every ' + str(interval) + ' sec.')
+        while not self._stop_event.is_set():
+            self._init_pool.appendleft((time.monotonic(), self.create_init_pck_bytes()))
+            self._client_pool.appendleft((time.monotonic(), self.create_client_pck_bytes()))
+            if len(self._init_pool) >= self.pool_size and len(self._client_pool) >= self.pool_size:
+                self._stop_event.wait(interval)
+
+
+_default_factory = NTPPacketFactory()
+
+
+def default_packet_factory() -> NTPPacketFactory:
+    """
+    :return: the shared factory (without pool) used when no other factory is configured.
+    """
+    return _default_factory
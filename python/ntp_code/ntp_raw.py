@@ -1,164 +1,219 @@
 import logging
+from collections import namedtuple
 from enum import Enum
 
-from bitstring import BitArray
 from scapy.layers.ntp import NTPHeader, NTP
 
+NTP_HEADER_LENGTH = 48
+
 
 class RawNTP:
     """
     A pure bit representation of NTP packages. Provides methods to access the bit masks of the different NTP fields.
+    The package is stored as a bytearray and all bit accesses are performed in place on these bytes.
     """
 
     def __init__(self, ntp_pck: NTP = NTPHeader()):
-        self._raw = RawNTP.__pck_to_bits(ntp_pck)
-        self._orig = ntp_pck
+        """
+        :param ntp_pck: either a scapy NTP package or the raw wire bytes (bytes, bytearray or memoryview) of one.
+        """
+        if isinstance(ntp_pck, (bytes, bytearray, memoryview)):
+            self._bytes = bytearray(ntp_pck)
+        else:
+            self._bytes = bytearray(bytes(ntp_pck))
+        if len(self._bytes) < NTP_HEADER_LENGTH:
+            raise ValueError('An NTP package has at least ' + str(NTP_HEADER_LENGTH) + ' bytes, got '
+                             + str(len(self._bytes)) + '.')
         self.log = logging.getLogger('default_logger')
 
+    @classmethod
+    def from_bytes(cls, data, offset: int = 0):
+        """
+        Creates a package directly from its wire format without a scapy dissection.
+        :param data: the raw bytes (bytes, bytearray or memoryview), e.g. the payload of a UDP datagram.
+        :param offset: the position of the first NTP byte within data, e.g. the length of the IP and UDP header.
+        :return: the new package.
+        :raises ValueError: in case less than NTP_HEADER_LENGTH bytes follow the offset.
+        """
+        return cls(memoryview(data)[offset:])
+
+    @classmethod
+    def from_scapy(cls, ntp_pck: NTP):
+        """
+        Creates a package from a scapy NTP package.
+        :param ntp_pck: the scapy package.
+        :return: the new package.
+        """
+        return cls(ntp_pck)
+
+    def to_bytes(self) -> bytes:
+        """
+        :return: the package in its wire format.
+        """
+        return bytes(self._bytes)
+
+    @property
+    def _raw(self) -> str:
+        """
+        :return: the complete package as a bit string in the format '0101'.
+        """
+        return format(int.from_bytes(self._bytes, 'big'), '0' + str(len(self._bytes) * 8) + 'b')
+
     def ntp(self) -> NTP:
         """
         :return: creates a scapy.NTP package from this raw package representation.
         """
-        raw = BitArray(bin=self._raw).bytes
-        ntp = NTP(raw)
+        ntp = NTP(bytes(self._bytes))
         return ntp
 
     def __str__(self):
         x = ''
-        for i in range(len(self._raw)):
+        raw = self._raw
+        for i in range(len(raw)):
             if i % 8 == 0:
                 x += ' '
-            x += self._raw[i]
+            x += raw[i]
         return 'Raw bits: ' + x
 
-    def li(self):
-        x = self._raw[0:2]
+    def get_bits(self, start: int, length: int) -> int:
+        """
+        Reads the bits [start, start + length) of the package as an unsigned integer.
+        :param start: the position of the first bit (0 is the most significant bit of the first byte).
+        :param length: the number of bits to read.
+        :return: the bits as an integer.
+        """
+        first_byte = start >> 3
+        last_byte = (start + length + 7) >> 3
+        value = int.from_bytes(self._bytes[first_byte:last_byte], 'big')
+        value >>= (last_byte << 3) - start - length
+        return value & ((1 << length) - 1)
 
-        return x
+    def set_bits(self, start: int, length: int, value: int):
+        """
+        Overwrites the bits [start, start + length) of the package in place with the given unsigned integer.
+        :param start: the position of the first bit (0 is the most significant bit of the first byte).
+        :param length: the number of bits to write.
+        :param value: the new value, must fit into length bits.
+        """
+        assert 0 <= value < (1 << length)
+        first_byte = start >> 3
+        last_byte = (start + length + 7) >> 3
+        shift = (last_byte << 3) - start - length
+        mask = ((1 << length) - 1) << shift
+        current = int.from_bytes(self._bytes[first_byte:last_byte], 'big')
+        current = (current & ~mask) | (value << shift)
+        self._bytes[first_byte:last_byte] = current.to_bytes(last_byte - first_byte, 'big')
+
+    def li(self):
+        return self.get_field(NTPField.LI)
 
     def set_li(self, value):
-        assert len(value) == 2
-        self._raw = value + self._raw[2:]
+        self.set_field(value, NTPField.LI)
 
     def vn(self):
-        x = self._raw[2:5]
-
-        return x
+        return self.get_field(NTPField.VN)
 
     def set_vn(self, value):
-        assert len(value) == 3
-        self._raw = self._raw[0:2] + value + self._raw[5:]
+        self.set_field(value, NTPField.VN)
 
     def mode(self):
-        x = self._raw[5:8]
-        return x
+        return self.get_field(NTPField.MODE)
 
     def set_mode(self, value):
-        assert len(value) == 3
-        self._raw = self._raw[0:5] + value + self._raw[8:]
+        self.set_field(value, NTPField.MODE)
 
     def stratum(self):
-        x = self._raw[8:16]
-        return x
+        return self.get_field(NTPField.STRATUM)
+
+    def set_stratum(self, value):
+        self.set_field(value, NTPField.STRATUM)
 
     def poll(self):
-        x = self._raw[16:24]
-        return x
+        return self.get_field(NTPField.POLL)
+
+    def set_poll(self, value):
+        self.set_field(value, NTPField.POLL)
 
     def precision(self):
-        x = self._raw[24:32]
-        return x
+        return self.get_field(NTPField.PRECISION)
+
+    def set_precision(self, value):
+        self.set_field(value, NTPField.PRECISION)
 
     def root_delay(self):
-        x = self._raw[32:64]
-        return x
+        return self.get_field(NTPField.ROOT_DELAY)
+
+    def set_root_delay(self, value):
+        self.set_field(value, NTPField.ROOT_DELAY)
 
     def root_dispersion(self):
-        x = self._raw[64:96]
-        return x
+        return self.get_field(NTPField.ROOT_DISPERSION)
+
+    def set_root_dispersion(self, value):
+        self.set_field(value, NTPField.ROOT_DISPERSION)
 
     def reference_id(self):
-        x = self._raw[96:128]
-        return x
+        return self.get_field(NTPField.REFERENCE_ID)
+
+    def set_reference_id(self, value):
+        self.set_field(value, NTPField.REFERENCE_ID)
 
     def reference_timestamp(self):
-        x = self._raw[128:192]
-        return x
+        return self.get_field(NTPField.REFERENCE_TIMESTAMP)
 
     def set_reference_timestamp(self, value: str):
-        assert len(value) == 64
-        x_raw = self._raw
-        self._raw = self._raw[:128] + value + x_raw[192:]
+        self.set_field(value, NTPField.REFERENCE_TIMESTAMP)
 
     def origin_timestamp(self):
-        x = self._raw[192:256]
-        return x
+        return self.get_field(NTPField.ORIGIN_TIMESTAMP)
 
     def set_origin_timestamp(self, value: str):
-        assert len(value) == 64
-        x_raw = self._raw
-        self._raw = self._raw[:192] + value + x_raw[256:]
+        self.set_field(value, NTPField.ORIGIN_TIMESTAMP)
 
     def receive_timestamp(self):
-        x = self._raw[256:320]
-        return x
+        return self.get_field(NTPField.RECEIVE_TIMESTAMP)
 
     def set_receive_timestamp(self, value: str):
-        assert len(value) == 64
-        x_raw = self._raw
-        self._raw = self._raw[:256] + value + x_raw[320:]
+        self.set_field(value, NTPField.RECEIVE_TIMESTAMP)
 
     def transmit_timestamp(self):
-        x = self._raw[320:384]
-        return x
+        return self.get_field(NTPField.TRANSMIT_TIMESTAMP)
 
     def set_transmit_timestamp(self, value: str):
-        assert len(value) == 64
-        self._raw = self._raw[:320] + value
+        self.set_field(value, NTPField.TRANSMIT_TIMESTAMP)
 
     def get_field(self, field_name) -> str:
-        if field_name is NTPField.LI:
-            return self.li()
-        elif field_name is NTPField.VN:
-            return self.vn()
-        elif field_name is NTPField.ORIGIN_TIMESTAMP:
-            return self.origin_timestamp()
-        elif field_name is NTPField.RECEIVE_TIMESTAMP:
-            return self.receive_timestamp()
-        elif field_name is NTPField.REFERENCE_TIMESTAMP:
-            return self.reference_timestamp()
-        elif field_name is NTPField.TRANSMIT_TIMESTAMP:
-            return self.transmit_timestamp()
-        else:
-            raise Exception('Field type ' + str(field_name) + ' not supported')
+        """
+        :param field_name: the NTPField to read.
+        :return: the bits of the field as a string in the format '0101'.
+        """
+        descriptor = _field_descriptor(field_name)
+        return format(self.get_bits(descriptor.offset, descriptor.width), descriptor.bit_format)
 
     def set_field(self, value, field_name):
-        if field_name is NTPField.LI:
-            self.set_li(value)
-        elif field_name is NTPField.VN:
-            self.set_vn(value)
-        elif field_name is NTPField.RECEIVE_TIMESTAMP:
-            self.set_receive_timestamp(value)
-        elif field_name is NTPField.TRANSMIT_TIMESTAMP:
-            self.set_transmit_timestamp(value)
-        else:
-            raise Exception('Field type ' + str(field_name) + ' not supported')
+        """
+        :param value: the new bits of the field as a string in the format '0101', must match the field length.
+        :param field_name: the NTPField to write.
+        """
+        descriptor = _field_descriptor(field_name)
+        assert len(value) == descriptor.width
+        self.set_bits(descriptor.offset, descriptor.width, int(value, 2))
 
-    @staticmethod
-    def __pck_to_bits(pck) -> str:
+    def get_field_int(self, field_name) -> int:
+        """
+        :param field_name: the NTPField to read.
+        :return: the field as an unsigned integer.
+        """
+        descriptor = _field_descriptor(field_name)
+        return self.get_bits(descriptor.offset, descriptor.width)
+
+    def set_field_int(self, value: int, field_name):
         """
-        Transforms a scpay package into its bit representation.
-        :param pck: the package to transform
-        :return: a bit representation of the packages content
+        :param value: the new value of the field as an unsigned integer.
+        :param field_name: the NTPField to write.
         """
-        orig_pck_len = len(pck) * 8
-        pck = bytes(pck).hex()
-        pck = bin(int(pck, 16))[2:]
-        pck_len = len(pck)
-        for i in range(orig_pck_len - pck_len):
-            # Add the leading 0's, which were lost during the int transformation
-            pck = '0' + pck
-        return pck
+        descriptor = _field_descriptor(field_name)
+        self.set_bits(descriptor.offset, descriptor.width, value)
 
 
 class NTPField(Enum):
@@ -183,7 +238,51 @@ class NTPField(Enum):
         """
         :return: the size of the field in bits.
         """
-        if self is NTPField.REFERENCE_TIMESTAMP or self is NTPField.ORIGIN_TIMESTAMP \
-                or self is NTPField.RECEIVE_TIMESTAMP or self is NTPField.TRANSMIT_TIMESTAMP:
-            return 64
-        raise ValueError("Not defined/implemented yet!")
+        return _FIELD_DESCRIPTORS[self].width
+
+    def offset(self) -> int:
+        """
+        :return: the position of the first bit of the field within the package.
+        """
+        return _FIELD_DESCRIPTORS[self].offset
+
+    def descriptor(self):
+        """
+        :return: the NTPFieldDescriptor (offset, width, mask) of the field.
+        """
+        return _FIELD_DESCRIPTORS[self]
+
+
+class NTPFieldDescriptor(namedtuple('NTPFieldDescriptor', ['offset', 'width', 'mask', 'bit_format'])):
+    """
+    The position of one NTP field within the package: offset and width in bits, the mask of the field value and the
+    format spec to print it as a zero padded bit string.
+    """
+
+    @staticmethod
+    def create(offset: int, width: int):
+        return NTPFieldDescriptor(offset, width, (1 << width) - 1, '0' + str(width) + 'b')
+
+
+_FIELD_DESCRIPTORS = {
+    NTPField.LI: NTPFieldDescriptor.create(0, 2),
+    NTPField.VN: NTPFieldDescriptor.create(2, 3),
+    NTPField.MODE: NTPFieldDescriptor.create(5, 3),
+    NTPField.STRATUM: NTPFieldDescriptor.create(8, 8),
+    NTPField.POLL: NTPFieldDescriptor.create(16, 8),
+    NTPField.PRECISION: NTPFieldDescriptor.create(24, 8),
+    NTPField.ROOT_DELAY: NTPFieldDescriptor.create(32, 32),
+    NTPField.ROOT_DISPERSION: NTPFieldDescriptor.create(64, 32),
+    NTPField.REFERENCE_ID: NTPFieldDescriptor.create(96, 32),
+    NTPField.REFERENCE_TIMESTAMP: NTPFieldDescriptor.create(128, 64),
+    NTPField.ORIGIN_TIMESTAMP: NTPFieldDescriptor.create(192, 64),
+    NTPField.RECEIVE_TIMESTAMP: NTPFieldDescriptor.create(256, 64),
+    NTPField.TRANSMIT_TIMESTAMP: NTPFieldDescriptor.create(320, 64),
+}
+
+
+def _field_descriptor(field_name) -> NTPFieldDescriptor:
+    descriptor = _FIELD_DESCRIPTORS.get(field_name)
+    if descriptor is None:
+        raise Exception('Field type ' + str(field_name) + ' not supported')
+    return descriptor
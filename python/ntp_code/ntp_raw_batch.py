@@ -0,0 +1,180 @@
+import numpy as np
+
+from ntp_datagram import read_pcap
+from ntp_raw import NTPField, RawNTP
+from ntp_timestamp import ntp64_fraction_digits_array
+
+_NTP_RECORD_LENGTH = 48
+_NTP_PORT = 123
+
+_NTP_DTYPE = np.dtype([
+    ('li_vn_mode', 'u1'),
+    ('stratum', 'u1'),
+    ('poll', 'u1'),
+    ('precision', 'u1'),
+    ('root_delay', '>u4'),
+    ('root_dispersion', '>u4'),
+    ('reference_id', '>u4'),
+    ('reference_timestamp', '>u8'),
+    ('origin_timestamp', '>u8'),
+    ('receive_timestamp', '>u8'),
+    ('transmit_timestamp', '>u8'),
+])
+
+
+def _column_of(field: NTPField):
+    """
+    Maps the NTPFieldDescriptor of a field to the record column which holds it.
+    :return: (column, shift, mask), a mask of None means the field occupies the complete column.
+    """
+    descriptor = field.descriptor()
+    if descriptor.offset % 8 == 0 and descriptor.width % 8 == 0:
+        return field.name.lower(), 0, None
+    # LI, VN and mode share the first byte of the package.
+    return 'li_vn_mode', 8 - descriptor.offset % 8 - descriptor.width, descriptor.mask
+
+
+_COLUMNS = {field: _column_of(field) for field in NTPField}
+
+
+class RawNTPBatch:
+    """
+    Holds N NTP packages as a NumPy structured array of 48 byte records. Every NTPField is available as a
+    vectorized column, which allows analysing complete captures with array operations instead of one RawNTP per
+    package.
+    """
+
+    def __init__(self, records: np.ndarray, frame_numbers: np.ndarray = None):
+        """
+        :param records: a structured array with the NTP record dtype, see RawNTPBatch.empty() or the from_* methods.
+        :param frame_numbers: the number of every package within its capture file (see from_pcap), the position in
+        the batch starting at 1 if not set.
+        """
+        assert records.dtype == _NTP_DTYPE
+        self._records = records
+        if frame_numbers is None:
+            frame_numbers = np.arange(1, len(records) + 1)
+        assert len(frame_numbers) == len(records)
+        self._frame_numbers = np.asarray(frame_numbers)
+
+    @staticmethod
+    def empty(n: int):
+        """
+        :param n: the number of packages.
+        :return: a batch of n packages with all bits set to 0.
+        """
+        return RawNTPBatch(np.zeros(n, dtype=_NTP_DTYPE))
+
+    @staticmethod
+    def from_buffer(data) -> 'RawNTPBatch':
+        """
+        Creates a batch from a buffer of consecutive 48 byte NTP records. The data is copied.
+        :param data: the bytes like object, its length has to be a multiple of 48.
+        """
+        assert len(data) % _NTP_RECORD_LENGTH == 0
+        return RawNTPBatch(np.frombuffer(data, dtype=_NTP_DTYPE).copy())
+
+    @staticmethod
+    def from_bytes(packages) -> 'RawNTPBatch':
+        """
+        Creates a batch from an iterable of NTP wire packages. Packages are truncated (extension fields, MAC)
+        or padded with 0 bits to 48 byte.
+        :param packages: an iterable of bytes like objects.
+        """
+        records = bytearray()
+        for pck in packages:
+            pck = bytes(pck[:_NTP_RECORD_LENGTH])
+            records += pck + bytes(_NTP_RECORD_LENGTH - len(pck))
+        return RawNTPBatch.from_buffer(records)
+
+    @staticmethod
+    def from_raw_ntp(packages) -> 'RawNTPBatch':
+        """
+        :param packages: an iterable of RawNTP packages.
+        """
+        return RawNTPBatch.from_bytes(pck.to_bytes() for pck in packages)
+
+    @staticmethod
+    def from_pcap(file_path: str) -> 'RawNTPBatch':
+        """
+        Reads all NTP packages (UDP port 123) of the given capture file. Other packages are skipped, the frame
+        numbers of the NTP packages within the file are kept (see frame_numbers).
+        :param file_path: the path to the pcap file.
+        """
+        frame_numbers = []
+        payloads = []
+        for frame_number, datagram in read_pcap(file_path):
+            if datagram.sport == _NTP_PORT or datagram.dport == _NTP_PORT:
+                frame_numbers.append(frame_number)
+                payloads.append(datagram.payload)
+        batch = RawNTPBatch.from_bytes(payloads)
+        return RawNTPBatch(batch.records(), np.array(frame_numbers, dtype=np.int64))
+
+    def __len__(self):
+        return len(self._records)
+
+    def __getitem__(self, index: int) -> RawNTP:
+        """
+        :return: a copy of the package at the given index as RawNTP.
+        """
+        return RawNTP.from_bytes(self._records[index:index + 1].tobytes())
+
+    def records(self) -> np.ndarray:
+        """
+        :return: the underlying structured array (not a copy).
+        """
+        return self._records
+
+    def frame_numbers(self) -> np.ndarray:
+        """
+        :return: the number of every package within its capture file, as shown by Wireshark (starting at 1).
+        """
+        return self._frame_numbers
+
+    def get_field(self, field: NTPField) -> np.ndarray:
+        """
+        :param field: the field to read.
+        :return: the values of the field for all packages as an uint8, uint32 or uint64 array in native byte order.
+        """
+        column, shift, mask = _COLUMNS[field]
+        values = self._records[column]
+        values = values.astype(values.dtype.newbyteorder('='))
+        if mask is None:
+            return values
+        return (values >> shift) & mask
+
+    def set_field(self, values, field: NTPField):
+        """
+        Sets the field of all packages.
+        :param values: either one value for all packages or an array with one value per package.
+        :param field: the field to set.
+        """
+        column, shift, mask = _COLUMNS[field]
+        if mask is None:
+            self._records[column] = values
+            return
+        current = self._records[column]
+        values = np.asarray(values, dtype=current.dtype)
+        self._records[column] = (current & ~np.uint8(mask << shift)) | ((values & mask) << shift)
+
+    def fraction_digits(self, field: NTPField, digits: int = 9) -> np.ndarray:
+        """
+        :param field: one of the four 64 bit timestamp fields.
+        :param digits: the number of decimal digits of the fraction, at most 9.
+        :return: an uint8 array of shape (N, digits) with the decimal fraction digits of every package.
+        """
+        assert field.length() == 64
+        return ntp64_fraction_digits_array(self.get_field(field), digits)
+
+    def to_bytes(self) -> bytes:
+        """
+        :return: all packages in their wire format, concatenated.
+        """
+        return self._records.tobytes()
+
+    def to_list(self) -> list:
+        """
+        :return: a list with the wire format of every package.
+        """
+        data = self.to_bytes()
+        return [data[i:i + _NTP_RECORD_LENGTH] for i in range(0, len(data), _NTP_RECORD_LENGTH)]
@@ -0,0 +1,74 @@
+import timeit
+
+from bitstring import BitArray
+from scapy.layers.ntp import NTP
+
+from ntp_raw import RawNTP
+from ntp_utils import init_ntp_pck
+
+_PAYLOAD = '1000101011010011'
+
+
+class _StringRawNTP:
+    """
+    The former string based package representation (one '0'/'1' character per bit), kept for comparison only.
+    """
+
+    def __init__(self, ntp_pck: NTP):
+        orig_pck_len = len(ntp_pck) * 8
+        pck = bin(int(bytes(ntp_pck).hex(), 16))[2:]
+        for i in range(orig_pck_len - len(pck)):
+            pck = '0' + pck
+        self._raw = pck
+
+    def ntp(self) -> NTP:
+        return NTP(BitArray(bin=self._raw).bytes)
+
+    def transmit_timestamp(self):
+        return self._raw[320:384]
+
+    def set_transmit_timestamp(self, value: str):
+        assert len(value) == 64
+        self._raw = self._raw[:320] + value
+
+
+def _round_trip(raw_type, ntp_pck: NTP):
+    """
+    Parses the package, adds a CP1 payload to the transmit timestamp and serializes it again.
+    """
+    raw = raw_type(ntp_pck)
+    field_value = raw.transmit_timestamp()
+    raw.set_transmit_timestamp(field_value[:40] + _PAYLOAD + field_value[56:])
+    return raw.ntp()
+
+
+def _round_trip_wire(wire_bytes: bytes) -> bytes:
+    """
+    Same as _round_trip, but reads and writes the wire format directly without any scapy dissection.
+    """
+    raw = RawNTP.from_bytes(wire_bytes)
+    field_value = raw.transmit_timestamp()
+    raw.set_transmit_timestamp(field_value[:40] + _PAYLOAD + field_value[56:])
+    return raw.to_bytes()
+
+
+def run_benchmark(number: int = 2000):
+    """
+    Measures parse -> modify -> serialize per package for the string and the byte based representation.
+    :param number: the number of round trips per representation.
+    :return: a dict with the average time per package in microseconds for each representation.
+    """
+    ntp_pck = init_ntp_pck()
+    wire_bytes = bytes(ntp_pck)
+    results = {}
+    for name, raw_type in (('string', _StringRawNTP), ('bytes', RawNTP)):
+        total = timeit.timeit(lambda: _round_trip(raw_type, ntp_pck), number=number)
+        results[name] = total / number * 1000000
+    total = timeit.timeit(lambda: _round_trip_wire(wire_bytes), number=number)
+    results['bytes (wire, no scapy)'] = total / number * 1000000
+    return results
+
+
+if __name__ == '__main__':
+    for representation, micro_sec in run_benchmark().items():
+        print(representation + ': ' + str(round(micro_sec, 2)) + ' us per package')
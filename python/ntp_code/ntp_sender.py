@@ -0,0 +1,125 @@
+import logging
+import socket
+import struct
+import time
+
+_NTP_PORT = 123
+# UDP segmentation offload (Linux >= 4.18): the kernel splits the buffer of one sendmsg into datagrams of the size
+# given by the UDP_SEGMENT control message, at most 64 of them and not more than one maximal UDP payload in total.
+_SOL_UDP = 17
+_UDP_SEGMENT = 103
+_MAX_SEGMENTS = 64
+_MAX_UDP_PAYLOAD = 65507
+
+
+class NTPSender:
+    """
+    Sends NTP packages in their wire format over one socket, which is opened on first use and then kept open, instead
+    of opening a new raw socket for every package like scapy send() does. By default an ordinary UDP socket is used,
+    where the kernel chooses the source port. With raw=True, the packages are sent over a kept scapy L3 socket, which
+    allows any source port (root privileges needed).
+    """
+
+    def __init__(self, dst_port: int = _NTP_PORT, src_port: int = None, raw: bool = False,
+                 log: logging.Logger = logging.getLogger('NTPSender-logger')):
+        """
+        :param dst_port: the destination port of all packages.
+        :param src_port: the source port. Any free port if not set (and the scapy default 123 in raw mode).
+        :param raw: whether the IP and UDP headers are built by scapy and sent over a raw socket.
+        :param log:
+        """
+        self.log = log
+        self.dst_port = dst_port
+        self.src_port = src_port
+        self.raw = raw
+        self._socket = None
+        self._segmentation = not raw and hasattr(socket.socket, 'sendmsg')  # Cleared if the kernel rejects it.
+        self.packets_sent = 0
+
+    def open(self):
+        """
+        Opens the socket. Called by send if necessary.
+        """
+        if self._socket is not None:
+            return
+        if self.raw:
+            from scapy.config import conf
+            self._socket = conf.L3socket()
+        else:
+            self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            if self.src_port is not None:
+                self._socket.bind(('', self.src_port))
+        self.log.debug('Send socket opened (raw: ' + str(self.raw) + ')')
+
+    def close(self):
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    def send(self, payload: bytes, ip_addr: str, dst_port: int = None):
+        """
+        Sends one package.
+        :param payload: the NTP package in its wire format.
+        :param ip_addr: the destination.
+        :param dst_port: the destination port of this package, the dst_port of the sender if not set (e.g. to answer
+        a package from its source port).
+        """
+        self.open()
+        dst_port = self.dst_port if dst_port is None else dst_port
+        if self.raw:
+            from scapy.layers.inet import IP, UDP
+            from scapy.packet import Raw
+            udp = UDP(dport=dst_port) if self.src_port is None else UDP(sport=self.src_port, dport=dst_port)
+            self._socket.send(IP(dst=ip_addr) / udp / Raw(payload))
+        else:
+            self._socket.sendto(payload, (ip_addr, dst_port))
+        self.packets_sent += 1
+
+    def send_all(self, payloads, ip_addr: str, interval_sec: float = 0):
+        """
+        Sends packages back to back or paced. The send times are scheduled relative to the first package, so the
+        time spent for sending does not add up to the interval.
+        Back to back packages are sent in batches over the UDP socket: Python has no sendmmsg, but with UDP
+        segmentation offload one sendmsg carries up to 64 consecutive packages of equal length, which the kernel
+        sends as separate datagrams. Where the kernel does not support it, and for paced or raw packages, every
+        package takes one syscall.
+        :param payloads: the NTP packages in their wire format. An item may also be a callable without parameters
+        returning the package, which is only called at the send time of the package, so the timestamps of a paced
+        package match its send time.
+        :param ip_addr: the destination.
+        :param interval_sec: the time between the start of two packages.
+        """
+        if interval_sec <= 0 and self._segmentation:
+            self._send_batched([payload() if callable(payload) else payload for payload in payloads], ip_addr)
+            return
+        start = time.perf_counter()
+        for i, payload in enumerate(payloads):
+            if interval_sec > 0:
+                delay = start + i * interval_sec - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            self.send(payload() if callable(payload) else payload, ip_addr)
+
+    def _send_batched(self, payloads: list, ip_addr: str):
+        self.open()
+        i = 0
+        while i < len(payloads):
+            size = len(payloads[i])
+            max_segments = min(_MAX_SEGMENTS, _MAX_UDP_PAYLOAD // size) if size > 0 else 1
+            end = i + 1
+            while end < len(payloads) and end - i < max_segments and len(payloads[end]) == size:
+                end += 1
+            if end - i > 1 and self._segmentation:
+                try:
+                    self._socket.sendmsg([b''.join(payloads[i:end])],
+                                         [(_SOL_UDP, _UDP_SEGMENT, struct.pack('=H', size))], 0,
+                                         (ip_addr, self.dst_port))
+                    self.packets_sent += end - i
+                    i = end
+                    continue
+                except OSError as e:
+                    self.log.info('UDP segmentation not available, sending one package per syscall: ' + repr(e))
+                    self._segmentation = False
+            for payload in payloads[i:end]:
+                self.send(payload, ip_addr)
+            i = end
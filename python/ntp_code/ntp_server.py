@@ -1,18 +1,205 @@
+import logging
+import multiprocessing
+import os
+import queue
+import select
+import socket
+import struct
+import time
+
 from scapy.layers.inet import IP, UDP
 from scapy.layers.ntp import NTP
 from scapy.packet import Packet
-from scapy.sendrecv import sniff, sr1, send
+from scapy.sendrecv import sr1, send
 
+from capture_source import CaptureSource
+from interceptor_chain import InterceptorChain, NTPInterceptorStage, PacketView, Verdict
+from ntp_datagram import NTPDatagram
+from ntp_raw import RawNTP
+from socket_timestamps import LatencyHistogram, enable_kernel_timestamps, recv_with_timestamp
+from ntp_timestamp import ntp_timestamp_now, unix_ns_to_ntp64
 from ntp_utils import ntp_time_now
 
+_NTP_PORT = 123
+_NTP_PACKET_LENGTH = 48
+_CLIENT_MODE = 3
+_SERVER_MODE = 4
+_WORKER_POLL_INTERVAL_SEC = 0.2
+# LI/VN/mode, stratum, poll, precision, root delay, root dispersion, reference id, reference timestamp and the
+# origin, receive and transmit timestamps.
+_NTP_HEADER = struct.Struct('!BBbbII4sQQQQ')
+_TIMESTAMP = struct.Struct('!Q')
+
 
 class NTPInterceptor:
+    """
+    The hooks of an NTPServer. The scapy hooks intercept_req and intercept_res are only called by the serving mode
+    (NTPServer.serve) if they are overridden, since the dissection is expensive; override the raw hooks instead.
+    In the serving mode, the interceptors are stages of the request and response chains (see NTPInterceptorStage).
+    """
+
     def intercept_req(self, pck):
         return pck
 
     def intercept_res(self, pck):
         return pck
 
+    def intercept_req_raw(self, req: RawNTP, receive_time: int):
+        """
+        Called with every client request. Falls back to intercept_req with a scapy package if it is overridden.
+        :param req: the request.
+        :param receive_time: the 64 bit NTP timestamp at which the kernel received the request (the same value is
+        set as receive timestamp of the response).
+        """
+        if type(self).intercept_req is not NTPInterceptor.intercept_req:
+            self.intercept_req(req.ntp())
+
+    def intercept_res_raw(self, res: RawNTP) -> RawNTP:
+        """
+        Called with every response before it is sent. Falls back to intercept_res with a scapy package if it is
+        overridden.
+        :return: the response to send.
+        """
+        if type(self).intercept_res is NTPInterceptor.intercept_res:
+            return res
+        return RawNTP(self.intercept_res(res.ntp()))
+
+
+def ntp_response_template(stratum: int = 2, reference_time: int = None, reference_id: bytes = b'LOCL',
+                          poll: int = 6, precision: int = -20) -> bytes:
+    """
+    Creates the constant part of all responses of a server.
+    :param stratum: the stratum of the server.
+    :param reference_time: the 64 bit NTP timestamp of the last synchronisation, the current time if not set.
+    :param reference_id: the 4 byte reference id.
+    :param poll: the poll exponent.
+    :param precision: the precision exponent.
+    :return: a 48 byte server response, whose origin, receive and transmit timestamps are 0.
+    """
+    reference_time = ntp_timestamp_now() if reference_time is None else reference_time
+    return _NTP_HEADER.pack((4 << 3) | _SERVER_MODE, stratum, poll, precision, 0, 0, reference_id, reference_time,
+                            0, 0, 0)
+
+
+def patch_response(template: bytes, request, receive_time: int, transmit_time: int = None) -> bytearray:
+    """
+    Creates a response from a template: the origin timestamp is the transmit timestamp of the request.
+    :param template: see ntp_response_template.
+    :param request: the client request in its wire format.
+    :param receive_time: the 64 bit NTP timestamp at which the request was received.
+    :param transmit_time: the 64 bit NTP timestamp of the response, the current time if not set.
+    :return: the response in its wire format.
+    """
+    response = bytearray(template)
+    response[24:32] = request[40:48]
+    _TIMESTAMP.pack_into(response, 32, receive_time)
+    _TIMESTAMP.pack_into(response, 40, ntp_timestamp_now() if transmit_time is None else transmit_time)
+    return response
+
+
+def _receive_batch(sock: socket.socket, max_batch_size: int, log: logging.Logger) -> list:
+    # Waits for the first datagram, then takes all datagrams already waiting in the socket.
+    readable, _, _ = select.select([sock], [], [], _WORKER_POLL_INTERVAL_SEC)
+    batch = []
+    while readable and len(batch) < max_batch_size:
+        try:
+            batch.append(recv_with_timestamp(sock))
+        except BlockingIOError:
+            break
+        except OSError as e:
+            log.warning('Receiving a request failed: ' + repr(e))
+            break
+    return batch
+
+
+def _serve_worker(index: int, local_addr, template: bytes, request_chain: InterceptorChain,
+                  response_chain: InterceptorChain, with_response: bool, max_batch_size: int, stop_event, ready,
+                  counters, latencies, stats_lock, log: logging.Logger):
+    # The kernel distributes the datagrams among all sockets bound to the address with SO_REUSEPORT.
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind(local_addr)
+    sock.setblocking(False)
+    enable_kernel_timestamps(sock)
+    # The statistics are kept locally and copied into this worker's slots of the shared arrays under the lock, so
+    # the parent never reads a partially written histogram.
+    latency = LatencyHistogram()
+    sent = 0
+    offset = index * LatencyHistogram.NUM_BUCKETS
+    last_flush = time.monotonic()
+    ready.put(index)
+
+    def flush_stats():
+        nonlocal last_flush
+        with stats_lock:
+            latencies[offset:offset + LatencyHistogram.NUM_BUCKETS] = latency.counts
+            counters[index] = sent
+        last_flush = time.monotonic()
+
+    # Errors are logged per datagram or per batch, the worker keeps serving until the server is stopped.
+    try:
+        while not stop_event.is_set():
+            if time.monotonic() - last_flush >= _WORKER_POLL_INTERVAL_SEC:
+                flush_stats()
+            batch = _receive_batch(sock, max_batch_size, log)
+            if not batch:
+                flush_stats()
+                continue
+            try:
+                requests = []
+                for request, peer, kernel_ns in batch:
+                    if kernel_ns is not None:
+                        latency.record_since(kernel_ns)
+                    if len(request) < _NTP_PACKET_LENGTH or request[0] & 0x07 != _CLIENT_MODE:
+                        continue
+                    requests.append(PacketView(NTPDatagram(peer[0], local_addr[0], peer[1], local_addr[1], request,
+                                                           kernel_ns)))
+            except Exception as e:
+                log.exception('Worker ' + str(index) + ' failed to handle ' + str(len(batch)) + ' requests: '
+                              + repr(e))
+                continue
+            try:
+                verdicts = request_chain.process(requests)
+            except Exception as e:
+                log.exception('The request chain failed, ' + str(len(requests)) + ' requests are accepted: '
+                              + repr(e))
+                verdicts = [Verdict.ACCEPT] * len(requests)
+            if not with_response:
+                continue
+
+            datagrams = []
+            for view, verdict in zip(requests, verdicts):
+                if verdict is Verdict.DROP:
+                    continue
+                request = view.datagram
+                try:
+                    response = patch_response(template, request.payload, view.receive_time())
+                except Exception as e:
+                    log.error('No response created for ' + str(request.src_ip) + ': ' + repr(e))
+                    continue
+                datagrams.append(NTPDatagram(request.dst_ip, request.src_ip, request.dport, request.sport,
+                                             bytes(response), request.timestamp_ns))
+            responses = [PacketView(datagram) for datagram in datagrams]
+            try:
+                verdicts = response_chain.process(responses)
+            except Exception as e:
+                log.exception('The response chain failed, ' + str(len(responses)) + ' responses are sent unchanged: '
+                              + repr(e))
+                responses = [PacketView(datagram) for datagram in datagrams]
+                verdicts = [Verdict.ACCEPT] * len(responses)
+            for view, verdict in zip(responses, verdicts):
+                if verdict is Verdict.DROP:
+                    continue
+                try:
+                    sock.sendto(view.payload(), (view.datagram.dst_ip, view.datagram.dport))
+                except Exception as e:
+                    log.error('Sending the response to ' + str(view.datagram.dst_ip) + ' failed: ' + repr(e))
+                    continue
+                sent += 1
+    finally:
+        flush_stats()
+        sock.close()
+
 
 class NTPServer:
     """
@@ -21,30 +208,129 @@ class NTPServer:
     """
 
     def __init__(self, sniff_interface: str = 'wlp4s0', host_ip='localhost', req_interceptor=NTPInterceptor(),
-                 res_interceptor=NTPInterceptor()):
+                 res_interceptor=NTPInterceptor(), request_chain: InterceptorChain = None,
+                 response_chain: InterceptorChain = None, log: logging.Logger = logging.getLogger('NTPServer-logger')):
         """
 
         :param sniff_interface:
         :param req_interceptor: a class which is called whenever an NTP package arrives at the server.
         :param res_interceptor: a class which is called whenever a NTP response is send to a client request.
+        :param request_chain: processes the requests in the serving mode, a chain of the req_interceptor if not set.
+        Requests dropped by the chain are not answered.
+        :param response_chain: processes the responses in the serving mode, a chain of the res_interceptor if not
+        set. Responses dropped by the chain are not sent.
+        :param log:
         """
         super().__init__()
+        self.log = log
         self.sniff_interface = sniff_interface
+        self.capture = CaptureSource(sniff_interface)
         self._req_interceptor = req_interceptor
         self._res_interceptor = res_interceptor
+        self.request_chain = request_chain if request_chain is not None \
+            else InterceptorChain([NTPInterceptorStage(req_interceptor)])
+        self.response_chain = response_chain if response_chain is not None \
+            else InterceptorChain([NTPInterceptorStage(res_interceptor, response=True)])
         self._host_ip = host_ip
         self.reference_time = ntp_time_now()
         self.debug = False
+        self._workers = []
+        self._stop_event = None
+        self._counters = None
+        self._latencies = None
+        self._stats_lock = None
+        self.local_addr = None
+        self.latency = LatencyHistogram()  # From the kernel receive time until the request is handled by run().
+
+    def serve(self, local_addr=('0.0.0.0', _NTP_PORT), num_workers: int = None, with_response: bool = True,
+              template: bytes = None, max_batch_size: int = 64):
+        """
+        Starts the serving mode: instead of sniffing, num_workers processes receive the requests on UDP sockets,
+        which are all bound to local_addr with SO_REUSEPORT. Every response is a copy of a prebuilt template with
+        the origin, receive and transmit timestamps patched in. All requests waiting in the socket are passed through
+        the request and response chains as one batch. This method returns as soon as all workers are ready.
+        :param local_addr: (ip, port) to bind to, a free port is chosen for port 0.
+        :param num_workers: the number of worker processes, the number of CPUs if not set.
+        :param with_response: whether the requests are answered.
+        :param template: the response template, see ntp_response_template.
+        :param max_batch_size: the maximum number of requests processed at once by a worker.
+        """
+        assert not self._workers, 'The server is already serving.'
+        num_workers = num_workers if num_workers is not None else os.cpu_count()
+        if local_addr[1] == 0:
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+                sock.bind(local_addr)
+                local_addr = sock.getsockname()
+        self.local_addr = local_addr
+        if template is None:
+            template = ntp_response_template(reference_time=int(self.reference_time * (1 << 32)))
+        self._stop_event = multiprocessing.Event()
+        self._counters = multiprocessing.Array('Q', num_workers, lock=False)
+        self._latencies = multiprocessing.Array('Q', num_workers * LatencyHistogram.NUM_BUCKETS, lock=False)
+        self._stats_lock = multiprocessing.Lock()  # Guards the slots of all workers in _counters and _latencies.
+        ready = multiprocessing.Queue()
+        for index in range(num_workers):
+            worker = multiprocessing.Process(target=_serve_worker, name='NTPServer-worker-' + str(index),
+                                             args=(index, local_addr, template, self.request_chain,
+                                                   self.response_chain, with_response, max_batch_size,
+                                                   self._stop_event, ready, self._counters, self._latencies,
+                                                   self._stats_lock, self.log),
+                                             daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        try:
+            for _ in range(num_workers):
+                ready.get(timeout=10)
+        except queue.Empty:
+            self.stop()
+            raise Exception('The workers could not bind to ' + str(local_addr))
+        self.log.info('Serving on ' + str(local_addr) + ' with ' + str(num_workers) + ' workers')
+
+    def stop(self):
+        """
+        Stops the worker processes of the serving mode.
+        """
+        if not self._workers:
+            return
+        self._stop_event.set()
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
+
+    def responses_sent(self) -> int:
+        """
+        :return: the number of responses sent by all workers of the serving mode. The workers report their counts at
+        least every 0.2 seconds.
+        """
+        if self._counters is None:
+            return 0
+        with self._stats_lock:
+            return sum(self._counters)
+
+    def receive_latency(self) -> LatencyHistogram:
+        """
+        :return: the distribution of the time from the kernel receive time of the requests until they are handled,
+        of all workers of the serving mode and of run(). The workers report their counts at least every
+        0.2 seconds.
+        """
+        result = LatencyHistogram(list(self.latency.counts))
+        if self._latencies is not None:
+            with self._stats_lock:
+                counts = self._latencies[:]
+            for index in range(0, len(counts), LatencyHistogram.NUM_BUCKETS):
+                result.merge(counts[index:index + LatencyHistogram.NUM_BUCKETS])
+        return result
 
     def run(self, with_response: bool = True):
         """
         Starts the sniffing for incoming NTP client packages. Note that further packages are not sniffed while
-        one package is processed.
+        one package is processed. The receive timestamp of a response is the capture time of the request taken by
+        the kernel, not the time at which it is handled here.
         """
         print('Starting server.... listening on interface ' + self.sniff_interface)
         while True:
             pck = self.next_ntp_packet()
-            received_time = ntp_time_now()
+            received_time = self._kernel_receive_time(pck)
 
             if pck[IP].dst != self._host_ip:
                 print('This package was not meant for the server...')
@@ -73,13 +359,24 @@ class NTPServer:
                 response.show()
             send(response)
 
+    def _kernel_receive_time(self, pck: Packet) -> float:
+        """
+        :return: the time at which the kernel received the package (taken by the capture socket) in NTP seconds,
+        the current time if the package has no capture time.
+        """
+        capture_time = getattr(pck, 'time', None)
+        if capture_time is None:
+            return ntp_time_now()
+        capture_ns = int(float(capture_time) * 1e9)
+        self.latency.record_since(capture_ns)
+        return unix_ns_to_ntp64(capture_ns) / (1 << 32)
+
     def next_ntp_packet(self) -> Packet:
         """
         Sniffs for the next incoming ntp package. This method is blocking
         :return: the sniffed package.
         """
-        results = sniff(filter='udp and port 123', count=1, iface=self.sniff_interface)
-        pck = (results[0])
+        pck = self.capture.next_packet()
         if self.debug:
             pck.show()
         return pck
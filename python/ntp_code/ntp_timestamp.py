@@ -0,0 +1,101 @@
+import time
+
+import numpy as np
+
+NTP_EPOCH_OFFSET = 2208988800  # Seconds between the NTP era 0 (1900) and the unix epoch (1970).
+_NS_PER_SEC = 1000000000
+_FRACTION_MASK = 0xFFFFFFFF
+_MAX_FRACTION_DIGITS = 9  # 10^9 * 2^32 still fits into an uint64.
+
+
+def unix_ns_to_ntp64(unix_ns: int) -> int:
+    """
+    Converts a unix time in nanoseconds (e.g. time.time_ns()) to a 64 bit NTP timestamp (32 bit seconds,
+    32 bit fraction).
+    :param unix_ns: nanoseconds since the unix epoch.
+    :return: the NTP timestamp as an unsigned integer.
+    """
+    seconds, nanoseconds = divmod(unix_ns, _NS_PER_SEC)
+    return (((seconds + NTP_EPOCH_OFFSET) & _FRACTION_MASK) << 32) | ((nanoseconds << 32) // _NS_PER_SEC)
+
+
+def ntp64_to_unix_ns(ntp_timestamp: int) -> int:
+    """
+    Converts a 64 bit NTP timestamp (era 0) to nanoseconds since the unix epoch. Rounds to the nearest nanosecond,
+    therefore unix_ns_to_ntp64 and this function are exact inverses for nanosecond values.
+    """
+    nanoseconds = ((ntp_timestamp & _FRACTION_MASK) * _NS_PER_SEC + (1 << 31)) >> 32
+    return ((ntp_timestamp >> 32) - NTP_EPOCH_OFFSET) * _NS_PER_SEC + nanoseconds
+
+
+def ntp_timestamp_now() -> int:
+    """
+    :return: the current system time as a 64 bit NTP timestamp without any float rounding.
+    """
+    return unix_ns_to_ntp64(time.time_ns())
+
+
+def ns_to_ntp32_short(nanoseconds: int) -> int:
+    """
+    Converts a duration (e.g. root delay or root dispersion) to the 32 bit NTP short format (16 bit seconds,
+    16 bit fraction).
+    """
+    seconds, nanoseconds = divmod(nanoseconds, _NS_PER_SEC)
+    return ((seconds & 0xFFFF) << 16) | ((nanoseconds << 16) // _NS_PER_SEC)
+
+
+def ntp32_short_to_ns(ntp_short: int) -> int:
+    """
+    Converts a value in the 32 bit NTP short format to nanoseconds.
+    """
+    return (ntp_short >> 16) * _NS_PER_SEC + (((ntp_short & 0xFFFF) * _NS_PER_SEC + (1 << 15)) >> 16)
+
+
+def ntp64_fraction_digits(ntp_timestamp: int, digits: int = 9) -> str:
+    """
+    Extracts the first decimal digits of the fraction of a 64 bit NTP timestamp.
+    :param ntp_timestamp: the NTP timestamp as an unsigned integer.
+    :param digits: the number of decimal digits (9 equals nanoseconds).
+    :return: the digits as a zero padded string.
+    """
+    value = ((ntp_timestamp & _FRACTION_MASK) * 10 ** digits) >> 32
+    return str(value).zfill(digits)
+
+
+def unix_ns_to_ntp64_array(unix_ns: np.ndarray) -> np.ndarray:
+    """
+    Vectorized variant of unix_ns_to_ntp64.
+    :param unix_ns: an integer array of nanoseconds since the unix epoch.
+    :return: an uint64 array of NTP timestamps.
+    """
+    seconds, nanoseconds = np.divmod(np.asarray(unix_ns, dtype=np.uint64), np.uint64(_NS_PER_SEC))
+    seconds = (seconds + np.uint64(NTP_EPOCH_OFFSET)) & np.uint64(_FRACTION_MASK)
+    fraction = (nanoseconds << np.uint64(32)) // np.uint64(_NS_PER_SEC)
+    return (seconds << np.uint64(32)) | fraction
+
+
+def ntp64_to_unix_ns_array(ntp_timestamps: np.ndarray) -> np.ndarray:
+    """
+    Vectorized variant of ntp64_to_unix_ns.
+    :param ntp_timestamps: an uint64 array of NTP timestamps (era 0).
+    :return: an int64 array of nanoseconds since the unix epoch.
+    """
+    ntp_timestamps = np.asarray(ntp_timestamps, dtype=np.uint64)
+    fraction = ntp_timestamps & np.uint64(_FRACTION_MASK)
+    nanoseconds = (fraction * np.uint64(_NS_PER_SEC) + np.uint64(1 << 31)) >> np.uint64(32)
+    seconds = (ntp_timestamps >> np.uint64(32)).astype(np.int64) - NTP_EPOCH_OFFSET
+    return seconds * _NS_PER_SEC + nanoseconds.astype(np.int64)
+
+
+def ntp64_fraction_digits_array(ntp_timestamps: np.ndarray, digits: int = 9) -> np.ndarray:
+    """
+    Vectorized variant of ntp64_fraction_digits.
+    :param ntp_timestamps: an uint64 array of NTP timestamps.
+    :param digits: the number of decimal digits, at most 9.
+    :return: an uint8 array of shape (N, digits) holding the decimal digits of every fraction.
+    """
+    assert 0 < digits <= _MAX_FRACTION_DIGITS
+    fraction = np.asarray(ntp_timestamps, dtype=np.uint64) & np.uint64(_FRACTION_MASK)
+    values = (fraction * np.uint64(10 ** digits)) >> np.uint64(32)
+    powers = np.uint64(10) ** np.arange(digits - 1, -1, -1, dtype=np.uint64)
+    return ((values[:, np.newaxis] // powers) % np.uint64(10)).astype(np.uint8)
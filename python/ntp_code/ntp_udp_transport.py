@@ -0,0 +1,93 @@
+import asyncio
+import logging
+
+from ntp_mode import NTPMode
+from ntp_packet_factory import NTPPacketFactory, default_packet_factory
+from ntp_raw import NTPField, RawNTP
+from ntp_timestamp import ntp_timestamp_now
+
+NTP_PORT = 123
+
+
+def ntp_server_response(request: bytes, packet_factory: NTPPacketFactory = None, stratum: int = 2) -> bytes:
+    """
+    Creates a plausible server answer to a client request: all timestamps are set to the current time, the origin
+    timestamp is the transmit timestamp of the request.
+    :param request: the client request in its wire format.
+    :param packet_factory: creates the package, the default factory if not set.
+    :param stratum: the stratum of the answer.
+    :return: the answer in its wire format.
+    """
+    factory = packet_factory if packet_factory is not None else default_packet_factory()
+    response = RawNTP.from_bytes(factory.init_pck_bytes())
+    response.set_field_int(NTPMode.SERVER.value, NTPField.MODE)
+    response.set_field_int(stratum, NTPField.STRATUM)
+    response.set_field_int(RawNTP.from_bytes(request).get_field_int(NTPField.TRANSMIT_TIMESTAMP),
+                           NTPField.ORIGIN_TIMESTAMP)
+    response.set_field_int(ntp_timestamp_now(), NTPField.TRANSMIT_TIMESTAMP)
+    return response.to_bytes()
+
+
+class NTPDatagramProtocol(asyncio.DatagramProtocol):
+    """
+    An asyncio protocol for NTP over an ordinary UDP socket (no root privileges needed on unprivileged ports). Every
+    received datagram is passed to the handler together with the address of its peer; per peer state is kept by the
+    handler. Many thousand peers can be served by one event loop.
+    """
+
+    def __init__(self, handler, log: logging.Logger = logging.getLogger('NTPDatagramProtocol-logger')):
+        """
+        :param handler: a callable (data: bytes, peer: (ip, port)) which returns the bytes to answer the peer with or
+        None to send no answer.
+        :param log:
+        """
+        self.log = log
+        self._handler = handler
+        self.transport: asyncio.DatagramTransport = None
+        self.datagrams_received = 0
+        self.datagrams_sent = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.datagrams_received += 1
+        try:
+            answer = self._handler(data, addr)
+        except Exception as e:
+            self.log.error('Handling of a datagram from ' + str(addr) + ' failed: ' + str(e))
+            return
+        if answer is not None:
+            self.send(answer, addr)
+
+    def error_received(self, exc):
+        self.log.error('UDP error: ' + str(exc))
+
+    def send(self, data: bytes, addr=None):
+        """
+        :param data: the datagram to send.
+        :param addr: the peer, may be omitted if the endpoint was created with a remote address.
+        """
+        self.transport.sendto(data, addr)
+        self.datagrams_sent += 1
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+
+
+async def create_ntp_endpoint(handler=lambda data, addr: None, local_addr=None, remote_addr=None,
+                              log: logging.Logger = logging.getLogger('NTPDatagramProtocol-logger')) \
+        -> NTPDatagramProtocol:
+    """
+    Opens an UDP socket in the running event loop.
+    :param handler: see NTPDatagramProtocol.
+    :param local_addr: (ip, port) to bind to, e.g. ('0.0.0.0', NTP_PORT) for a server.
+    :param remote_addr: (ip, port) of the only peer, e.g. for a client.
+    :param log:
+    :return: the protocol, its transport is ready for sending.
+    """
+    loop = asyncio.get_running_loop()
+    _, protocol = await loop.create_datagram_endpoint(lambda: NTPDatagramProtocol(handler, log),
+                                                      local_addr=local_addr, remote_addr=remote_addr)
+    return protocol
@@ -1,11 +1,11 @@
 import logging
-import time
-from decimal import Decimal
-import random
+from decimal import Decimal, localcontext
 
 from scapy.layers.ntp import NTP, NTPHeader
 
-from ntp_raw import RawNTP
+from bit_codec import bits_to_bytes, bytes_to_bits
+from ntp_packet_factory import NTPPacketFactory, default_packet_factory
+from ntp_timestamp import ntp64_fraction_digits, ntp_timestamp_now
 
 _max_16bit = 65536
 _max_32bit = 4294967295
@@ -29,7 +29,10 @@ def bit_to_long(bits: str) -> Decimal:
     Converts a bit string in the format '01' to a float, representing the NTP long format (64bit)
     """
     ints = int(bits, 2)
-    result = Decimal(ints) / Decimal(_max_32bit)
+    with localcontext() as context:
+        # 10 integer digits and up to 32 fraction digits, more than the default precision of 28 digits.
+        context.prec = 50
+        result = Decimal(ints) / Decimal(1 << 32)
     return result
 
 
@@ -40,23 +43,15 @@ def extract_64timestamp_fraction(bits: str) -> str:
     :return:
     """
     assert len(bits) == 64
-    bits = bits[32:64]
-    # __log.info(bits)
-    ints = int(bits, 2)
-    result = ints / _max_32bit
-    result = int(result * 1000000000)
-    result = str(result)
-    while len(result) < 9:
-        result = '0' + result
-    return result
+    return ntp64_fraction_digits(int(bits, 2))
 
 
 def ntp_time_now() -> float:
     """
-    :return: The current system time in milliseconds in NTP format.
+    :return: The current system time in seconds in NTP format. Use ntp_timestamp.ntp_timestamp_now() for the
+    lossless 64 bit value.
     """
-    ntp_basetime = 2208988800
-    return time.time() + ntp_basetime
+    return ntp_timestamp_now() / (1 << 32)
 
 
 def init_ntp_pck(num_of_digits_to_fill_up: int = 12) -> NTP:
@@ -66,36 +61,7 @@ def init_ntp_pck(num_of_digits_to_fill_up: int = 12) -> NTP:
     :param num_of_digits_to_fill_up: The amount of digits to fill up.
     :return: The newly created NTP package
     """
-    ntp = NTP()
-    ntp.ref = ntp_time_now()
-    ntp.sent = ntp_time_now()
-    ntp.orig = ntp_time_now()
-    ntp.recv = ntp_time_now()
-    raw_ntp = RawNTP(ntp)
-
-    f_ref = raw_ntp.reference_timestamp()
-    f_trans = raw_ntp.transmit_timestamp()
-    f_orig = raw_ntp.origin_timestamp()
-    f_recv = raw_ntp.receive_timestamp()
-
-    for i in range(num_of_digits_to_fill_up):
-        pos = 64 - i
-        f_ref = f_ref[:pos - 1] + str(random.randint(0, 1)) + f_ref[pos:]
-        f_trans = f_trans[:pos - 1] + str(random.randint(0, 1)) + f_trans[pos:]
-        f_orig = f_orig[:pos - 1] + str(random.randint(0, 1)) + f_orig[pos:]
-        f_recv = f_recv[:pos - 1] + str(random.randint(0, 1)) + f_recv[pos:]
-
-    assert len(f_ref) == 64
-    assert len(f_trans) == 64
-    assert len(f_orig) == 64
-    assert len(f_recv) == 64
-
-    raw_ntp.set_reference_timestamp(f_ref)
-    raw_ntp.set_transmit_timestamp(f_trans)
-    raw_ntp.set_origin_timestamp(f_orig)
-    raw_ntp.set_receive_timestamp(f_recv)
-    ntp = raw_ntp.ntp()
-    return ntp
+    return NTP(_factory(num_of_digits_to_fill_up).create_init_pck_bytes())
 
 
 def init_ntp_client_pck(num_of_digits_to_fill_up: int = 12):
@@ -105,46 +71,30 @@ def init_ntp_client_pck(num_of_digits_to_fill_up: int = 12):
     :param num_of_digits_to_fill_up: The amount of digits to fill up.
     :return: The newly created NTP package
     """
-    ntp = NTP()
-    ntp.sent = ntp_time_now()
-    ntp.ref = 0
-    ntp.orig = 0
-    ntp.recv = 0
-    raw_ntp = RawNTP(ntp)
-    f_trans = raw_ntp.transmit_timestamp()
-
-    for i in range(num_of_digits_to_fill_up):
-        pos = 64 - i
-        f_trans = f_trans[:pos - 1] + str(random.randint(0, 1)) + f_trans[pos:]
+    return NTP(_factory(num_of_digits_to_fill_up).create_client_pck_bytes())
 
-    assert len(f_trans) == 64
 
-    raw_ntp.set_transmit_timestamp(f_trans)
-    ntp = raw_ntp.ntp()
-    return ntp
+def _factory(num_of_digits_to_fill_up: int) -> NTPPacketFactory:
+    factory = default_packet_factory()
+    if factory.num_of_digits_to_fill_up == num_of_digits_to_fill_up:
+        return factory
+    return NTPPacketFactory(num_of_digits_to_fill_up=num_of_digits_to_fill_up)
 
 
 def bit_to_ascii(bit_string: str) -> str:
     """
-    Converts a given string of bits to a string of ASCII characters.
+    Converts a given string of bits to a string of ASCII characters. See bit_codec for the incremental variant.
     :param bit_string: a string of 0s and 1s, dividable by 8.
     :return:
     """
     assert len(bit_string) % 8 == 0
-
-    n = int(bit_string, 2)
-    result = n.to_bytes((n.bit_length() + 7) // 8, 'big').decode()
-    return result
+    return bits_to_bytes(bit_string).decode()
 
 
 def ascii_to_bit(ascii_string: str) -> str:
     """
-    Converts a given string of ASCII chars to a string of bits.
+    Converts a given string of ASCII chars to a string of bits. See bit_codec for the incremental variant.
     :param ascii_string:
     :return:
     """
-    result = bin(int.from_bytes(ascii_string.encode(), 'big'))
-    result = result[2:] # We don't want this '0b' at the beginning.
-    while len(result) % 8 != 0:
-        result = '0' + result
-    return result
+    return bytes_to_bits(ascii_string.encode())
@@ -1,7 +1,12 @@
+from threading import Lock
+
+from scapy.config import conf
 from scapy.layers.inet import IP, UDP
 from scapy.layers.ntp import NTP
 from scapy.packet import Packet
-from scapy.sendrecv import sniff, send, sr1
+from scapy.sendrecv import sr1
+
+from capture_source import CaptureSource
 
 
 class ScapyWrapper:
@@ -9,31 +14,73 @@ class ScapyWrapper:
     A wrapper class for scapy functionality.
     """
 
-    def next_ntp_packet(self, sniff_interface) -> Packet:
+    def __init__(self, socket_factory=None):
+        """
+        :param socket_factory: passed to every CaptureSource, see there.
+        """
+        self._capture_sources = {}
+        self._capture_lock = Lock()  # The capture thread of a server and other threads share the captures.
+        self._socket_factory = socket_factory
+        self._send_socket = None
+
+    def capture_source(self, sniff_interface: str, bpf_filter: str = 'udp and port 123') -> CaptureSource:
+        """
+        :return: the capture of the given interface and filter, which is opened on first use and then kept open.
+        """
+        key = (sniff_interface, bpf_filter)
+        with self._capture_lock:
+            if key not in self._capture_sources:
+                self._capture_sources[key] = CaptureSource(sniff_interface, bpf_filter,
+                                                           socket_factory=self._socket_factory)
+            return self._capture_sources[key]
+
+    def next_ntp_packet(self, sniff_interface, timeout: float = None) -> Packet:
         """
         Sniffs for the next incoming ntp package. This method is blocking
-        :return: the sniffed package (with OSI layer 3 and 4 still attached).
+        :param timeout: the maximum time to wait in seconds, None waits forever.
+        :return: the sniffed package (with OSI layer 3 and 4 still attached) or None if the timeout expired.
         """
-        results = sniff(filter='udp and port 123', count=1, iface=sniff_interface)
-        pck = (results[0])
-        return pck
+        return self.capture_source(sniff_interface).next_packet(timeout)
+
+    def next_ntp_packets(self, sniff_interface, max_n: int, timeout: float = None) -> list:
+        """
+        Sniffs for the next incoming ntp packages, see CaptureSource.next_packets.
+        :return: a list of at most max_n packages, empty in case the timeout expired.
+        """
+        return self.capture_source(sniff_interface).next_packets(max_n, timeout)
 
-    def next_ntp_packet_for_target(self, sniff_interface: str, target_ip_addr: str) -> Packet:
+    def next_ntp_packet_for_target(self, sniff_interface: str, target_ip_addr: str, timeout: float = None) -> Packet:
         """
         Sniffs for the next incoming ntp package with was send to the specific ip addr. This method is blocking
-        :return: the sniffed package (with OSI layer 3 and 4 still attached).
+        :param timeout: the maximum time to wait in seconds, None waits forever.
+        :return: the sniffed package (with OSI layer 3 and 4 still attached) or None if the timeout expired.
         """
-        results = sniff(filter='udp and dst port 123 and dst ' + str(target_ip_addr), count=1, iface=sniff_interface)
-        pck = (results[0])
-        return pck
+        bpf_filter = 'udp and dst port 123 and dst ' + str(target_ip_addr)
+        return self.capture_source(sniff_interface, bpf_filter).next_packet(timeout)
+
+    def close(self):
+        """
+        Stops all captures and closes the send socket opened by this wrapper.
+        """
+        with self._capture_lock:
+            sources = list(self._capture_sources.values())
+            self._capture_sources.clear()
+        for source in sources:
+            source.stop()
+        if self._send_socket is not None:
+            self._send_socket.close()
+            self._send_socket = None
 
     def send(self, pck: Packet):
         """
-        Sends the given Scapy Packet without waiting for a response.
+        Sends the given Scapy Packet without waiting for a response. The layer 3 socket is opened on first use and
+        then kept open, instead of opening a new one for every package like scapy send() does.
         :param pck:
         :return:
         """
-        send(pck)
+        if self._send_socket is None:
+            self._send_socket = conf.L3socket()
+        self._send_socket.send(pck)
 
     def get_upstream_ntp(self, server_addr: str = 'pool.ntp.org') -> Packet:
         request = IP(dst=server_addr) / UDP() / NTP()
@@ -0,0 +1,106 @@
+import math
+import socket
+import struct
+import time
+
+# Linux values, older Python versions do not export the constants.
+SO_TIMESTAMPNS = getattr(socket, 'SO_TIMESTAMPNS', 35)
+SCM_TIMESTAMPNS = SO_TIMESTAMPNS
+_TIMESPEC = struct.Struct('@qq')  # struct timespec: seconds, nanoseconds
+_ANCILLARY_SIZE = socket.CMSG_SPACE(_TIMESPEC.size)
+_NS_PER_SEC = 1000000000
+
+_BUCKETS_PER_OCTAVE = 4
+_NUM_BUCKETS = 40 * _BUCKETS_PER_OCTAVE  # Up to 2^40 ns (about 18 minutes).
+
+
+def enable_kernel_timestamps(sock: socket.socket) -> bool:
+    """
+    Lets the kernel attach its receive time to every datagram of the socket (SO_TIMESTAMPNS).
+    :return: True in case the option is supported.
+    """
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMPNS, 1)
+        return True
+    except OSError:
+        return False
+
+
+def recv_with_timestamp(sock: socket.socket, bufsize: int = 1024):
+    """
+    Receives one datagram together with its kernel receive time (see enable_kernel_timestamps).
+    :return: (data, address, the receive time in ns since the unix epoch or None if the kernel did not attach one).
+    """
+    data, ancdata, _, address = sock.recvmsg(bufsize, _ANCILLARY_SIZE)
+    for level, kind, value in ancdata:
+        if level == socket.SOL_SOCKET and kind == SCM_TIMESTAMPNS and len(value) >= _TIMESPEC.size:
+            seconds, nanoseconds = _TIMESPEC.unpack_from(value)
+            return data, address, seconds * _NS_PER_SEC + nanoseconds
+    return data, address, None
+
+
+class LatencyHistogram:
+    """
+    A histogram of latencies (e.g. from the kernel receive time until a package is handled in user space) with
+    logarithmic buckets, four per power of two, so percentiles are exact to about 19 %. The counts may be kept in any
+    mutable sequence, e.g. a slice of a shared multiprocessing array.
+    """
+
+    NUM_BUCKETS = _NUM_BUCKETS
+
+    def __init__(self, counts=None):
+        """
+        :param counts: a mutable sequence of NUM_BUCKETS integers, a new list if not set.
+        """
+        self.counts = counts if counts is not None else [0] * _NUM_BUCKETS
+
+    @staticmethod
+    def bucket(latency_ns: int) -> int:
+        """
+        :return: the index of the bucket of a latency.
+        """
+        if latency_ns <= 1:
+            return 0
+        return min(int(math.log2(latency_ns) * _BUCKETS_PER_OCTAVE), _NUM_BUCKETS - 1)
+
+    def record(self, latency_ns: int):
+        self.counts[self.bucket(latency_ns)] += 1
+
+    def record_since(self, timestamp_ns: int):
+        """
+        Records the time passed since the given unix time in ns.
+        """
+        self.record(time.time_ns() - timestamp_ns)
+
+    def merge(self, counts):
+        """
+        Adds the counts of another histogram.
+        """
+        for i, count in enumerate(counts):
+            self.counts[i] += count
+
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def percentile(self, p: float) -> int:
+        """
+        :param p: the percentile, between 0 and 100.
+        :return: the upper bound of the bucket holding the percentile in ns, None if nothing was recorded.
+        """
+        total = self.count()
+        if total == 0:
+            return None
+        rank = max(1, math.ceil(total * p / 100))
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return int(2 ** ((i + 1) / _BUCKETS_PER_OCTAVE))
+        return int(2 ** (_NUM_BUCKETS / _BUCKETS_PER_OCTAVE))
+
+    def summary(self) -> dict:
+        """
+        :return: the number of samples and the 50th, 90th, 99th and 99.9th percentiles in ns.
+        """
+        return {'count': self.count(), 'p50': self.percentile(50), 'p90': self.percentile(90),
+                'p99': self.percentile(99), 'p999': self.percentile(99.9)}
@@ -0,0 +1,41 @@
+import socket
+
+
+class FakeClock:
+    """
+    A clock for tests, which only advances when now is changed. Can replace time.monotonic or time.monotonic_ns.
+    """
+
+    def __init__(self, now=0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class FakeCaptureSocket:
+    """
+    Delivers the given packages; every package is announced by one byte written to a socket pair, so the capture
+    can wait for it with select.
+    """
+
+    def __init__(self, packages):
+        self._packages = list(packages)
+        self._read_end, self._write_end = socket.socketpair()
+        self._write_end.send(b'x' * len(self._packages))
+        self.closed = False
+
+    def fileno(self):
+        return self._read_end.fileno()
+
+    def recv(self):
+        self._read_end.recv(1)
+        package = self._packages.pop(0)
+        if isinstance(package, Exception):
+            raise package
+        return package
+
+    def close(self):
+        self.closed = True
+        self._read_end.close()
+        self._write_end.close()
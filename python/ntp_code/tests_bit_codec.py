@@ -0,0 +1,58 @@
+import unittest
+
+from bit_codec import bytes_to_bits, bits_to_bytes, encode_bits, decode_bits, BitStreamDecoder
+
+
+class BitCodecTests(unittest.TestCase):
+
+    def test_bits_to_bytes_leading_zero_bytes_kept(self):
+        # Act
+        result = bits_to_bytes('00000000' + '01000111')
+
+        # Assert
+        self.assertEqual(result, b'\x00G')
+
+    def test_encode_bits_chunked_equals_complete_conversion(self):
+        # Arrange
+        data = bytes(range(256)) * 3
+
+        # Act
+        result = list(encode_bits(data, chunk_size=100))
+
+        # Assert
+        self.assertEqual(len(result), 8)
+        self.assertTrue(all(len(bits) <= 800 for bits in result))
+        self.assertEqual(''.join(result), bytes_to_bits(data))
+
+    def test_decode_bits_unaligned_chunks_correctly_decoded(self):
+        # Arrange
+        bits = bytes_to_bits(b'Hello World')
+        chunks = [bits[i:i + 13] for i in range(0, len(bits), 13)]
+
+        # Act
+        result = b''.join(decode_bits(chunks))
+
+        # Assert
+        self.assertEqual(result, b'Hello World')
+
+    def test_decode_bits_incomplete_byte_raises_value_error(self):
+        # Act & Assert
+        with self.assertRaises(ValueError):
+            list(decode_bits(['0100011']))
+
+    def test_feed_keeps_at_most_7_pending_bits(self):
+        # Arrange
+        decoder = BitStreamDecoder()
+
+        # Act
+        first = decoder.feed('0100')
+        second = decoder.feed('01110100')
+
+        # Assert
+        self.assertEqual(first, b'')
+        self.assertEqual(second, b'G')
+        self.assertEqual(decoder.pending_bits(), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import time
+import unittest
+
+from capture_source import CaptureSource
+from test_utils import FakeCaptureSocket
+
+
+class CaptureSourceTests(unittest.TestCase):
+
+    def test_next_packet_socket_opened_once_all_packages_returned(self):
+        # Arrange
+        opened = []
+
+        def factory(iface, bpf_filter):
+            opened.append((iface, bpf_filter))
+            return FakeCaptureSocket(['pck-1', 'pck-2', 'pck-3'])
+
+        source = CaptureSource('lo', socket_factory=factory)
+
+        # Act
+        result = [source.next_packet(timeout=1) for _ in range(3)]
+        source.stop()
+
+        # Assert
+        self.assertEqual(result, ['pck-1', 'pck-2', 'pck-3'])
+        self.assertEqual(opened, [('lo', 'udp and port 123')])
+
+    def test_next_packets_more_captured_at_most_max_n_returned(self):
+        # Arrange
+        fake_socket = FakeCaptureSocket(range(10))
+        source = CaptureSource('lo', socket_factory=lambda iface, bpf_filter: fake_socket)
+        source.start()
+        while source.packets_captured < 10:
+            time.sleep(0.01)
+
+        # Act
+        first = source.next_packets(4, timeout=1)
+        rest = source.next_packets(100, timeout=1)
+        source.stop()
+
+        # Assert
+        self.assertEqual(first, [0, 1, 2, 3])
+        self.assertEqual(rest, [4, 5, 6, 7, 8, 9])
+        self.assertTrue(fake_socket.closed)
+
+    def test_next_packets_nothing_captured_empty_after_timeout(self):
+        # Arrange
+        source = CaptureSource('lo', socket_factory=lambda iface, bpf_filter: FakeCaptureSocket([]))
+
+        # Act
+        result = source.next_packets(10, timeout=0.05)
+        source.stop()
+
+        # Assert
+        self.assertEqual(result, [])
+
+    def test_next_packet_read_fails_error_raised_after_captured_packages(self):
+        # Arrange
+        sockets = []
+
+        def factory(iface, bpf_filter):
+            sockets.append(FakeCaptureSocket([0, OSError('interface down')] if not sockets else [1]))
+            return sockets[-1]
+        source = CaptureSource('lo', socket_factory=factory)
+
+        # Act
+        first = source.next_packet(timeout=1)
+        with self.assertRaises(OSError):
+            source.next_packet(timeout=1)
+        after_error = source.next_packet(timeout=1)
+        source.stop()
+
+        # Assert
+        self.assertEqual(first, 0)
+        self.assertEqual(after_error, 1)
+        self.assertEqual(len(sockets), 2)
+        self.assertTrue(sockets[0].closed)
+
+    def test_queue_full_packages_counted_as_queue_drops(self):
+        # Arrange
+        source = CaptureSource('lo', max_queue_size=2, socket_factory=lambda iface, bpf_filter: FakeCaptureSocket(
+            range(5)))
+
+        # Act
+        source.start()
+        while source.packets_captured < 5:
+            time.sleep(0.01)
+        result = source.next_packets(5, timeout=0)
+        source.stop()
+
+        # Assert
+        self.assertEqual(result, [0, 1])
+        self.assertEqual(source.queue_drops, 3)
+        self.assertEqual(source.kernel_drops(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
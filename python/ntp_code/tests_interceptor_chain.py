@@ -0,0 +1,155 @@
+import unittest
+
+from scapy.layers.inet import IP, UDP
+from scapy.layers.ntp import NTP
+
+from interceptor_chain import InterceptorChain, InterceptorStage, PacketView, ScapyCallbackStage, Verdict
+from ntp_packet_factory import default_packet_factory
+from ntp_raw import NTPField
+
+
+class _FixedStage(InterceptorStage):
+    def __init__(self, verdict):
+        self.verdict = verdict
+        self.calls = 0
+
+    def process_one(self, view):
+        self.calls += 1
+        return self.verdict
+
+
+class _FailingStage(InterceptorStage):
+    def process(self, views):
+        raise ValueError('failed')
+
+
+class _StratumStage(InterceptorStage):
+    def process_one(self, view):
+        view.ntp().set_field_int(9, NTPField.STRATUM)
+        return Verdict.CONTINUE
+
+
+class _StratumThenFailStage(InterceptorStage):
+    """
+    Modifies the packages one by one and fails at the last one.
+    """
+
+    def process(self, views):
+        for view in views:
+            view.ntp().set_field_int(9, NTPField.STRATUM)
+        raise ValueError('failed')
+
+
+def _ip_packet() -> bytes:
+    return bytes(IP(src='10.0.0.1', dst='10.0.0.2') / UDP(sport=40000, dport=123)
+                 / NTP(default_packet_factory().create_client_pck_bytes()))
+
+
+class InterceptorChainTests(unittest.TestCase):
+
+    def test_process_drop_following_stages_skipped(self):
+        # Arrange
+        last = _FixedStage(Verdict.CONTINUE)
+        chain = InterceptorChain([_FixedStage(Verdict.DROP), last])
+        views = [PacketView.from_ip_packet(_ip_packet()) for _ in range(3)]
+
+        # Act
+        verdicts = chain.process(views)
+
+        # Assert
+        self.assertEqual(verdicts, [Verdict.DROP] * 3)
+        self.assertEqual(last.calls, 0)
+
+    def test_process_continue_accepted_after_last_stage(self):
+        # Arrange
+        accept = _FixedStage(Verdict.ACCEPT)
+        last = _FixedStage(Verdict.DROP)
+        views = [PacketView.from_ip_packet(_ip_packet()) for _ in range(2)]
+
+        # Act
+        continued = InterceptorChain([_FixedStage(None), _FixedStage(Verdict.CONTINUE)]).process(views)
+        accepted = InterceptorChain([accept, last]).process(views)
+
+        # Assert
+        self.assertEqual(continued, [Verdict.ACCEPT] * 2)
+        self.assertEqual(accepted, [Verdict.ACCEPT] * 2)
+        self.assertEqual(last.calls, 0)
+
+    def test_process_failing_stage_skipped(self):
+        # Arrange
+        chain = InterceptorChain([_FailingStage(), _StratumStage()])
+        view = PacketView.from_ip_packet(_ip_packet())
+
+        # Act
+        verdicts = chain.process([view])
+
+        # Assert
+        self.assertEqual(verdicts, [Verdict.ACCEPT])
+        self.assertEqual(view.ntp().get_field_int(NTPField.STRATUM), 9)
+
+    def test_process_stage_fails_after_modifications_modifications_undone(self):
+        # Arrange
+        chain = InterceptorChain([_StratumThenFailStage()])
+        views = [PacketView.from_ip_packet(_ip_packet()) for _ in range(3)]
+        views[0].ntp().set_field_int(4, NTPField.STRATUM)
+        views[1].scapy()[NTP].stratum = 5
+
+        # Act
+        verdicts = chain.process(views)
+
+        # Assert
+        self.assertEqual(verdicts, [Verdict.ACCEPT] * 3)
+        self.assertEqual(views[0].ntp().get_field_int(NTPField.STRATUM), 4)
+        self.assertEqual(views[1].scapy()[NTP].stratum, 5)
+        self.assertEqual(views[2].ip_bytes(), views[2].ip_packet)
+
+    def test_ip_bytes_raw_modification_udp_checksum_valid(self):
+        # Arrange
+        view = PacketView.from_ip_packet(_ip_packet())
+
+        # Act
+        InterceptorChain([_StratumStage()]).process([view])
+        result = IP(view.ip_bytes())
+
+        # Assert
+        self.assertEqual(result[NTP].stratum, 9)
+        expected = result.copy()
+        del expected[UDP].chksum
+        self.assertEqual(result[UDP].chksum, IP(bytes(expected))[UDP].chksum)
+
+    def test_ip_bytes_unmodified_original_returned(self):
+        # Arrange
+        data = _ip_packet()
+        view = PacketView.from_ip_packet(data)
+
+        # Act
+        InterceptorChain([_FixedStage(Verdict.CONTINUE)]).process([view])
+
+        # Assert
+        self.assertEqual(view.ip_bytes(), data)
+
+    def test_scapy_callback_stage_modification_kept(self):
+        # Arrange
+        def handle_pck(pck):
+            pck[NTP].stratum = 4
+            return pck
+        stage = ScapyCallbackStage(lambda pck: pck.haslayer(NTP), handle_pck)
+        view = PacketView.from_ip_packet(_ip_packet())
+
+        # Act
+        InterceptorChain([stage, _FixedStage(Verdict.CONTINUE)]).process([view])
+
+        # Assert
+        self.assertEqual(IP(view.ip_bytes())[NTP].stratum, 4)
+        self.assertEqual(view.ntp().get_field_int(NTPField.STRATUM), 4)
+
+    def test_from_ip_packet_no_udp_none(self):
+        # Act
+        result = PacketView.from_ip_packet(bytes(IP(src='10.0.0.1', dst='10.0.0.2', proto=6)))
+
+        # Assert
+        self.assertIsNone(result)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,8 @@
 import unittest
 
-from ntp_crypto import NTPSecret
+from bit_codec import bits_to_bytes
+from ntp_crypto import NTPSecret, BatchDecryptor, CipherCache, NTPStreamReceiver, NTPStreamSecret, STREAM_HEADER, \
+    cipher_cache, decrypt_batch, decrypt_bits, decrypt_stream, stream_with_header
 
 
 class NTPCryptoTests(unittest.TestCase):
@@ -29,6 +31,193 @@ class NTPCryptoTests(unittest.TestCase):
         # Assert
         self.assertFalse(result)
 
+    def test_decrypt_bits_encrypted_secret_decrypted_with_cached_cipher(self):
+        # Arrange
+        key = bytes(range(32))
+        ntp_secret = NTPSecret(b'0123456789abcdef', key)
+        misses = cipher_cache.misses
+
+        # Act
+        result = decrypt_bits(ntp_secret.get_all_bits(), key)
+
+        # Assert
+        self.assertEqual(result, b'0123456789abcdef')
+        self.assertEqual(cipher_cache.misses, misses)
+
+
+class DecryptBatchTests(unittest.TestCase):
+
+    def test_decrypt_batch_mixed_keys_results_in_order(self):
+        # Arrange
+        keys = [bytes(range(32)), b'second key', bytes(range(32)), b'third key']
+        messages = [b'first message...', b'second message..', (b'third message...' * 2), b'fourth message..']
+        pairs = [(key, bits_to_bytes(NTPSecret(message, key).get_all_bits())) for key, message in zip(keys, messages)]
+
+        # Act
+        result = decrypt_batch(pairs)
+
+        # Assert
+        self.assertEqual(result, messages)
+
+    def test_decrypt_batch_no_pairs_empty_result(self):
+        # Act
+        result = decrypt_batch([])
+
+        # Assert
+        self.assertEqual(result, [])
+
+    def test_batch_decryptor_submitted_messages_decrypted_by_worker(self):
+        # Arrange
+        key = bytes(range(32))
+        messages = [bytes([i]) * 16 for i in range(50)]
+        decryptor = BatchDecryptor(max_batch_size=8)
+        decryptor.start()
+
+        # Act
+        futures = [decryptor.submit(key, bits_to_bytes(NTPSecret(message, key).get_all_bits())) for message in messages]
+        decryptor.stop()
+
+        # Assert
+        self.assertEqual([future.result(timeout=1) for future in futures], messages)
+        self.assertEqual(decryptor.messages, 50)
+        self.assertGreaterEqual(decryptor.batches, 7)
+
+    def test_batch_decryptor_invalid_length_value_error_on_submit(self):
+        # Arrange
+        decryptor = BatchDecryptor()
+
+        # Act & Assert
+        with self.assertRaises(ValueError):
+            decryptor.submit(b'key', b'too short')
+
+    def test_batch_decryptor_one_invalid_key_only_its_future_fails(self):
+        # Arrange
+        key = bytes(range(32))
+        messages = [bytes([i]) * 16 for i in range(3)]
+        encrypted = [bits_to_bytes(NTPSecret(message, key).get_all_bits()) for message in messages]
+        decryptor = BatchDecryptor()
+
+        # Act
+        futures = [decryptor.submit(key, encrypted[0]), decryptor.submit(None, encrypted[1]),
+                   decryptor.submit(key, encrypted[2])]
+        decryptor.start()
+        decryptor.stop()
+
+        # Assert
+        self.assertEqual(futures[0].result(timeout=1), messages[0])
+        self.assertIsNotNone(futures[1].exception(timeout=1))
+        self.assertEqual(futures[2].result(timeout=1), messages[2])
+        self.assertEqual(decryptor.messages, 2)
+
+
+class NTPStreamSecretTests(unittest.TestCase):
+
+    def test_decrypt_stream_large_message_round_trip(self):
+        # Arrange
+        key = bytes(range(32))
+        message = bytes(i % 251 for i in range(5000))
+        secret = NTPStreamSecret(message, key)
+        received = []
+        while secret.has_next_bits():
+            received.append(secret.next_bits(16))
+
+        # Act
+        result = b''.join(decrypt_stream(received, key, secret.nonce))
+
+        # Assert
+        self.assertEqual(result, message)
+        self.assertEqual(secret.bits_delivered, len(message) * 8)
+
+    def test_next_bits_across_chunk_boundaries_same_as_single_read(self):
+        # Arrange
+        key = b'1234567890abcdef1234567890abcdef'
+        nonce = bytes(8)
+        message = [b'abc', b'defghijklmnopqrstuvwxyz']
+
+        # Act
+        split = NTPStreamSecret(message, key, nonce=nonce, chunk_size=5)
+        bits = split.next_bits(7) + split.next_bits(100) + split.next_bits(1000)
+        whole = NTPStreamSecret(b''.join(message), key, nonce=nonce)
+
+        # Assert
+        self.assertEqual(bits, whole.next_bits(26 * 8))
+
+    def test_has_next_bits_all_bits_read_returns_false(self):
+        # Arrange
+        secret = NTPStreamSecret('Hello', 'Encrypt')
+        secret.next_bits(5 * 8)
+
+        # Act
+        result = secret.has_next_bits()
+
+        # Assert
+        self.assertFalse(result)
+
+
+class NTPStreamReceiverTests(unittest.TestCase):
+
+    def test_feed_bits_in_small_chunks_message_decrypted_while_received(self):
+        # Arrange
+        key = bytes(range(32))
+        message = bytes(i % 251 for i in range(1000))
+        secret = NTPStreamSecret(stream_with_header(iter([message[:300], message[300:]]), len(message)), key)
+        receiver = NTPStreamReceiver(key, secret.nonce)
+
+        # Act
+        receiver.feed(secret.next_bits(12))
+        length_after_header = receiver.length
+        while secret.has_next_bits():
+            receiver.feed(secret.next_bits(20))
+        receiver.feed('0' * 44)  # Padding of the last package.
+
+        # Assert
+        self.assertIsNone(length_after_header)
+        self.assertEqual(receiver.length, len(message))
+        self.assertTrue(receiver.is_complete())
+        self.assertEqual(receiver.message(), message)
+
+    def test_feed_length_above_max_length_value_error(self):
+        # Arrange
+        key = bytes(range(32))
+        secret = NTPStreamSecret(STREAM_HEADER.pack(0xFFFFFFFF), key)
+        receiver = NTPStreamReceiver(key, secret.nonce, max_length=1024)
+
+        # Act & Assert
+        with self.assertRaises(ValueError):
+            receiver.feed(secret.next_bits(32))
+
+
+class CipherCacheTests(unittest.TestCase):
+
+    def test_get_same_key_twice_one_miss_one_hit(self):
+        # Arrange
+        cache = CipherCache()
+
+        # Act
+        first = cache.get(b'key')
+        second = cache.get('key')
+
+        # Assert
+        self.assertIs(first, second)
+        self.assertEqual(cache.misses, 1)
+        self.assertEqual(cache.hits, 1)
+
+    def test_get_max_size_exceeded_least_recently_used_evicted(self):
+        # Arrange
+        cache = CipherCache(max_size=2)
+        first = cache.get(b'1')
+        cache.get(b'2')
+        cache.get(b'1')
+
+        # Act
+        cache.get(b'3')
+
+        # Assert
+        self.assertEqual(len(cache), 2)
+        self.assertIs(cache.get(b'1'), first)
+        cache.get(b'2')
+        self.assertEqual(cache.misses, 4)
+
 
 if __name__ == '__main__':
     unittest.main()
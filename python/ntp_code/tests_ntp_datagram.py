@@ -0,0 +1,112 @@
+import os
+import tempfile
+import unittest
+
+from scapy.layers.inet import IP, UDP, TCP
+from scapy.layers.l2 import Ether, Dot1Q
+from scapy.layers.ntp import NTP
+from scapy.utils import wrpcap
+
+from ntp_datagram import NTPDatagram, NTPDatagramReceiver, parse_ethernet_frame, parse_ip_packet, \
+    read_pcap
+from ntp_raw import NTPField
+
+
+class NTPDatagramTests(unittest.TestCase):
+
+    def test_parse_ethernet_frame_ntp_frame_all_fields_extracted(self):
+        # Arrange
+        ntp = bytes(NTP(stratum=3))  # Serialized once, since the sent timestamp of NTP() is volatile.
+        frame = bytes(Ether() / IP(src='10.0.0.1', dst='10.0.0.2') / UDP(sport=40000, dport=123) / ntp)
+
+        # Act
+        result = parse_ethernet_frame(frame)
+
+        # Assert
+        self.assertEqual(result, NTPDatagram('10.0.0.1', '10.0.0.2', 40000, 123, ntp))
+        self.assertEqual(result.raw().get_field_int(NTPField.STRATUM), 3)
+
+    def test_parse_ethernet_frame_vlan_tag_payload_extracted(self):
+        # Arrange
+        ntp = bytes(NTP())
+        frame = bytes(Ether() / Dot1Q(vlan=5) / IP(src='10.0.0.1', dst='10.0.0.2') / UDP(sport=123, dport=123) / ntp)
+
+        # Act
+        result = parse_ethernet_frame(frame)
+
+        # Assert
+        self.assertEqual(result.payload, ntp)
+
+    def test_parse_ethernet_frame_ethernet_padding_ignored(self):
+        # Arrange
+        frame = bytes(Ether() / IP(src='10.0.0.1', dst='10.0.0.2') / UDP(sport=123, dport=123) / b'ab') + bytes(20)
+
+        # Act
+        result = parse_ethernet_frame(frame)
+
+        # Assert
+        self.assertEqual(result.payload, b'ab')
+
+    def test_parse_ethernet_frame_tcp_none_returned(self):
+        # Arrange
+        frame = bytes(Ether() / IP(src='10.0.0.1', dst='10.0.0.2') / TCP(sport=123, dport=123))
+
+        # Act
+        result = parse_ethernet_frame(frame)
+
+        # Assert
+        self.assertIsNone(result)
+
+    def test_parse_ip_packet_truncated_none_returned(self):
+        # Arrange
+        data = bytes(IP(src='10.0.0.1', dst='10.0.0.2') / UDP() / NTP())[:24]
+
+        # Act
+        result = parse_ip_packet(data)
+
+        # Assert
+        self.assertIsNone(result)
+
+    def test_read_pcap_capture_time_and_frame_number_returned(self):
+        # Arrange
+        ntp = bytes(NTP())
+        frames = [Ether() / IP() / TCP(),
+                  Ether() / IP(src='10.0.0.1', dst='10.0.0.2') / UDP(sport=123, dport=123) / ntp]
+        frames[1].time = 1600000000.5
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = os.path.join(directory, 'capture.pcap')
+            wrpcap(file_path, frames)
+
+            # Act
+            result = list(read_pcap(file_path))
+
+        # Assert
+        self.assertEqual(result, [(2, NTPDatagram('10.0.0.1', '10.0.0.2', 123, 123, ntp, 1600000000500000000))])
+
+    def test_to_scapy_datagram_same_ntp_package(self):
+        # Arrange
+        ntp = bytes(NTP(stratum=2))
+        datagram = NTPDatagram('10.0.0.1', '10.0.0.2', 123, 123, ntp)
+
+        # Act
+        result = datagram.to_scapy()
+
+        # Assert
+        self.assertEqual(result[IP].src, '10.0.0.1')
+        self.assertEqual(bytes(result[NTP]), ntp)
+
+    def test_accepts_target_ip_set_other_destination_rejected(self):
+        # Arrange
+        receiver = NTPDatagramReceiver('lo', target_ip_addr='10.0.0.2')
+
+        # Act
+        accepted = receiver.accepts(NTPDatagram('10.0.0.1', '10.0.0.2', 40000, 123, b''))
+        rejected = receiver.accepts(NTPDatagram('10.0.0.2', '10.0.0.1', 123, 40000, b''))
+
+        # Assert
+        self.assertTrue(accepted)
+        self.assertFalse(rejected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import itertools
+import os
+import unittest
+
+from ntp_fec import ReedSolomonCode, gf_inv, gf_mul
+
+
+class GaloisFieldTests(unittest.TestCase):
+
+    def test_gf_inv_all_elements_product_is_one(self):
+        # Act
+        products = [gf_mul(a, gf_inv(a)) for a in range(1, 256)]
+
+        # Assert
+        self.assertEqual(set(products), {1})
+
+    def test_gf_inv_zero_raises(self):
+        # Act, Assert
+        with self.assertRaises(ZeroDivisionError):
+            gf_inv(0)
+
+
+class ReedSolomonCodeTests(unittest.TestCase):
+
+    def test_encode_data_chunks_unchanged(self):
+        # Arrange
+        code = ReedSolomonCode(4, 6)
+        data = [os.urandom(2) for _ in range(4)]
+
+        # Act
+        result = code.encode(data)
+
+        # Assert
+        self.assertEqual(len(result), 6)
+        self.assertEqual(result[:4], data)
+
+    def test_decode_any_k_chunks_data_restored(self):
+        # Arrange
+        code = ReedSolomonCode(4, 7)
+        data = [os.urandom(2) for _ in range(4)]
+        chunks = code.encode(data)
+
+        for indices in itertools.combinations(range(7), 4):
+            # Act
+            result = code.decode({i: chunks[i] for i in indices})
+
+            # Assert
+            self.assertEqual(result, data, 'Chunks ' + str(indices))
+
+    def test_decode_more_than_k_chunks_data_restored(self):
+        # Arrange
+        code = ReedSolomonCode(8, 12)
+        data = [os.urandom(2) for _ in range(8)]
+        chunks = code.encode(data)
+
+        # Act
+        result = code.decode({i: chunks[i] for i in (0, 2, 3, 5, 8, 9, 10, 11, 6)})
+
+        # Assert
+        self.assertEqual(result, data)
+
+    def test_decode_less_than_k_chunks_raises(self):
+        # Arrange
+        code = ReedSolomonCode(4, 6)
+        chunks = code.encode([os.urandom(2) for _ in range(4)])
+
+        # Act, Assert
+        with self.assertRaises(ValueError):
+            code.decode({i: chunks[i] for i in (1, 4, 5)})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import time
+import unittest
+
+from ntp_packet_factory import NTPPacketFactory
+from ntp_raw import RawNTP, NTPField
+from ntp_timestamp import ntp_timestamp_now
+
+
+class NTPPacketFactoryTests(unittest.TestCase):
+
+    def test_create_client_pck_bytes_only_transmit_filled(self):
+        # Arrange
+        factory = NTPPacketFactory()
+
+        # Act
+        result = RawNTP.from_bytes(factory.create_client_pck_bytes())
+
+        # Assert
+        self.assertEqual(result.get_field_int(NTPField.REFERENCE_TIMESTAMP), 0)
+        self.assertEqual(result.get_field_int(NTPField.ORIGIN_TIMESTAMP), 0)
+        self.assertEqual(result.get_field_int(NTPField.RECEIVE_TIMESTAMP), 0)
+        self.assertLessEqual(abs((result.get_field_int(NTPField.TRANSMIT_TIMESTAMP) >> 32)
+                                 - (ntp_timestamp_now() >> 32)), 1)
+
+    def test_create_init_pck_bytes_all_timestamps_filled_high_bits_equal(self):
+        # Arrange
+        factory = NTPPacketFactory(num_of_digits_to_fill_up=12)
+
+        # Act
+        result = RawNTP.from_bytes(factory.create_init_pck_bytes())
+
+        # Assert
+        timestamps = [result.get_field_int(field) for field in (NTPField.REFERENCE_TIMESTAMP,
+                                                                 NTPField.ORIGIN_TIMESTAMP,
+                                                                 NTPField.RECEIVE_TIMESTAMP,
+                                                                 NTPField.TRANSMIT_TIMESTAMP)]
+        self.assertEqual(len(set(timestamp >> 12 for timestamp in timestamps)), 1)
+        self.assertEqual(result.mode(), '011')
+
+    def test_client_pck_bytes_pool_started_packages_taken_from_pool(self):
+        # Arrange
+        factory = NTPPacketFactory(pool_size=4, max_age_sec=5)
+        factory.start()
+        time.sleep(0.1)
+
+        # Act
+        result = factory.client_pck_bytes()
+        factory.stop()
+
+        # Assert
+        self.assertEqual(len(result), 48)
+        self.assertEqual(factory.pool_hits, 1)
+        self.assertEqual(factory.pool_misses, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -13,6 +13,27 @@ class NTPFieldTests(unittest.TestCase):
         self.assertEqual(NTPField.REFERENCE_TIMESTAMP.length(), 64)
         self.assertEqual(NTPField.ORIGIN_TIMESTAMP.length(), 64)
 
+    def test_length_all_fields_sum_up_to_header_size(self):
+        # Act
+        result = sum(field.length() for field in NTPField)
+
+        # Assert
+        self.assertEqual(result, 384)
+
+    def test_set_field_stratum_and_reference_id_equals_scapy_values(self):
+        # Arrange
+        ntp_raw = RawNTP()
+
+        # Act
+        ntp_raw.set_field('00000111', NTPField.STRATUM)
+        ntp_raw.set_field_int(0x7F000001, NTPField.REFERENCE_ID)
+
+        # Assert
+        ntp = ntp_raw.ntp()
+        self.assertEqual(ntp.stratum, 7)
+        self.assertEqual(ntp.id, '127.0.0.1')
+        self.assertEqual(ntp_raw.get_field_int(NTPField.STRATUM), 7)
+
     def test_ntp(self):
         # Arrange
         ntp_header = NTPHeader()
@@ -25,6 +46,16 @@ class NTPFieldTests(unittest.TestCase):
         # Assert
         self.assertEqual(result.transmit_timestamp(), _TEST_BIN_64BIT)
 
+    def test_from_bytes_less_than_48_bytes_after_offset_value_error(self):
+        # Arrange
+        wire_bytes = bytes(RawNTP().ntp())
+
+        # Act / Assert
+        with self.assertRaises(ValueError):
+            RawNTP.from_bytes(wire_bytes, offset=1)
+        with self.assertRaises(ValueError):
+            RawNTP(wire_bytes[:47])
+
     def test_set_receive_timestamp(self):
         # Arrange
         ntp_raw = RawNTP()
@@ -44,3 +75,39 @@ class NTPFieldTests(unittest.TestCase):
 
         # Assert
         self.assertEqual(ntp_raw.origin_timestamp(), _TEST_BIN_64BIT)
+
+    def test_set_bits_unaligned_only_given_bits_changed(self):
+        # Arrange
+        ntp_raw = RawNTP()
+        ntp_raw.set_transmit_timestamp(_TEST_BIN_64BIT)
+
+        # Act
+        ntp_raw.set_bits(320 + 5, 11, int('10101010101', 2))
+
+        # Assert
+        self.assertEqual(ntp_raw.transmit_timestamp(), _TEST_BIN_64BIT[:5] + '10101010101' + _TEST_BIN_64BIT[16:])
+        self.assertEqual(len(ntp_raw._raw), 384)
+
+    def test_get_bits_unaligned_correct_value_returned(self):
+        # Arrange
+        ntp_raw = RawNTP()
+        ntp_raw.set_transmit_timestamp(_TEST_BIN_64BIT)
+
+        # Act
+        result = ntp_raw.get_bits(320 + 3, 13)
+
+        # Assert
+        self.assertEqual(result, int(_TEST_BIN_64BIT[3:16], 2))
+
+    def test_from_bytes_to_bytes_round_trip_equals_scapy(self):
+        # Arrange
+        ntp_raw = RawNTP()
+        ntp_raw.set_transmit_timestamp(_TEST_BIN_64BIT)
+        wire_bytes = bytes(ntp_raw.ntp())
+
+        # Act
+        result = RawNTP.from_bytes(memoryview(b'\x00' * 28 + wire_bytes), offset=28)
+
+        # Assert
+        self.assertEqual(result.to_bytes(), wire_bytes)
+        self.assertEqual(result.transmit_timestamp(), _TEST_BIN_64BIT)
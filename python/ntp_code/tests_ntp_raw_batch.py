@@ -0,0 +1,84 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+from scapy.layers.inet import IP, TCP, UDP
+from scapy.layers.l2 import Ether
+from scapy.layers.ntp import NTP
+from scapy.utils import wrpcap
+
+from ntp_raw import NTPField, RawNTP
+from ntp_raw_batch import RawNTPBatch
+
+_TEST_BIN_64BIT = '1010111111111111111011101000011100000000000000000000000000000011'
+
+
+class RawNTPBatchTests(unittest.TestCase):
+
+    def test_get_field_equals_raw_ntp_values(self):
+        # Arrange
+        first = RawNTP()
+        first.set_transmit_timestamp(_TEST_BIN_64BIT)
+        first.set_mode('100')
+        second = RawNTP()
+        batch = RawNTPBatch.from_raw_ntp([first, second])
+
+        # Act
+        transmit = batch.get_field(NTPField.TRANSMIT_TIMESTAMP)
+        mode = batch.get_field(NTPField.MODE)
+
+        # Assert
+        self.assertEqual(transmit.tolist(), [int(_TEST_BIN_64BIT, 2), int(second.transmit_timestamp(), 2)])
+        self.assertEqual(mode.tolist(), [4, int(second.mode(), 2)])
+
+    def test_set_field_bit_field_other_bits_unchanged(self):
+        # Arrange
+        batch = RawNTPBatch.from_raw_ntp([RawNTP(), RawNTP()])
+        li_before = batch.get_field(NTPField.LI)
+        vn_before = batch.get_field(NTPField.VN)
+
+        # Act
+        batch.set_field(np.array([3, 4]), NTPField.MODE)
+
+        # Assert
+        self.assertEqual(batch.get_field(NTPField.MODE).tolist(), [3, 4])
+        self.assertEqual(batch.get_field(NTPField.LI).tolist(), li_before.tolist())
+        self.assertEqual(batch.get_field(NTPField.VN).tolist(), vn_before.tolist())
+
+    def test_to_list_round_trip_equals_raw_ntp(self):
+        # Arrange
+        raw = RawNTP()
+        batch = RawNTPBatch.from_raw_ntp([raw])
+
+        # Act
+        batch.set_field(int(_TEST_BIN_64BIT, 2), NTPField.RECEIVE_TIMESTAMP)
+        raw.set_receive_timestamp(_TEST_BIN_64BIT)
+
+        # Assert
+        self.assertEqual(batch.to_list(), [raw.to_bytes()])
+        self.assertEqual(batch[0].receive_timestamp(), _TEST_BIN_64BIT)
+
+    def test_from_pcap_other_packages_skipped_frame_numbers_kept(self):
+        # Arrange
+        first = bytes(NTP(stratum=2))
+        second = bytes(NTP(stratum=3))
+        frames = [Ether() / IP() / TCP(),
+                  Ether() / IP(src='10.0.0.1') / UDP(sport=40000, dport=123) / first,
+                  Ether() / IP() / UDP(sport=5000, dport=53),
+                  Ether() / IP(src='10.0.0.2') / UDP(sport=123, dport=40000) / second]
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = os.path.join(directory, 'capture.pcap')
+            wrpcap(file_path, frames)
+
+            # Act
+            batch = RawNTPBatch.from_pcap(file_path)
+
+        # Assert
+        self.assertEqual(batch.to_list(), [first, second])
+        self.assertEqual(batch.frame_numbers().tolist(), [2, 4])
+        self.assertEqual(batch.get_field(NTPField.STRATUM).tolist(), [2, 3])
+
+
+if __name__ == '__main__':
+    unittest.main()
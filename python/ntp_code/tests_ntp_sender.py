@@ -0,0 +1,98 @@
+import socket
+import time
+import unittest
+
+from ntp_sender import NTPSender
+
+
+class NTPSenderTests(unittest.TestCase):
+
+    def setUp(self):
+        self.receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.receiver.bind(('127.0.0.1', 0))
+        self.receiver.settimeout(2)
+        self.sender = NTPSender(dst_port=self.receiver.getsockname()[1])
+
+    def tearDown(self):
+        self.sender.close()
+        self.receiver.close()
+
+    def test_send_all_many_packages_one_socket_all_received_in_order(self):
+        # Arrange
+        payloads = [bytes([i]) * 48 for i in range(20)]
+
+        # Act
+        self.sender.send_all(payloads, '127.0.0.1')
+        received = [self.receiver.recvfrom(1024) for _ in payloads]
+
+        # Assert
+        self.assertEqual([data for data, _ in received], payloads)
+        self.assertEqual(len({peer for _, peer in received}), 1)
+        self.assertEqual(self.sender.packets_sent, 20)
+
+    def test_send_all_different_lengths_all_received_in_order(self):
+        # Arrange
+        payloads = [bytes([i]) * 48 for i in range(70)] + [bytes(68), bytes(68), bytes(48)]
+
+        # Act
+        self.sender.send_all(payloads, '127.0.0.1')
+        received = [self.receiver.recv(1024) for _ in payloads]
+
+        # Assert
+        self.assertEqual(received, payloads)
+        self.assertEqual(self.sender.packets_sent, len(payloads))
+
+    def test_send_all_segmentation_unavailable_packages_sent_one_by_one(self):
+        # Arrange
+        payloads = [bytes([i]) * 48 for i in range(5)]
+        self.sender.open()
+        sock = self.sender._socket
+
+        class _NoSegmentationSocket:
+            def sendmsg(self, *args):
+                raise OSError('Operation not supported')
+
+            def __getattr__(self, name):
+                return getattr(sock, name)
+        self.sender._socket = _NoSegmentationSocket()
+
+        # Act
+        self.sender.send_all(payloads, '127.0.0.1')
+        received = [self.receiver.recv(1024) for _ in payloads]
+
+        # Assert
+        self.assertEqual(received, payloads)
+        self.assertFalse(self.sender._segmentation)
+
+    def test_send_all_interval_packages_paced(self):
+        # Arrange
+        payloads = [bytes(48)] * 5
+
+        # Act
+        start = time.perf_counter()
+        self.sender.send_all(payloads, '127.0.0.1', interval_sec=0.02)
+        duration = time.perf_counter() - start
+
+        # Assert
+        self.assertGreaterEqual(duration, 0.08)
+        self.assertLess(duration, 0.5)
+
+    def test_send_src_port_set_packages_sent_from_port(self):
+        # Arrange
+        port_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        port_socket.bind(('127.0.0.1', 0))
+        src_port = port_socket.getsockname()[1]
+        port_socket.close()
+        sender = NTPSender(dst_port=self.receiver.getsockname()[1], src_port=src_port)
+
+        # Act
+        sender.send(bytes(48), '127.0.0.1')
+        _, peer = self.receiver.recvfrom(1024)
+        sender.close()
+
+        # Assert
+        self.assertEqual(peer[1], src_port)
+
+
+if __name__ == '__main__':
+    unittest.main()
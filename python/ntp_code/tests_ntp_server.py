@@ -0,0 +1,192 @@
+import socket
+import time
+import unittest
+
+from interceptor_chain import InterceptorChain, InterceptorStage, Verdict
+from ntp_packet_factory import default_packet_factory
+from ntp_raw import NTPField, RawNTP
+from ntp_server import NTPInterceptor, NTPServer, ntp_response_template, patch_response
+
+
+class _RawStratumInterceptor(NTPInterceptor):
+    def intercept_res_raw(self, res: RawNTP) -> RawNTP:
+        res.set_field_int(7, NTPField.STRATUM)
+        return res
+
+
+class _ScapyStratumInterceptor(NTPInterceptor):
+    def intercept_res(self, pck):
+        pck.stratum = 5
+        return pck
+
+
+class _DropOddStage(InterceptorStage):
+    def process_one(self, view):
+        return Verdict.DROP if view.datagram.payload[47] % 2 else Verdict.CONTINUE
+
+
+class _BreakOddStage(InterceptorStage):
+    def process_one(self, view):
+        if view.datagram.payload[31] % 2:
+            view.set_scapy(object())  # The response cannot be serialized anymore.
+        return Verdict.CONTINUE
+
+
+class NTPServerTests(unittest.TestCase):
+
+    def _exchange(self, server: NTPServer, num_requests: int) -> list:
+        """
+        :return: (request, response) of every request sent to the server.
+        """
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as client:
+            client.settimeout(5)
+            requests = [default_packet_factory().create_client_pck_bytes() for _ in range(num_requests)]
+            for request in requests:
+                client.sendto(request, server.local_addr)
+            responses = {}
+            for _ in requests:
+                response = client.recvfrom(1024)[0]
+                responses[response[24:32]] = response
+        return [(request, responses.get(request[40:48])) for request in requests]
+
+    def test_patch_response_template_timestamps_set(self):
+        # Arrange
+        template = ntp_response_template(stratum=3, reference_time=0x1111)
+        request = default_packet_factory().create_client_pck_bytes()
+
+        # Act
+        result = RawNTP(patch_response(template, request, 0x2222, 0x3333))
+
+        # Assert
+        self.assertEqual(result.get_field_int(NTPField.MODE), 4)
+        self.assertEqual(result.get_field_int(NTPField.STRATUM), 3)
+        self.assertEqual(result.get_field_int(NTPField.REFERENCE_TIMESTAMP), 0x1111)
+        self.assertEqual(result.get_field_int(NTPField.ORIGIN_TIMESTAMP),
+                         RawNTP(request).get_field_int(NTPField.TRANSMIT_TIMESTAMP))
+        self.assertEqual(result.get_field_int(NTPField.RECEIVE_TIMESTAMP), 0x2222)
+        self.assertEqual(result.get_field_int(NTPField.TRANSMIT_TIMESTAMP), 0x3333)
+        self.assertEqual(len(template), 48)
+
+    def test_serve_two_workers_every_request_answered(self):
+        # Arrange
+        server = NTPServer(sniff_interface='lo', res_interceptor=_RawStratumInterceptor())
+        server.serve(local_addr=('127.0.0.1', 0), num_workers=2)
+
+        # Act
+        try:
+            exchanges = self._exchange(server, 50)
+        finally:
+            server.stop()
+
+        # Assert
+        for request, response in exchanges:
+            self.assertIsNotNone(response)
+            self.assertEqual(RawNTP(response).get_field_int(NTPField.STRATUM), 7)
+            self.assertGreaterEqual(RawNTP(response).get_field_int(NTPField.TRANSMIT_TIMESTAMP),
+                                    RawNTP(request).get_field_int(NTPField.TRANSMIT_TIMESTAMP))
+        self.assertEqual(server.responses_sent(), 50)
+        self.assertEqual(server.receive_latency().count(), 50)
+
+    def test_serve_while_serving_statistics_of_all_workers_reported(self):
+        # Arrange
+        server = NTPServer(sniff_interface='lo')
+        server.serve(local_addr=('127.0.0.1', 0), num_workers=2)
+
+        # Act
+        try:
+            self._exchange(server, 30)
+            time.sleep(0.5)
+            sent = server.responses_sent()
+            latency = server.receive_latency()
+        finally:
+            server.stop()
+
+        # Assert
+        self.assertEqual(sent, 30)
+        self.assertEqual(latency.count(), 30)
+
+    def test_serve_kernel_timestamps_receive_time_before_transmit_time(self):
+        # Arrange
+        server = NTPServer(sniff_interface='lo')
+        server.serve(local_addr=('127.0.0.1', 0), num_workers=1)
+
+        # Act
+        try:
+            exchanges = self._exchange(server, 5)
+        finally:
+            server.stop()
+
+        # Assert
+        for request, response in exchanges:
+            receive_time = RawNTP(response).get_field_int(NTPField.RECEIVE_TIMESTAMP)
+            self.assertLessEqual(RawNTP(request).get_field_int(NTPField.TRANSMIT_TIMESTAMP) >> 32, receive_time >> 32)
+            self.assertLess(receive_time, RawNTP(response).get_field_int(NTPField.TRANSMIT_TIMESTAMP))
+
+    def test_serve_scapy_interceptor_fallback_used(self):
+        # Arrange
+        server = NTPServer(sniff_interface='lo', res_interceptor=_ScapyStratumInterceptor())
+        server.serve(local_addr=('127.0.0.1', 0), num_workers=1)
+
+        # Act
+        try:
+            exchanges = self._exchange(server, 3)
+        finally:
+            server.stop()
+
+        # Assert
+        for _, response in exchanges:
+            self.assertEqual(RawNTP(response).get_field_int(NTPField.STRATUM), 5)
+
+    def _answered(self, server: NTPServer, requests: list) -> list:
+        """
+        :return: the origin timestamps of all responses received within a second.
+        """
+        answered = []
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as client:
+            client.settimeout(1)
+            for request in requests:
+                client.sendto(request, server.local_addr)
+            try:
+                while True:
+                    answered.append(client.recvfrom(1024)[0][24:32])
+            except socket.timeout:
+                pass
+        return answered
+
+    def test_serve_request_chain_dropped_requests_not_answered(self):
+        # Arrange
+        server = NTPServer(sniff_interface='lo', request_chain=InterceptorChain([_DropOddStage()]))
+        server.serve(local_addr=('127.0.0.1', 0), num_workers=1)
+        requests = [default_packet_factory().create_client_pck_bytes() for _ in range(20)]
+
+        # Act
+        try:
+            answered = self._answered(server, requests)
+        finally:
+            server.stop()
+
+        # Assert
+        expected = [request[40:48] for request in requests if request[47] % 2 == 0]
+        self.assertCountEqual(answered, expected)
+        self.assertEqual(server.responses_sent(), len(expected))
+
+    def test_serve_response_not_sendable_other_requests_still_answered(self):
+        # Arrange
+        server = NTPServer(sniff_interface='lo', response_chain=InterceptorChain([_BreakOddStage()]))
+        server.serve(local_addr=('127.0.0.1', 0), num_workers=1)
+        requests = [default_packet_factory().create_client_pck_bytes() for _ in range(20)]
+
+        # Act
+        try:
+            answered = self._answered(server, requests[:10])
+            answered += self._answered(server, requests[10:])  # The worker still serves after the failures.
+        finally:
+            server.stop()
+
+        # Assert
+        expected = [request[40:48] for request in requests if request[47] % 2 == 0]
+        self.assertCountEqual(answered, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
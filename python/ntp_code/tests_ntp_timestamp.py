@@ -0,0 +1,72 @@
+import unittest
+
+import numpy as np
+
+from ntp_timestamp import unix_ns_to_ntp64, ntp64_to_unix_ns, ntp64_fraction_digits, ns_to_ntp32_short, \
+    ntp32_short_to_ns, unix_ns_to_ntp64_array, ntp64_to_unix_ns_array, ntp64_fraction_digits_array
+
+_UNIX_NS = 1598918400123456789  # 2020-09-01 00:00:00.123456789
+
+
+class NTPTimestampTests(unittest.TestCase):
+
+    def test_unix_ns_to_ntp64_seconds_shifted_by_ntp_epoch(self):
+        # Act
+        result = unix_ns_to_ntp64(_UNIX_NS)
+
+        # Assert
+        self.assertEqual(result >> 32, 1598918400 + 2208988800)
+        self.assertEqual(result & 0xFFFFFFFF, (123456789 << 32) // 1000000000)
+
+    def test_ntp64_fraction_digits_half_second(self):
+        # Act
+        result = ntp64_fraction_digits((1 << 32) | (1 << 31))
+
+        # Assert
+        self.assertEqual(result, '500000000')
+
+    def test_ntp64_to_unix_ns_round_trip_exact(self):
+        # Act
+        result = ntp64_to_unix_ns(unix_ns_to_ntp64(_UNIX_NS))
+
+        # Assert
+        self.assertEqual(result, _UNIX_NS)
+
+    def test_ntp64_fraction_digits_leading_zeros_kept(self):
+        # Arrange
+        timestamp = (1 << 32) | (1 << 10)  # 1024 / 2^32 = 0.000000238...
+
+        # Act
+        result = ntp64_fraction_digits(timestamp)
+
+        # Assert
+        self.assertEqual(result, '000000238')
+
+    def test_ntp32_short_round_trip(self):
+        # Arrange
+        half_second = 500000000
+
+        # Act
+        short = ns_to_ntp32_short(3 * 1000000000 + half_second)
+
+        # Assert
+        self.assertEqual(short, (3 << 16) | (1 << 15))
+        self.assertEqual(ntp32_short_to_ns(short), 3 * 1000000000 + half_second)
+
+    def test_array_variants_equal_scalar_results(self):
+        # Arrange
+        unix_ns = np.array([_UNIX_NS, _UNIX_NS + 987654321, 0], dtype=np.int64)
+
+        # Act
+        timestamps = unix_ns_to_ntp64_array(unix_ns)
+        digits = ntp64_fraction_digits_array(timestamps)
+
+        # Assert
+        self.assertEqual(timestamps.tolist(), [unix_ns_to_ntp64(int(ns)) for ns in unix_ns])
+        self.assertEqual(ntp64_to_unix_ns_array(timestamps).tolist(), unix_ns.tolist())
+        self.assertEqual([''.join(str(d) for d in row) for row in digits],
+                         [ntp64_fraction_digits(int(ts)) for ts in timestamps])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import asyncio
+import unittest
+
+from ntp_mode import NTPMode
+from ntp_packet_factory import NTPPacketFactory
+from ntp_raw import NTPField, RawNTP
+from ntp_udp_transport import create_ntp_endpoint, ntp_server_response
+
+
+class NTPUdpTransportTests(unittest.TestCase):
+
+    def test_ntp_server_response_client_request_origin_is_request_transmit(self):
+        # Arrange
+        request = NTPPacketFactory().create_client_pck_bytes()
+
+        # Act
+        response = RawNTP.from_bytes(ntp_server_response(request))
+
+        # Assert
+        self.assertEqual(response.get_field_int(NTPField.MODE), NTPMode.SERVER.value)
+        self.assertEqual(response.get_field_int(NTPField.ORIGIN_TIMESTAMP),
+                         RawNTP.from_bytes(request).get_field_int(NTPField.TRANSMIT_TIMESTAMP))
+
+    def test_create_ntp_endpoint_request_answered_by_handler(self):
+        # Arrange
+        answers = []
+        request = NTPPacketFactory().create_client_pck_bytes()
+
+        async def run():
+            server = await create_ntp_endpoint(lambda data, peer: ntp_server_response(data),
+                                               local_addr=('127.0.0.1', 0))
+            client = await create_ntp_endpoint(lambda data, peer: answers.append(data),
+                                               remote_addr=server.transport.get_extra_info('sockname'))
+            client.send(request)
+            for _ in range(100):
+                if answers:
+                    break
+                await asyncio.sleep(0.01)
+            client.close()
+            server.close()
+            return server
+
+        # Act
+        server = asyncio.run(run())
+
+        # Assert
+        self.assertEqual(len(answers), 1)
+        self.assertEqual(server.datagrams_received, 1)
+        self.assertEqual(server.datagrams_sent, 1)
+        self.assertEqual(RawNTP.from_bytes(answers[0]).get_field_int(NTPField.ORIGIN_TIMESTAMP),
+                         RawNTP.from_bytes(request).get_field_int(NTPField.TRANSMIT_TIMESTAMP))
+
+
+if __name__ == '__main__':
+    unittest.main()
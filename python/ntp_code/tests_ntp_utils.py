@@ -61,6 +61,16 @@ class NTPUtilsTests(unittest.TestCase):
         # Assert
         self.assertEqual(result, '0100100001100101011011000110110001101111001000000101011101101111011100100110110001100100')
 
+    def test_bit_to_ascii_leading_zero_byte_kept(self):
+        # Arrange
+        bit_string = '00000000' + '01000111'
+
+        # Act
+        result = bit_to_ascii(bit_string)
+
+        # Assert
+        self.assertEqual(result, '\x00G')
+
 
 if __name__ == '__main__':
     unittest.main()
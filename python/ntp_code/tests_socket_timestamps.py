@@ -0,0 +1,87 @@
+import socket
+import time
+import unittest
+
+from socket_timestamps import LatencyHistogram, enable_kernel_timestamps, recv_with_timestamp
+
+
+class SocketTimestampsTests(unittest.TestCase):
+
+    def test_recv_with_timestamp_enabled_kernel_time_returned(self):
+        # Arrange
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as receiver, \
+                socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sender:
+            receiver.bind(('127.0.0.1', 0))
+            receiver.settimeout(2)
+            enabled = enable_kernel_timestamps(receiver)
+            before = time.time_ns()
+            sender.sendto(b'ntp', receiver.getsockname())
+
+            # Act
+            data, address, kernel_ns = recv_with_timestamp(receiver)
+            after = time.time_ns()
+            sender_address = sender.getsockname()
+
+        # Assert
+        self.assertTrue(enabled)
+        self.assertEqual(data, b'ntp')
+        self.assertEqual(address[1], sender_address[1])
+        self.assertLessEqual(before, kernel_ns)
+        self.assertLessEqual(kernel_ns, after)
+
+    def test_recv_with_timestamp_not_enabled_none_returned(self):
+        # Arrange
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as receiver, \
+                socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sender:
+            receiver.bind(('127.0.0.1', 0))
+            receiver.settimeout(2)
+            sender.sendto(b'ntp', receiver.getsockname())
+
+            # Act
+            _, _, kernel_ns = recv_with_timestamp(receiver)
+
+        # Assert
+        self.assertIsNone(kernel_ns)
+
+
+class LatencyHistogramTests(unittest.TestCase):
+
+    def test_percentile_recorded_latencies_bucket_upper_bounds_returned(self):
+        # Arrange
+        histogram = LatencyHistogram()
+        for _ in range(90):
+            histogram.record(10000)
+        for _ in range(10):
+            histogram.record(1000000)
+
+        # Act
+        p50 = histogram.percentile(50)
+        p99 = histogram.percentile(99)
+
+        # Assert
+        self.assertTrue(10000 <= p50 <= 10000 * 1.19)
+        self.assertTrue(1000000 <= p99 <= 1000000 * 1.19)
+        self.assertEqual(histogram.count(), 100)
+
+    def test_percentile_nothing_recorded_none_returned(self):
+        # Act, Assert
+        self.assertIsNone(LatencyHistogram().percentile(50))
+
+    def test_merge_other_counts_added(self):
+        # Arrange
+        histogram = LatencyHistogram()
+        other = LatencyHistogram()
+        histogram.record(500)
+        other.record(500)
+        other.record(5000)
+
+        # Act
+        histogram.merge(other.counts)
+
+        # Assert
+        self.assertEqual(histogram.summary()['count'], 3)
+        self.assertEqual(histogram.counts[LatencyHistogram.bucket(500)], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,208 @@
+import socket
+import time
+import unittest
+from threading import Thread
+
+from ntp_mode import NTPMode
+from ntp_raw import NTPField, RawNTP
+from test_utils import FakeClock
+from upstream_time_source import UpstreamTimeSource, udp_upstream
+
+_UPSTREAM_TRANSMIT = 0xE5000000_00000000
+
+
+class _FakeUpstream:
+    """
+    Answers with a fixed server package, every query takes rtt_ns on the fake clock.
+    """
+
+    def __init__(self, clock, rtt_ns: int = 10000000):
+        self.clock = clock
+        self.rtt_ns = rtt_ns
+        self.queries = 0
+        self.available = True
+
+    def __call__(self):
+        self.queries += 1
+        self.clock.now += self.rtt_ns
+        if not self.available:
+            return None
+        answer = RawNTP.from_bytes(bytes(48))
+        answer.set_field_int(NTPMode.SERVER.value, NTPField.MODE)
+        answer.set_field_int(2, NTPField.STRATUM)
+        answer.set_field_int(_UPSTREAM_TRANSMIT, NTPField.TRANSMIT_TIMESTAMP)
+        return answer.to_bytes()
+
+
+def _server_answer(origin: int, transmit: int, mode: NTPMode = NTPMode.SERVER) -> bytes:
+    answer = RawNTP.from_bytes(bytes(48))
+    answer.set_field_int(mode.value, NTPField.MODE)
+    answer.set_field_int(2, NTPField.STRATUM)
+    answer.set_field_int(origin, NTPField.ORIGIN_TIMESTAMP)
+    answer.set_field_int(transmit, NTPField.TRANSMIT_TIMESTAMP)
+    return answer.to_bytes()
+
+
+class UdpUpstreamTests(unittest.TestCase):
+
+    def test_query_spoofed_and_unrelated_datagrams_only_matching_answer_returned(self):
+        # Arrange
+        server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        spoofer = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        server.bind(('127.0.0.1', 0))
+        self.addCleanup(server.close)
+        self.addCleanup(spoofer.close)
+
+        def answer():
+            request, client = server.recvfrom(1024)
+            origin = RawNTP.from_bytes(request).get_field_int(NTPField.TRANSMIT_TIMESTAMP)
+            spoofer.sendto(_server_answer(origin, 1), client)
+            server.sendto(_server_answer(origin + 1, 2), client)
+            server.sendto(_server_answer(origin, 3, NTPMode.CLIENT), client)
+            server.sendto(_server_answer(origin, 4), client)
+        thread = Thread(target=answer)
+        thread.start()
+        query = udp_upstream('127.0.0.1', server.getsockname()[1], timeout=2)
+
+        # Act
+        result = query()
+        thread.join()
+
+        # Assert
+        self.assertEqual(RawNTP.from_bytes(result).get_field_int(NTPField.TRANSMIT_TIMESTAMP), 4)
+
+
+class UpstreamTimeSourceTests(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.upstream = _FakeUpstream(self.clock)
+        self.source = UpstreamTimeSource(self.upstream, max_age_sec=10, clock=self.clock)
+
+    def test_response_fresh_sample_no_upstream_query_timestamps_advanced(self):
+        # Arrange
+        self.source.refresh()
+        self.clock.now += 500000000  # 0.5 sec later
+        request = RawNTP.from_bytes(bytes(48))
+        request.set_field_int(0x1234, NTPField.TRANSMIT_TIMESTAMP)
+
+        # Act
+        result = self.source.response(request.to_bytes())
+
+        # Assert
+        self.assertEqual(self.upstream.queries, 1)
+        # Half a second plus half of the round trip time of 10 ms.
+        expected = _UPSTREAM_TRANSMIT + (505000000 << 32) // 1000000000
+        self.assertEqual(result.get_field_int(NTPField.TRANSMIT_TIMESTAMP), expected)
+        self.assertEqual(result.get_field_int(NTPField.RECEIVE_TIMESTAMP), expected)
+        self.assertEqual(result.get_field_int(NTPField.ORIGIN_TIMESTAMP), 0x1234)
+        self.assertEqual(result.get_field_int(NTPField.STRATUM), 2)
+
+    def test_response_stale_sample_upstream_queried_again(self):
+        # Arrange
+        self.source.refresh()
+        self.clock.now += 11 * 1000000000
+
+        # Act
+        result = self.source.response()
+
+        # Assert
+        self.assertIsNotNone(result)
+        self.assertEqual(self.upstream.queries, 2)
+
+    def test_response_upstream_unavailable_none_returned(self):
+        # Arrange
+        self.upstream.available = False
+
+        # Act
+        result = self.source.response()
+
+        # Assert
+        self.assertIsNone(result)
+        self.assertEqual(self.source.failed_refreshes, 1)
+
+    def test_response_upstream_unavailable_queried_at_most_once_per_retry_interval(self):
+        # Arrange
+        self.upstream.available = False
+        source = UpstreamTimeSource(self.upstream, retry_interval_sec=2, clock=self.clock)
+
+        # Act
+        first = source.response()
+        second = source.response()
+        self.clock.now += 2 * 1000000000
+        third = source.response()
+
+        # Assert
+        self.assertIsNone(first)
+        self.assertIsNone(second)
+        self.assertIsNone(third)
+        self.assertEqual(self.upstream.queries, 2)
+
+    def test_response_background_refresh_running_no_synchronous_query(self):
+        # Arrange
+        self.upstream.available = False
+        source = UpstreamTimeSource(self.upstream, retry_interval_sec=60, clock=self.clock)
+        source.start()
+
+        # Act
+        try:
+            result = source.response()
+        finally:
+            source.stop()
+
+        # Assert
+        self.assertIsNone(result)
+        self.assertEqual(self.upstream.queries, 1)
+
+    def test_refresh_upstream_raises_failed_refresh_counted(self):
+        # Arrange
+        def upstream():
+            raise RuntimeError('no NTP layer')
+        source = UpstreamTimeSource(upstream, clock=self.clock)
+
+        # Act
+        result = source.refresh()
+
+        # Assert
+        self.assertFalse(result)
+        self.assertEqual(source.failed_refreshes, 1)
+
+    def test_refresh_client_answer_rejected(self):
+        # Arrange
+        source = UpstreamTimeSource(lambda: _server_answer(0, _UPSTREAM_TRANSMIT, NTPMode.CLIENT), clock=self.clock)
+
+        # Act
+        result = source.refresh()
+
+        # Assert
+        self.assertFalse(result)
+        self.assertIsNone(source.best_sample())
+
+    def test_best_sample_several_samples_lowest_rtt_chosen(self):
+        # Arrange
+        for rtt_ns in (30000000, 5000000, 20000000):
+            self.upstream.rtt_ns = rtt_ns
+            self.source.refresh()
+
+        # Act
+        result = self.source.best_sample()
+
+        # Assert
+        self.assertEqual(result.rtt_ns, 5000000)
+
+    def test_start_stop_background_refresh_queries_upstream(self):
+        # Arrange
+        source = UpstreamTimeSource(self.upstream, refresh_interval_sec=0.01, clock=self.clock)
+
+        # Act
+        source.start()
+        while self.upstream.queries < 3:
+            time.sleep(0.01)
+        source.stop()
+
+        # Assert
+        self.assertGreaterEqual(source.refreshes, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,218 @@
+import logging
+import socket
+import time
+from collections import deque, namedtuple
+from threading import Event, Lock, Thread
+
+from ntp_mode import NTPMode
+from ntp_packet_factory import default_packet_factory
+from ntp_raw import NTP_HEADER_LENGTH, NTPField, RawNTP
+
+_NTP_PORT = 123
+
+
+class UpstreamSample(namedtuple('UpstreamSample', ['response', 'local_ns', 'rtt_ns'])):
+    """
+    One answer of the upstream server: the answer in its wire format, the local monotonic time (ns) at which the
+    upstream transmit timestamp was taken (the receipt minus half the round trip time) and the round trip time.
+    """
+    __slots__ = ()
+
+
+def udp_upstream(server_addr: str = 'pool.ntp.org', port: int = _NTP_PORT, timeout: float = 2):
+    """
+    Creates an upstream for UpstreamTimeSource, which queries an NTP server over an ordinary UDP socket. Only a server
+    answer from the queried address whose origin timestamp equals the transmit timestamp of the request is accepted,
+    other datagrams are dropped while waiting for it.
+    :return: a callable without parameters returning the answer in its wire format or None.
+    """
+    def query() -> bytes:
+        request = default_packet_factory().client_pck_bytes()
+        deadline = time.monotonic() + timeout
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.connect((server_addr, port))
+            sock.send(request)
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                sock.settimeout(remaining)
+                try:
+                    response, addr = sock.recvfrom(1024)
+                except socket.timeout:
+                    return None
+                if addr == sock.getpeername() and is_answer_to(request, response):
+                    return response
+    return query
+
+
+def scapy_upstream(server_addr: str = 'pool.ntp.org'):
+    """
+    Creates an upstream for UpstreamTimeSource, which queries an NTP server with ScapyWrapper.get_upstream_ntp.
+    :return: a callable without parameters returning the answer in its wire format or None.
+    """
+    def query() -> bytes:
+        from scapy.layers.ntp import NTP
+        from scapy_wrapper import ScapyWrapper
+        response = ScapyWrapper().get_upstream_ntp(server_addr)
+        return None if response is None else bytes(response[NTP])
+    return query
+
+
+def is_server_answer(response: bytes) -> bool:
+    """
+    :return: True in case the given bytes are a complete NTP server answer of a synchronized server.
+    """
+    if response is None or len(response) < NTP_HEADER_LENGTH:
+        return False
+    answer = RawNTP.from_bytes(response)
+    return answer.get_field_int(NTPField.MODE) == NTPMode.SERVER.value and answer.get_field_int(NTPField.STRATUM) != 0
+
+
+def is_answer_to(request: bytes, response: bytes) -> bool:
+    """
+    :return: True in case the response is a server answer whose origin timestamp is the transmit timestamp of the
+    request.
+    """
+    if not is_server_answer(response):
+        return False
+    origin = RawNTP.from_bytes(response).get_field_int(NTPField.ORIGIN_TIMESTAMP)
+    return origin == RawNTP.from_bytes(request).get_field_int(NTPField.TRANSMIT_TIMESTAMP)
+
+
+class UpstreamTimeSource:
+    """
+    Keeps a few recent answers of an upstream NTP server, refreshed in the background, and synthesizes server answers
+    from them: the receive and transmit timestamps of the sample with the lowest round trip time are advanced by the
+    local monotonic time passed since then. Answering a request therefore takes microseconds instead of a round trip
+    to the upstream server.
+    """
+
+    def __init__(self, upstream=None, refresh_interval_sec: float = 64, max_age_sec: float = 1024,
+                 num_samples: int = 4, retry_interval_sec: float = 2, clock=time.monotonic_ns,
+                 log: logging.Logger = logging.getLogger('UpstreamTimeSource-logger')):
+        """
+        :param upstream: a callable without parameters, which queries the upstream server and returns its answer in
+        the wire format or None. Queries pool.ntp.org over UDP if not set (see udp_upstream).
+        :param refresh_interval_sec: the time between two upstream queries of the background thread.
+        :param max_age_sec: samples older than this are not used anymore.
+        :param num_samples: the number of recent samples kept.
+        :param retry_interval_sec: the minimum time between two queries after a failed one. Without a fresh sample,
+        response() queries the upstream server itself at most this often, and only if there is no background refresh.
+        :param clock: the local monotonic clock in nanoseconds.
+        :param log:
+        """
+        self.log = log
+        self.upstream = upstream if upstream is not None else udp_upstream()
+        self.refresh_interval_sec = refresh_interval_sec
+        self.max_age_sec = max_age_sec
+        self.retry_interval_sec = retry_interval_sec
+        self.clock = clock
+        self._samples = deque(maxlen=num_samples)
+        self._lock = Lock()
+        self._stop_event = Event()
+        self._refresh_thread: Thread = None
+        self.refreshes = 0
+        self.failed_refreshes = 0
+        self._last_query_ns: int = None
+
+    def refresh(self) -> bool:
+        """
+        Queries the upstream server once and keeps its answer as a new sample.
+        :return: True in case a valid answer was received.
+        """
+        start = self.clock()
+        self._last_query_ns = start
+        try:
+            response = self.upstream()
+        except Exception as e:
+            self.log.error('Upstream query failed: ' + repr(e))
+            response = None
+        end = self.clock()
+        if not is_server_answer(response):
+            self.failed_refreshes += 1
+            self.log.warning('No valid answer of the upstream server received.')
+            return False
+        rtt_ns = end - start
+        with self._lock:
+            self._samples.append(UpstreamSample(bytes(response[:NTP_HEADER_LENGTH]), end - rtt_ns // 2, rtt_ns))
+        self.refreshes += 1
+        return True
+
+    def best_sample(self) -> UpstreamSample:
+        """
+        :return: the fresh sample with the lowest round trip time, None if there is no fresh sample.
+        """
+        oldest = self.clock() - int(self.max_age_sec * 1e9)
+        with self._lock:
+            fresh = [sample for sample in self._samples if sample.local_ns >= oldest]
+        return min(fresh, key=lambda sample: sample.rtt_ns, default=None)
+
+    def response(self, request: bytes = None) -> RawNTP:
+        """
+        Synthesizes a server answer without waiting for the upstream server, as long as the background refresh is
+        running (see start). Otherwise, if there is no fresh sample, the upstream server is queried synchronously, but
+        at most once per retry_interval_sec.
+        :param request: the request to answer in its wire format, its transmit timestamp becomes the origin
+        timestamp of the answer.
+        :return: the answer or None in case there is no fresh sample.
+        """
+        sample = self.best_sample()
+        if sample is None and self._may_query_inline():
+            self.refresh()
+            sample = self.best_sample()
+        if sample is None:
+            return None
+        elapsed_ns = self.clock() - sample.local_ns
+        answer = RawNTP.from_bytes(sample.response)
+        now = _advance(answer.get_field_int(NTPField.TRANSMIT_TIMESTAMP), elapsed_ns)
+        answer.set_field_int(NTPMode.SERVER.value, NTPField.MODE)
+        answer.set_field_int(now, NTPField.RECEIVE_TIMESTAMP)
+        answer.set_field_int(now, NTPField.TRANSMIT_TIMESTAMP)
+        origin = RawNTP.from_bytes(request).get_field_int(NTPField.TRANSMIT_TIMESTAMP) if request is not None else 0
+        answer.set_field_int(origin, NTPField.ORIGIN_TIMESTAMP)
+        return answer
+
+    def _may_query_inline(self) -> bool:
+        if self._refresh_thread is not None:
+            return False
+        with self._lock:
+            now = self.clock()
+            if self._last_query_ns is not None and now - self._last_query_ns < self.retry_interval_sec * 1e9:
+                return False
+            self._last_query_ns = now  # Concurrent requests do not query as well.
+            return True
+
+    def start(self):
+        """
+        Queries the upstream server once and starts the background refresh. Does nothing if already running.
+        """
+        if self._refresh_thread is not None:
+            return
+        self._stop_event.clear()
+        succeeded = self.refresh()
+        self._refresh_thread = Thread(target=self._refresh_loop, args=(succeeded,), name='UpstreamTimeSource-refresh',
+                                      daemon=True)
+        self._refresh_thread.start()
+
+    def stop(self):
+        if self._refresh_thread is None:
+            return
+        self._stop_event.set()
+        self._refresh_thread.join()
+        self._refresh_thread = None
+
+    def _refresh_loop(self, succeeded: bool):
+        # Without a fresh sample no request is answered, so a failed query is retried sooner.
+        while not self._stop_event.wait(self.refresh_interval_sec if succeeded
+                                        else min(self.retry_interval_sec, self.refresh_interval_sec)):
+            try:
+                succeeded = self.refresh()
+            except Exception as e:
+                self.log.exception('Refreshing the upstream sample failed: ' + repr(e))
+                succeeded = False
+
+
+def _advance(ntp_timestamp: int, elapsed_ns: int) -> int:
+    # Adds a duration to a 64 bit NTP timestamp (32 bit seconds, 32 bit fraction).
+    return (ntp_timestamp + (elapsed_ns << 32) // 1000000000) & 0xFFFFFFFFFFFFFFFF
@@ -1,46 +1,30 @@
 import ntplib
-from scapy.all import rdpcap
-from scapy.layers.ntp import NTP
+import numpy as np
 from datetime import datetime
 
-from ntp_raw import RawNTP
-from ntp_utils import extract_64timestamp_fraction
+from ntp_raw import NTPField
+from ntp_raw_batch import RawNTPBatch
 
 
 def difference_detector():
     file_path = '/home/shroud/workbench/MasterThesis/results/operating_system_default/2020_08_19_NTPd_2_Filtered.pcap'
-    packets = rdpcap(file_path)
-    ntp_packets = []
-    x = 0
-    counter = 0
-    for packet in packets:
-        counter += 1
-        ntp_pck = packet[NTP]
-        ntp_pck_raw = RawNTP(ntp_pck)
-        if (ntp_pck_raw.transmit_timestamp()[0:32] != ntp_pck_raw.receive_timestamp()[0:32]) \
-                or (ntp_pck_raw.origin_timestamp()[0:32] != ntp_pck_raw.receive_timestamp()[0:32]):
-            x += 1
-            print("Packet with differences detected, nr.: " + str(counter))
-        ntp_packets.append(ntp_pck)
-    print("Total amount of differences: " + str(x))
+    batch = RawNTPBatch.from_pcap(file_path)
+    transmit_seconds = batch.get_field(NTPField.TRANSMIT_TIMESTAMP) >> 32
+    receive_seconds = batch.get_field(NTPField.RECEIVE_TIMESTAMP) >> 32
+    origin_seconds = batch.get_field(NTPField.ORIGIN_TIMESTAMP) >> 32
+    differences = (transmit_seconds != receive_seconds) | (origin_seconds != receive_seconds)
+    for frame_number in batch.frame_numbers()[differences]:
+        print("Packet with differences detected, nr.: " + str(frame_number))
+    print("Total amount of differences: " + str(np.count_nonzero(differences)))
 
 
 def read_transmit_values_raw(file_path):
-    packets = rdpcap(file_path)
-    bin_values = []
-    for packet in packets:
-        ntp_pck = packet[NTP]
-        ntp_pck_raw = RawNTP(ntp_pck)
-        bin_values.append(ntp_pck_raw.transmit_timestamp()[32:64])
-    return bin_values
+    batch = RawNTPBatch.from_pcap(file_path)
+    fractions = batch.get_field(NTPField.TRANSMIT_TIMESTAMP) & 0xFFFFFFFF
+    return [format(value, '032b') for value in fractions.tolist()]
 
 
 def read_transmit_values(file_path):
-    packets = rdpcap(file_path)
-    values = []
-    for packet in packets:
-        ntp_pck = packet[NTP]
-        raw_ntp = RawNTP(ntp_pck)
-        trans_digits = extract_64timestamp_fraction(raw_ntp.transmit_timestamp())
-        values.append(trans_digits)
-    return values
+    batch = RawNTPBatch.from_pcap(file_path)
+    digits = batch.fraction_digits(NTPField.TRANSMIT_TIMESTAMP) + ord('0')
+    return [row.tobytes().decode() for row in digits]